@@ -0,0 +1,8 @@
+_base_ = ["./lss_roadseg_48x32_b4x8_resnet_adam_24e_default.py"]
+
+# fused lift-splat: the depth x context volume of the frustum is never
+# built, the depth and context features are pooled into the BEV grid in
+# chunks and the lifted features are recomputed in backward
+model = dict(
+    lss_cfg=dict(pooling='fused'),
+)
@@ -0,0 +1,41 @@
+_base_ = ["./seq_grow_graph_default.py"]
+
+# decoder-only training on precomputed BEV features, written by
+# tools/dump_bev_features.py with the frozen image branch of a trained model;
+# images are neither loaded nor passed through the backbone
+work_dir = "work_dirs/seq_grow_graph_bev_store"
+vis_dir = "seq_grow_graph_bev_store"
+
+train_store = "data/nuscenes/bev_store_train"
+val_store = "data/nuscenes/bev_store_val"
+
+meta_keys = (
+    "token",
+    "sample_idx",
+    "timestamp",
+    "lidar2ego",
+    "centerline_sequence",
+    "n_control",
+)
+
+train_pipeline = [
+    dict(type="LoadBEVFeatures", store_root=train_store, use_aug=True),
+    dict(type="Pack3DCenterlineInputs", keys=["bev_feats"], meta_keys=meta_keys),
+]
+
+test_pipeline = [
+    dict(
+        type="LoadNusOrderedBzCenterline",
+        grid_conf={{_base_.grid_conf}},
+        bz_grid_conf={{_base_.bz_grid_conf}},
+    ),
+    dict(type="TransformGraph2Seq", n_control=3, orderedDFS=True),
+    dict(type="LoadBEVFeatures", store_root=val_store, use_aug=False),
+    dict(type="Pack3DCenterlineInputs", keys=["bev_feats"], meta_keys=meta_keys),
+]
+
+model = dict(vis_dir=vis_dir, freeze_pretrain=True)
+
+train_dataloader = dict(dataset=dict(pipeline=train_pipeline))
+val_dataloader = dict(dataset=dict(pipeline=test_pipeline))
+test_dataloader = dict(dataset=dict(pipeline=test_pipeline))
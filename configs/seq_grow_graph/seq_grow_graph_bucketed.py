@@ -0,0 +1,18 @@
+_base_ = ["./seq_grow_graph_default.py"]
+
+# length bucketed batches: samples of similar target sequence length are
+# batched together, at most `max_tokens` padded tokens per batch; the lengths
+# come from tools/compute_seq_lengths.py
+work_dir = "work_dirs/seq_grow_graph_bucketed"
+vis_dir = "seq_grow_graph_bucketed"
+
+model = dict(vis_dir=vis_dir)
+
+train_dataloader = dict(
+    batch_sampler=dict(
+        type="LengthBucketBatchSampler",
+        length_file="data/nuscenes/nuscenes_centerline_seq_lengths_train.pkl",
+        num_buckets=10,
+        max_tokens=18 * 400,
+    ),
+)
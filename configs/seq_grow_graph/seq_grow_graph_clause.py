@@ -0,0 +1,18 @@
+_base_ = ["./seq_grow_graph_default.py"]
+
+# predict one clause (node x/y/idx, edge idx + coefficients or a separator)
+# per decoding step instead of one token
+work_dir = "work_dirs/seq_grow_graph_clause"
+vis_dir = "seq_grow_graph_clause"
+
+model = dict(
+    vis_dir=vis_dir,
+    pts_bbox_head=dict(
+        type="ARRNTRClauseHead",
+        n_control=3,  # same n_control as TransformGraph2Seq
+        # clauses, not tokens: about 0.52 per token, the token budget of the
+        # default config (700) bounds it
+        max_center_len=700,
+        grammar_cfg=None,
+    ),
+)
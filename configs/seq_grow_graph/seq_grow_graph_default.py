@@ -108,6 +108,8 @@ model = dict(
         num_classes=10,
         in_channels=transformer_dims,
         max_center_len=700,  # >=660+2
+        use_cache=True,
+        grammar_cfg=None,
         num_center_classes=num_center_classes,
         embed_dims=transformer_dims,
         num_query=900,
@@ -133,12 +135,14 @@ model = dict(
                             embed_dims=transformer_dims,
                             num_heads=transformer_dims // head_dims,
                             dropout=0.1,
+                            memory_efficient=True,
                         ),
                         dict(
                             type="RNTR2MultiheadAttention",
                             embed_dims=transformer_dims,
                             num_heads=transformer_dims // head_dims,
                             dropout=0.1,
+                            memory_efficient=True,
                         ),
                     ],
                     ffn_cfgs=dict(
@@ -203,6 +207,9 @@ dataset_type = "CenterlineNuScenesDataset"
 
 
 backend_args = None
+# unaugmented target sequences, see tools/create_gt_seq_cache.py; samples
+# missing from the cache are serialized as usual
+gt_seq_cache = data_root + "gt_seq_cache"
 
 db_sampler = dict(
     data_root=data_root,
@@ -219,6 +226,7 @@ train_pipeline = [
         type="LoadNusOrderedBzCenterline",
         grid_conf=grid_conf,
         bz_grid_conf=bz_grid_conf,
+        lazy=True,
     ),
     dict(type="CenterlineFlip", prob=0.5),
     dict(
@@ -227,7 +235,7 @@ train_pipeline = [
         max_rotate_degree=22.5,
         scaling_ratio_range=(0.95, 1.05),
     ),
-    dict(type="TransformGraph2Seq", n_control=3, orderedDFS=True),
+    dict(type="TransformGraph2Seq", n_control=3, orderedDFS=True, cache_dir=gt_seq_cache, cache_split="train"),
     dict(
         type="Pack3DDetInputs",
         keys=["img"],
@@ -267,8 +275,9 @@ test_pipeline = [
         type="LoadNusOrderedBzCenterline",
         grid_conf=grid_conf,
         bz_grid_conf=bz_grid_conf,
+        lazy=True,
     ),
-    dict(type="TransformGraph2Seq", n_control=3, orderedDFS=True),
+    dict(type="TransformGraph2Seq", n_control=3, orderedDFS=True, cache_dir=gt_seq_cache, cache_split="val"),
     dict(
         type="Pack3DDetInputs",
         keys=["img"],
@@ -0,0 +1,11 @@
+_base_ = ["./seq_grow_graph_default.py"]
+
+# sparse lift-splat at test time: only the `depth_topk` most likely depth
+# bins of every image feature pixel are splatted into the BEV grid
+work_dir = "work_dirs/seq_grow_graph_depth_topk"
+vis_dir = "seq_grow_graph_depth_topk"
+
+model = dict(
+    vis_dir=vis_dir,
+    lss_cfg=dict(pooling='interval', depth_topk=8),
+)
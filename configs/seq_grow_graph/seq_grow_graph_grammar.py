@@ -0,0 +1,14 @@
+_base_ = ["./seq_grow_graph_default.py"]
+
+# grammar-constrained decoding: every step only considers the token class
+# the sequence grammar expects next, scores become the probability among
+# the allowed tokens
+work_dir = "work_dirs/seq_grow_graph_grammar"
+vis_dir = "seq_grow_graph_grammar"
+
+model = dict(
+    vis_dir=vis_dir,
+    pts_bbox_head=dict(
+        grammar_cfg=dict(n_control=3),  # same n_control as TransformGraph2Seq
+    ),
+)
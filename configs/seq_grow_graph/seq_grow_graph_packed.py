@@ -0,0 +1,11 @@
+_base_ = ["./seq_grow_graph_default.py"]
+
+# sequence packing: the target sequences of a batch are packed into rows of
+# about `pack_len` tokens instead of all being padded to the longest one
+work_dir = "work_dirs/seq_grow_graph_packed"
+vis_dir = "seq_grow_graph_packed"
+
+model = dict(
+    vis_dir=vis_dir,
+    pack_len=1024,
+)
@@ -0,0 +1,22 @@
+_base_ = ["./seq_grow_graph_default.py"]
+
+# images are decoded by libjpeg at 1/4 of 1600x900, just above the resize of
+# ResizeCropFlipImage to final_dim, instead of at full resolution
+work_dir = "work_dirs/seq_grow_graph_reduced_decode"
+
+train_pipeline = _base_.train_pipeline
+train_pipeline[0] = dict(
+    type="ReducedLoadMultiViewImageFromFiles",
+    data_aug_conf=_base_.ida_aug_conf,
+    training=True,
+)
+test_pipeline = _base_.test_pipeline
+test_pipeline[0] = dict(
+    type="ReducedLoadMultiViewImageFromFiles",
+    data_aug_conf=_base_.ida_aug_conf,
+    training=False,
+)
+
+train_dataloader = dict(dataset=dict(pipeline=train_pipeline))
+val_dataloader = dict(dataset=dict(pipeline=test_pipeline))
+test_dataloader = dict(dataset=dict(pipeline=test_pipeline))
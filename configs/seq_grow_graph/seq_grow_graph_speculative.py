@@ -0,0 +1,62 @@
+_base_ = ["./seq_grow_graph_default.py"]
+
+# speculative decoding: a 2-layer draft decoder proposes tokens that the
+# 6-layer decoder verifies in one step; the draft is trained alongside the
+# main model (loss_draft) on detached inputs
+work_dir = "work_dirs/seq_grow_graph_speculative"
+vis_dir = "seq_grow_graph_speculative"
+
+transformer_dims = 256
+head_dims = 32
+draft_layers = 2
+
+model = dict(
+    vis_dir=vis_dir,
+    pts_bbox_head=dict(
+        num_draft_tokens=4,
+        draft_transformer=dict(
+            type="LssSeqLineTransformer",
+            decoder=dict(
+                type="PETRTransformerLineDecoder",
+                return_intermediate=True,
+                num_layers=draft_layers,
+                transformerlayers=dict(
+                    type="PETRLineTransformerDecoderLayer",
+                    attn_cfgs=[
+                        dict(
+                            type="RNTR2MultiheadAttention",
+                            embed_dims=transformer_dims,
+                            num_heads=transformer_dims // head_dims,
+                            dropout=0.1,
+                            memory_efficient=True,
+                        ),
+                        dict(
+                            type="RNTR2MultiheadAttention",
+                            embed_dims=transformer_dims,
+                            num_heads=transformer_dims // head_dims,
+                            dropout=0.1,
+                            memory_efficient=True,
+                        ),
+                    ],
+                    ffn_cfgs=dict(
+                        type="FFN",
+                        embed_dims=transformer_dims,
+                        feedforward_channels=transformer_dims * 4,
+                        num_fcs=2,
+                        ffn_drop=0.1,
+                        act_cfg=dict(type="ReLU", inplace=True),
+                    ),
+                    with_cp=False,
+                    operation_order=(
+                        "self_attn",
+                        "norm",
+                        "cross_attn",
+                        "norm",
+                        "ffn",
+                        "norm",
+                    ),
+                ),
+            ),
+        ),
+    ),
+)
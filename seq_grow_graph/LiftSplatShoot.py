@@ -1,7 +1,10 @@
+import hashlib
+import math
+from collections import OrderedDict
+
 import torch
 import torch.nn as nn
 import numpy as np
-import math
 import torch.nn.functional as F
 from mmcv.cnn import build_conv_layer
 from mmengine.model import BaseModule
@@ -240,6 +243,158 @@ class QuickCumsum(torch.autograd.Function):
         return val, None, None
 
 
+def calib_key(img2egos):
+    """Key of the geometry of a batch, a hash of its image to ego matrices,
+    which compose intrinsics, extrinsics and image and BEV augmentation."""
+    img2egos = np.ascontiguousarray(img2egos, dtype=np.float64)
+    return (img2egos.shape, hashlib.sha1(img2egos.tobytes()).hexdigest())
+
+
+def voxel_pooling_plan(geom_feats, dx, bx, nx):
+    """Voxel indices of frustum points and their order for pooling, which
+    only depend on the geometry.
+    Args:
+        geom_feats (torch.Tensor): ego coordinates [B, N, D, H, W, 3].
+        dx, bx, nx (torch.Tensor): voxel size, first voxel center and
+            number of voxels, see :func:`gen_dx_bx`.
+    Returns:
+        dict: `indices` of the points kept in the grid into the flattened
+            frustum, sorted by voxel, their voxel `ranks` and `geom_feats`,
+            the (x, y, z, batch) voxel coordinates, and the `pixels` of
+            the points into the flattened B*N x H x W feature maps. The
+            runs of points of every occupied voxel are given by
+            `interval_starts`, `interval_lengths`, `interval_ids` (the run
+            of every point) and `interval_coors` (the voxel of every run).
+    """
+    B = geom_feats.shape[0]
+    D, H, W = geom_feats.shape[2:5]
+    Nprime = geom_feats[..., 0].numel()
+    geom_feats = ((geom_feats - (bx - dx / 2.)) / dx).long()
+    geom_feats = geom_feats.view(Nprime, 3)
+    batch_ix = torch.arange(B, device=geom_feats.device).repeat_interleave(Nprime // B)
+    geom_feats = torch.cat((geom_feats, batch_ix[:, None]), 1)
+
+    # filter out points that are outside box
+    kept = (geom_feats[:, 0] >= 0) & (geom_feats[:, 0] < nx[0]) \
+           & (geom_feats[:, 1] >= 0) & (geom_feats[:, 1] < nx[1]) \
+           & (geom_feats[:, 2] >= 0) & (geom_feats[:, 2] < nx[2])
+    indices = kept.nonzero()[:, 0]
+    geom_feats = geom_feats[indices]
+
+    # get tensors from the same voxel next to each other
+    ranks = geom_feats[:, 0] * (nx[1] * nx[2] * B) \
+            + geom_feats[:, 1] * (nx[2] * B) \
+            + geom_feats[:, 2] * B \
+            + geom_feats[:, 3]
+    sorts = ranks.argsort()
+    indices, ranks, geom_feats = indices[sorts], ranks[sorts], geom_feats[sorts]
+
+    # runs of equal ranks, one per occupied voxel
+    _, lengths = torch.unique_consecutive(ranks, return_counts=True)
+    starts = lengths.cumsum(0) - lengths
+    interval_ids = torch.arange(len(lengths), device=ranks.device).repeat_interleave(lengths)
+    pixels = indices // (D * H * W) * (H * W) + indices % (H * W)
+    return dict(indices=indices, ranks=ranks, geom_feats=geom_feats, pixels=pixels,
+                interval_starts=starts, interval_lengths=lengths,
+                interval_ids=interval_ids, interval_coors=geom_feats[starts])
+
+
+def interval_pooling(depth, context, plan):
+    """Sum of the lifted features of every occupied voxel, a segmented
+    reduction over the intervals of `plan` instead of a cumsum.
+
+    The features of the points in the grid are gathered lazily as
+    depth[point] * context[pixel], so the depth x context volume of the
+    whole frustum is never built.
+    Args:
+        depth (torch.Tensor): depth distributions [B*N, D, H, W].
+        context (torch.Tensor): context features [B*N, C, H, W].
+        plan (dict): see :func:`voxel_pooling_plan`.
+    Returns:
+        tuple[torch.Tensor]: features [M, C] and voxel coordinates [M, 4]
+            of the M occupied voxels.
+    """
+    C = context.shape[1]
+    context = context.permute(0, 2, 3, 1).reshape(-1, C)
+    x = depth.reshape(-1)[plan['indices']].unsqueeze(1) * context[plan['pixels']]
+    coors = plan['interval_coors']
+    x = x.new_zeros((len(coors), C)).index_add_(0, plan['interval_ids'], x)
+    return x, coors
+
+
+class FusedLiftSplat(torch.autograd.Function):
+    """Interval pooling of depth[point] * context[pixel] in chunks of
+    points, neither the lifted volume nor the lifted features of all points
+    are built in forward or saved for backward."""
+
+    @staticmethod
+    def forward(ctx, depth, context, indices, pixels, interval_ids, num_intervals, chunk_size):
+        C = context.shape[1]
+        depth_flat = depth.reshape(-1)
+        context_flat = context.permute(0, 2, 3, 1).reshape(-1, C)
+        x = context_flat.new_zeros((num_intervals, C), dtype=torch.promote_types(depth.dtype, context.dtype))
+        for start in range(0, len(indices), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            x.index_add_(0, interval_ids[chunk],
+                         depth_flat[indices[chunk]].unsqueeze(1) * context_flat[pixels[chunk]])
+        ctx.save_for_backward(depth, context, indices, pixels, interval_ids)
+        ctx.chunk_size = chunk_size
+        return x
+
+    @staticmethod
+    def backward(ctx, gradx):
+        depth, context, indices, pixels, interval_ids = ctx.saved_tensors
+        BN, C, H, W = context.shape
+        depth_flat = depth.reshape(-1)
+        context_flat = context.permute(0, 2, 3, 1).reshape(-1, C)
+        grad_depth = torch.zeros_like(depth_flat, dtype=gradx.dtype)
+        grad_context = gradx.new_zeros(context_flat.shape)
+        for start in range(0, len(indices), ctx.chunk_size):
+            chunk = slice(start, start + ctx.chunk_size)
+            grad = gradx[interval_ids[chunk]]
+            # every frustum point is lifted once
+            grad_depth[indices[chunk]] = (grad * context_flat[pixels[chunk]]).sum(1)
+            grad_context.index_add_(0, pixels[chunk], grad * depth_flat[indices[chunk]].unsqueeze(1))
+        grad_depth = grad_depth.view_as(depth).to(depth.dtype)
+        grad_context = grad_context.view(BN, H, W, C).permute(0, 3, 1, 2).to(context.dtype)
+        return grad_depth, grad_context, None, None, None, None, None
+
+
+def sparse_depth_plan(depth, plan, topk=None, threshold=None):
+    """Plan restricted to the points of the `topk` most likely depth bins
+    of every pixel and / or of the bins of probability at least
+    `threshold`, the other points being dropped from the pooling. The
+    probabilities are not renormalised. The intervals are kept, voxels
+    without points left pool to zero.
+    Args:
+        depth (torch.Tensor): depth distributions [B*N, D, H, W].
+        plan (dict): see :func:`voxel_pooling_plan`.
+        topk (int, optional): number of depth bins kept per pixel.
+        threshold (float, optional): smallest depth probability kept.
+    Returns:
+        dict: plan of the kept points.
+    """
+    keep = torch.ones_like(depth, dtype=torch.bool)
+    if topk is not None and topk < depth.shape[1]:
+        keep = torch.zeros_like(keep).scatter_(1, depth.topk(topk, dim=1).indices, True)
+    if threshold is not None:
+        keep &= depth >= threshold
+    kept = keep.reshape(-1)[plan['indices']].nonzero()[:, 0]
+    sparse_plan = dict(plan)
+    for key in ('indices', 'pixels', 'interval_ids'):
+        sparse_plan[key] = plan[key][kept]
+    return sparse_plan
+
+
+def fused_lift_splat(depth, context, plan, chunk_size=65536):
+    """:func:`interval_pooling` with bounded memory: the lifted features are
+    built for `chunk_size` points at a time and recomputed in backward."""
+    coors = plan['interval_coors']
+    x = FusedLiftSplat.apply(depth, context, plan['indices'], plan['pixels'],
+                             plan['interval_ids'], len(coors), chunk_size)
+    return x, coors
+
+
 class CamEncode(BaseModule):
     def __init__(self, depth, d_in=256, d_out=256):
         super(CamEncode, self).__init__()
@@ -255,11 +410,17 @@ class CamEncode(BaseModule):
     def get_depth_dist(self, x, eps=1e-20):
         return x.softmax(dim=1)
 
-    def get_depth_feat(self, x):
-        # Depth
+    def get_depth_context(self, x):
+        """Depth distribution and context features, before their outer
+        product."""
         x = self.depthnet(x)
         depth = self.get_depth_dist(x[:, :self.depth])
-        new_x = depth.unsqueeze(1) * x[:, self.depth:(self.depth + self.d_out)].unsqueeze(2)
+        return depth, x[:, self.depth:(self.depth + self.d_out)]
+
+    def get_depth_feat(self, x):
+        # Depth
+        depth, context = self.get_depth_context(x)
+        new_x = depth.unsqueeze(1) * context.unsqueeze(2)
         return depth, new_x
 
     def forward(self, x):
@@ -788,7 +949,8 @@ class LiftSplatShootEgoMono(BaseModule):
 
 
 class LiftSplatShootEgo(BaseModule):
-    def __init__(self, grid_conf, data_aug_conf, downsample, d_in, d_out, return_bev=False):
+    def __init__(self, grid_conf, data_aug_conf, downsample, d_in, d_out, return_bev=False,
+                 geometry_cache_size=8, pooling='cumsum', depth_topk=None, depth_threshold=None):
         super(LiftSplatShootEgo, self).__init__()
         self.grid_conf = grid_conf
         self.data_aug_conf = data_aug_conf
@@ -809,9 +971,29 @@ class LiftSplatShootEgo(BaseModule):
 
         # toggle using QuickCumsum vs. autograd
         self.use_quickcumsum = True
+        # 'cumsum' pools the lifted volume with a cumsum over the sorted
+        # points, 'interval' reduces the intervals of every voxel from the
+        # depth and context features, see interval_pooling, and 'fused' does
+        # so in chunks without keeping the lifted features for backward,
+        # see fused_lift_splat
+        assert pooling in ('cumsum', 'interval', 'fused'), pooling
+        self.pooling = pooling
+        # inference only: splat the depth_topk most likely depth bins of a
+        # pixel and / or those above depth_threshold, see sparse_depth_plan.
+        # The kept bins keep their dense probabilities, so the BEV features
+        # are the dense ones minus the share of the dropped bins. The
+        # cumsum engine pools the sparse points with interval_pooling, so
+        # keeping every bin matches its dense output only up to float
+        # rounding; the interval and fused engines match exactly
+        self.depth_topk = depth_topk
+        self.depth_threshold = depth_threshold
         self.return_bev = return_bev
         self.pc_range = torch.cat((self.bx - self.dx / 2., self.bx - self.dx / 2. + self.nx * self.dx))
         self.bevencode = BevEncode(inC=d_out, outC=d_out)
+        # voxel pooling plans of the last calibrations seen in eval mode,
+        # by calib_key; 0 disables the cache
+        self.geometry_cache_size = geometry_cache_size
+        self.geometry_cache = OrderedDict()
         # if return_bev:
         #     self.bevencode = BevEncode(inC=1280, outC=self.d_out)
         # else:
@@ -830,45 +1012,52 @@ class LiftSplatShootEgo(BaseModule):
         frustum = torch.stack((xs, ys, ds), -1)
         return nn.Parameter(frustum, requires_grad=False)  # 这里的H和W实际上是原图中的H和W
 
-    def get_geometry(self, img_metas):
+    def get_img2egos(self, img_metas):
+        """Image to ego matrices of every camera, B x N x 4 x 4."""
+        lidar2imgs = np.asarray([img_meta['lidar2img'] for img_meta in img_metas])
+        lidar2egos = np.asarray([img_meta['lidar2ego'] for img_meta in img_metas])
+        return lidar2egos[:, None] @ np.linalg.inv(lidar2imgs)
+
+    def get_geometry(self, img_metas, img2egos=None):
         """Determine the (x,y,z) locations (in the ego frame)
         of the points in the point cloud.
         Returns B x N x D x H/downsample x W/downsample x 3
         """
         frustum = self.frustum + 0
-
-        # cam_intrinsic = []
-        # lidar2cam = []
-        # for img_meta in img_metas:
-        #     # cam_intrinsic.append(img_meta['cam_intrinsic'])
-        #     cam_intrinsic.append(img_meta['intrinsics'])
-        #     lidar2cam.append(img_meta['extrinsics'])
-        
-        D, H, W, _ = frustum.shape
-        img2egos = []
-        for img_meta in img_metas:
-            img2ego = []
-            for i in range(len(img_meta['lidar2img'])):
-                img2ego.append(img_meta['lidar2ego'] @ np.linalg.inv(img_meta['lidar2img'][i]))
-            img2egos.append(np.asarray(img2ego))
-        img2egos = np.asarray(img2egos)
+        if img2egos is None:
+            img2egos = self.get_img2egos(img_metas)
         img2egos = frustum.new_tensor(img2egos) # (B, N, 4, 4)
         B, N = img2egos.shape[:2]
-        img2egos = img2egos.view(B, N, 1, 1, 1, 4, 4).repeat(1, 1, D, H, W, 1, 1)
 
-        # cam_intrinsic = np.asarray(cam_intrinsic)
-        # lidar2cam = np.asarray(lidar2cam)
-        # cam_intrinsic = frustum.new_tensor(cam_intrinsic)
-        # lidar2cam = frustum.new_tensor(lidar2cam)
-        # B, N = cam_intrinsic.shape[:2]
         frustum[..., 0:2] *= frustum[..., 2:3]
-        points = torch.cat((frustum[..., 0:2], frustum[..., 2:3], torch.ones_like(frustum[..., 0:1])), dim=-1)
-        points = points.repeat(B, N, 1, 1, 1, 1)
-        # points_cam = torch.inverse(cam_intrinsic).view(B, N, 1, 1, 1, 4, 4).matmul(points.unsqueeze(-1))
-        # points_lidar = torch.inverse(lidar2cam).view(B, N, 1, 1, 1, 4, 4).matmul(points_cam).squeeze(-1)[..., :-1]
-        points_ego = img2egos.matmul(points.unsqueeze(-1)).squeeze(-1)[..., :-1]
+        points = torch.cat((frustum, torch.ones_like(frustum[..., 0:1])), dim=-1)
+        # broadcast the matrices over the frustum instead of repeating them
+        points_ego = img2egos.view(B, N, 1, 1, 1, 4, 4).matmul(points.unsqueeze(-1)).squeeze(-1)[..., :-1]
         return points_ego
 
+    def get_voxel_plan(self, img_metas):
+        """Voxel pooling plan of a batch, see :func:`voxel_pooling_plan`.
+
+        In eval mode plans are cached by the calibration of the batch, so a
+        fixed rig with fixed test time augmentation computes its geometry,
+        ranks and sort order only once.
+        """
+        img2egos = self.get_img2egos(img_metas)
+        use_cache = not self.training and self.geometry_cache_size > 0
+        if use_cache:
+            key = (calib_key(img2egos), self.frustum.device)
+            plan = self.geometry_cache.get(key)
+            if plan is not None:
+                self.geometry_cache.move_to_end(key)
+                return plan
+        geom = self.get_geometry(img_metas, img2egos)
+        plan = voxel_pooling_plan(geom, self.dx, self.bx, self.nx)
+        if use_cache:
+            self.geometry_cache[key] = plan
+            while len(self.geometry_cache) > self.geometry_cache_size:
+                self.geometry_cache.popitem(last=False)
+        return plan
+
     def get_cam_feats(self, x):
         """Return B x N x D x H/downsample x W/downsample x C
         """
@@ -880,64 +1069,30 @@ class LiftSplatShootEgo(BaseModule):
         # B, N, depth, imH, imW, C
         return x
 
-    def voxel_pooling(self, geom_feats, x, img_metas):
-
+    def voxel_pooling(self, geom_feats, x, img_metas, plan=None):
+        """Sum the frustum features of every voxel into the BEV grid,
+        B x C*Z x Y x X. `plan` skips the geometry of `geom_feats`."""
         B, N, D, H, W, C = x.shape
         Nprime = B * N * D * H * W
-        # flatten x
-        x = x.reshape(Nprime, C)  # [43296, 256]
+        if plan is None:
+            plan = voxel_pooling_plan(geom_feats, self.dx, self.bx, self.nx)
 
-        # flatten indices
-        geom_feats = ((geom_feats - (self.bx - self.dx / 2.)) / self.dx).long()
-        geom_feats = geom_feats.view(Nprime, 3)
-        batch_ix = torch.cat([torch.full([Nprime // B, 1], ix,
-                                         device=x.device, dtype=torch.long) for ix in range(B)])
-        geom_feats = torch.cat((geom_feats, batch_ix), 1) # [43296, 4]
+        # flatten x, gather the points in the grid sorted by voxel
+        x = x.reshape(Nprime, C)[plan['indices']]
+        geom_feats, ranks = plan['geom_feats'], plan['ranks']
 
-        # filter out points that are outside box
-        kept = (geom_feats[:, 0] >= 0) & (geom_feats[:, 0] < self.nx[0]) \
-               & (geom_feats[:, 1] >= 0) & (geom_feats[:, 1] < self.nx[1]) \
-               & (geom_feats[:, 2] >= 0) & (geom_feats[:, 2] < self.nx[2])
-        #
-        # # BEV-sapce Data Augmentation
-        # geom_feats = geom_feats.view(B, -1, 3)
-        # # for i in range(B):
-        # #     img_meta = img_metas[i]
-        # #     for aug in img_meta['transformation_3d_flow']:
-        # #         geom_feats[i] = pts_aug(geom_feats[i], aug, img_meta)
-        # # flatten indices
-        # geom_feats = geom_feats.view(Nprime, 3)
-        # # if self.return_bev:
-        # #     coors = ((geom_feats - (self.bx - self.dx / 2.)) / self.dx).long()
-        # # batch_ix = torch.cat([torch.full([Nprime // B, 1], ix,
-        # #                                  device=x.device, dtype=torch.long) for ix in range(B)])
-        # # geom_feats = torch.cat((geom_feats, batch_ix), 1)
-        # # if self.return_bev:
-        # #     coors = torch.cat((coors, batch_ix), 1)
-        #
-        # # filter out points that are outside box
-        # kept = (geom_feats[:, 0] >= self.pc_range[0]) & (geom_feats[:, 0] < self.pc_range[3]) \
-        #        & (geom_feats[:, 1] >= self.pc_range[1]) & (geom_feats[:, 1] < self.pc_range[4]) \
-        #        & (geom_feats[:, 2] >= self.pc_range[2]) & (geom_feats[:, 2] < self.pc_range[5])
-        x = x[kept]  # ([43154, 256])
-        geom_feats = geom_feats[kept]  # ([43154, 4])
-
-        # if self.return_bev:
-            # get tensors from the same voxel next to each other
-        ranks = geom_feats[:, 0] * (self.nx[1] * self.nx[2] * B) \
-                + geom_feats[:, 1] * (self.nx[2] * B) \
-                + geom_feats[:, 2] * B \
-                + geom_feats[:, 3]
-        sorts = ranks.argsort()
-        x, geom_feats, ranks = x[sorts], geom_feats[sorts], ranks[sorts]
         # cumsum trick
         if not self.use_quickcumsum:
             x, coors = cumsum_trick(x, geom_feats, ranks)
         else:
             x, coors = QuickCumsum.apply(x, geom_feats, ranks)
+        return self.griddify(x, coors, B)
 
+    def griddify(self, x, coors, B):
+        """Scatter voxel features [M, C] at `coors` into the BEV grid."""
+        C = x.shape[1]
         # griddify (B x C x Z x X x Y)
-        final = torch.zeros((B, C, int(self.nx[2]), int(self.nx[1]), int(self.nx[0])), device=x.device)
+        final = x.new_zeros((B, C, int(self.nx[2]), int(self.nx[1]), int(self.nx[0])))
         # final[geom_feats[:, 3], :, geom_feats[:, 2], geom_feats[:, 0], geom_feats[:, 1]] = x
         final[coors[:, 3], :, coors[:, 2], coors[:, 1], coors[:, 0]] = x
 
@@ -946,7 +1101,7 @@ class LiftSplatShootEgo(BaseModule):
         return final
 
     def get_voxels(self, x, img_metas):  # x得是个两层特征图
-        geom = self.get_geometry(img_metas)  # B x N x D x H/downsample x W/downsample x 3
+        plan = self.get_voxel_plan(img_metas)
 
         # import cv2
         # import os
@@ -973,8 +1128,21 @@ class LiftSplatShootEgo(BaseModule):
         # cv2.imwrite(os.path.join(save_dir, f"geom.png"), img_draw)
         # import pdb;pdb.set_trace()
 
+        sparse_depth = not self.training and (
+            self.depth_topk is not None or self.depth_threshold is not None)
+        if self.pooling != 'cumsum' or sparse_depth:
+            B, N, C, imH, imW = x.shape
+            depth, context = self.camencode.get_depth_context(x.view(B * N, C, imH, imW))
+            if sparse_depth:
+                plan = sparse_depth_plan(depth, plan, self.depth_topk, self.depth_threshold)
+            if self.pooling == 'fused':
+                x, coors = fused_lift_splat(depth, context, plan)
+            else:
+                x, coors = interval_pooling(depth, context, plan)
+            return self.griddify(x, coors, B)
+
         x = self.get_cam_feats(x)  # B, N, depth, H/downsample x W/downsample, dim(channels)
-        x = self.voxel_pooling(geom, x, img_metas)
+        x = self.voxel_pooling(None, x, img_metas, plan=plan)
         return x
 
     def forward(self, x, img_metas):
@@ -4,6 +4,7 @@ from .centerline_nuscenes_dataset import CenterlineNuScenesDataset
 from .nms_free_coder import NMSFreeCoder
 from .hungarian_assigner_3d import HungarianAssigner3D
 from .ar_rntr_head import ARRNTRHead
+from .ar_rntr_clause_head import ARRNTRClauseHead
 from .resnet import ResNetV1c
 from .cp_fpn import CPFPN
 from .vovnetcp import VoVNetCP
@@ -26,10 +27,11 @@ from .data import nuscenes_converter_pon_centerline,nuscenes_converter_default_c
 from .nus_reach_metric import NuScenesReachMetric
 from .roadseg_iou_metric import RoadSegIouMetric
 from .centerline_av2_dataset import CenterlineAV2Dataset
+from .samplers import LengthBucketBatchSampler
 __all__ = [
     'AR_RNTR','SeqGrowGraph', 'AR_RNTR_SEG','RoadSeg', 'RoadSegHead',
     'CenterlineNuScenesDataset', 
-    'ARRNTRHead',
+    'ARRNTRHead', 'ARRNTRClauseHead',
     'NMSFreeCoder',
     'HungarianAssigner3D',
     'ResNetV1c', 'CPFPN', 'VoVNetCP', 
@@ -43,5 +45,5 @@ __all__ = [
     'PETRKeypointTransformer', 'PETRTransformer', 'PETRDNTransformer', 'PETRMultiheadAttention', 
     'PETRTransformerEncoder', 'PETRTransformerDecoder', 'RNTRMultiheadFlashAttention', 'LssSeqLineFlashTransformer', 
     'RNTRLineFlashTransformerDecoderLayer', 'RNTR2MultiheadAttention', 'AR_LG2Seq', 'ARLanegraph2seqHead', 
-    'nuscenes_converter_pon_centerline', 'NuScenesReachMetric'
+    'nuscenes_converter_pon_centerline', 'NuScenesReachMetric', 'LengthBucketBatchSampler'
 ]
\ No newline at end of file
@@ -0,0 +1,289 @@
+import torch
+import torch.nn as nn
+from mmdet3d.registry import MODELS
+
+from .ar_rntr_head import ARRNTRHead, MLP
+
+
+def seq2clauses(seq, n_control=3, idx_start=250, coeff_start=350, pad=575):
+    """Group a `TransformGraph2Seq` token sequence into fixed-width clauses.
+
+    A node becomes ``[x, y, idx]``, an edge ``[idx, coeff * num_coeff]`` and
+    every other token (split_connect, split_node, start, end) a clause of its
+    own. Clauses are right padded with `pad` to ``max(3, 1 + num_coeff)``.
+
+    Args:
+        seq (list[int]): Flat token sequence.
+    Returns:
+        list[list[int]]: The clauses.
+    """
+    num_coeff = 2 * (n_control - 2)
+    width = max(3, 1 + num_coeff)
+    clauses = []
+    i = 0
+    while i < len(seq):
+        token = seq[i]
+        if token < idx_start:
+            clause = list(seq[i:i + 3])
+        elif token < coeff_start:
+            clause = list(seq[i:i + 1 + num_coeff])
+        else:
+            clause = [token]
+        i += len(clause)
+        clauses.append(clause + [pad] * (width - len(clause)))
+    return clauses
+
+
+def clauses2seq(clauses, pad=575):
+    """Inverse of :func:`seq2clauses`."""
+    return [token for clause in clauses for token in clause if token != pad]
+
+
+@MODELS.register_module()
+class ARRNTRClauseHead(ARRNTRHead):
+    """`ARRNTRHead` that predicts a whole clause per decoding step.
+
+    Each step consumes and emits one fixed-width clause of
+    :func:`seq2clauses` (a node's x/y/idx, an edge's idx and coefficients,
+    or a single separator), which cuts the number of sequential decoder
+    steps by 2-3x. The tokens of a clause are embedded jointly and predicted
+    by parallel output heads; the first token decides the clause type and
+    the remaining slots are restricted to the matching token classes.
+
+    Args:
+        n_control (int): Number of Bezier control points, see
+            `TransformGraph2Seq`. Default: 3.
+    """
+    predict_clauses = True
+
+    def __init__(self,
+                 *args,
+                 n_control=3,
+                 idx_start=250,
+                 coeff_start=350,
+                 num_bz_coords=220,
+                 no_known=575,
+                 start=574,
+                 end=573,
+                 **kwargs):
+        super(ARRNTRClauseHead, self).__init__(*args, **kwargs)
+        self.n_control = n_control
+        self.num_coeff = 2 * (n_control - 2)
+        self.clause_width = max(3, 1 + self.num_coeff)
+        self.idx_start = idx_start
+        self.coeff_start = coeff_start
+        self.no_known = no_known
+        self.start = start
+        self.end = end
+        num_classes = self.vocab_embed.layers[-1].out_features
+
+        self.clause_proj = nn.Linear(self.embed_dims * self.clause_width,
+                                     self.embed_dims)
+        # slot 0 reuses `vocab_embed`
+        self.slot_embeds = nn.ModuleList([
+            MLP(self.embed_dims, self.embed_dims, num_classes, 3)
+            for _ in range(self.clause_width - 1)])
+
+        # allowed tokens of slots 1.. for node, edge and single-token clauses
+        slot_allowed = torch.zeros(3, self.clause_width - 1, num_classes,
+                                   dtype=torch.bool)
+        slot_allowed[0, 0, :idx_start] = True
+        slot_allowed[0, 1, idx_start:coeff_start] = True
+        slot_allowed[0, 2:, no_known] = True
+        # coefficients run up to coeff_start + num_bz_coords - 1 (569), which
+        # shares its id with split_lines, never emitted by TransformGraph2Seq
+        slot_allowed[1, :self.num_coeff, coeff_start:coeff_start + num_bz_coords] = True
+        slot_allowed[1, self.num_coeff:, no_known] = True
+        slot_allowed[2, :, no_known] = True
+        self.register_buffer('slot_allowed', slot_allowed, persistent=False)
+
+    def embed_clauses(self, clauses, position_ids=None):
+        """Embed clauses of shape [B, G, W] into [B, G, C]."""
+        bs, num_clauses, _ = clauses.shape
+        if position_ids is None:
+            position_ids = torch.arange(
+                num_clauses, dtype=torch.long, device=clauses.device)
+        embedding = self.embedding
+        words = embedding.word_embeddings(clauses.long())
+        words = self.clause_proj(words.flatten(2))
+        position_embeds = embedding.position_embeddings(
+            position_ids.expand(bs, num_clauses))
+        return embedding.LayerNorm(words + position_embeds)
+
+    def clause_logits(self, outs_dec):
+        """Logits of every clause slot, shape [..., W, num_classes]."""
+        logits = [self.vocab_embed(outs_dec)]
+        logits += [slot_embed(outs_dec) for slot_embed in self.slot_embeds]
+        return torch.stack(logits, dim=-2)
+
+    def predict_clause(self, outs_dec):
+        """Greedy clause choice from decoder outputs of shape [B, C].
+
+        Returns:
+            tuple[Tensor]: scores and tokens of the clause, each [B, W].
+        """
+        logits = self.clause_logits(outs_dec)
+        value, first = logits[:, 0].softmax(-1).max(-1)
+        clause_type = torch.full_like(first, 2)
+        clause_type[first < self.coeff_start] = 1
+        clause_type[first < self.idx_start] = 0
+        allowed = self.slot_allowed[clause_type]
+        rest = logits[:, 1:].masked_fill(~allowed, float('-inf'))
+        rest_value, rest = rest.softmax(-1).max(-1)
+        values = torch.cat([value[:, None], rest_value], dim=1)
+        return values, torch.cat([first[:, None], rest], dim=1)
+
+    def forward(self, mlvl_feats, input_seqs, img_metas):
+        """Forward function.
+        Args:
+            mlvl_feats (Tensor): BEV features with shape [B, C, H, W].
+            input_seqs (Tensor): Input clauses with shape [B, G, W] in
+                training, the prompt tokens with shape [B, L] at test time.
+        Returns:
+            Tensor | tuple[Tensor]: Clause logits with shape [nb_dec, B, G,
+                W, num_classes] in training, the flat generated sequences
+                and their scores at test time, as `ARRNTRHead.forward`.
+        """
+        if not self.training:
+            return self.forward_cached(mlvl_feats, input_seqs)
+
+        x = mlvl_feats
+        if self.in_channels != self.embed_dims:
+            x = self.bev_proj(x)
+        pos_embed = self.bev_position_encoding(x)
+        B, _, H, W = x.shape
+        masks = torch.zeros(B, H, W).bool().to(x.device)
+
+        tgt = self.embed_clauses(input_seqs)
+        query_embed = self.embedding.position_embeddings.weight
+        outs_dec, _ = self.transformer(tgt, x, masks, query_embed, pos_embed)
+        outs_dec = torch.nan_to_num(outs_dec)
+        return self.clause_logits(outs_dec)
+
+    def forward_cached(self, mlvl_feats, input_seqs):
+        """Greedy clause-by-clause decoding with a key/value cache.
+        The prompt tokens are grouped with :func:`seq2clauses`. Rows whose
+        clause starts with the end token leave the active batch.
+        Returns:
+            tuple[Tensor]: the generated flat sequences with the prompt,
+                padded with the end token, and their scores.
+        """
+        bs = input_seqs.shape[0]
+        max_clauses = self.embedding.position_embeddings.num_embeddings
+        clauses = input_seqs.new_full(
+            (bs, max_clauses, self.clause_width), self.no_known)
+        values = mlvl_feats.new_zeros(bs, max_clauses, self.clause_width)
+        num_steps = 0
+        for active, value, clause in self.iter_clauses(mlvl_feats, input_seqs):
+            clauses[active, num_steps] = clause
+            values[active, num_steps] = value.to(values.dtype)
+            num_steps += 1
+
+        # back to flat token sequences
+        clauses = clauses[:, :num_steps].flatten(1)
+        values = values[:, :num_steps].flatten(1)
+        keep = clauses != self.no_known
+        lengths = keep.sum(1)
+        max_len = int(lengths.max()) if bs > 0 else 0
+        out_seqs = input_seqs.new_full((bs, input_seqs.shape[1] + max_len),
+                                       self.end)
+        out_seqs[:, :input_seqs.shape[1]] = input_seqs
+        out_values = values.new_zeros(bs, max_len)
+        for bi in range(bs):
+            length = int(lengths[bi])
+            out_seqs[bi, input_seqs.shape[1]:input_seqs.shape[1] + length] = \
+                clauses[bi][keep[bi]]
+            out_values[bi, :length] = values[bi][keep[bi]]
+        return out_seqs, out_values
+
+    def iter_clauses(self, mlvl_feats, input_seqs):
+        """Decoding loop of :meth:`forward_cached` as a generator.
+        Yields:
+            tuple[Tensor]: batch indices of the active rows, and the scores
+                and tokens of their next clause, each of shape
+                [num_active, W].
+        """
+        device = input_seqs.device
+        prompt = [seq2clauses(seq, self.n_control, self.idx_start,
+                              self.coeff_start, self.no_known)
+                  for seq in input_seqs.tolist()]
+        new_clauses = input_seqs.new_tensor(prompt)
+        prompt_len = new_clauses.shape[1]
+        max_clauses = self.embedding.position_embeddings.num_embeddings
+
+        cache = self.init_cache(mlvl_feats)
+        active = torch.arange(input_seqs.shape[0], device=device)
+        num_steps = 0
+        while prompt_len + num_steps < max_clauses:
+            cur_len = prompt_len + num_steps
+            position_ids = torch.arange(
+                cur_len - new_clauses.shape[1], cur_len,
+                dtype=torch.long, device=device)
+            tgt = self.embed_clauses(new_clauses, position_ids)
+            query_embed = self.embedding.position_embeddings(position_ids)
+            outs_dec = self.transformer.forward_step(
+                tgt, query_embed.expand_as(tgt), cache)
+            outs_dec = torch.nan_to_num(outs_dec)[:, -1, :]
+            value, clause = self.predict_clause(outs_dec)
+            yield active, value, clause
+            new_clauses = clause[:, None]
+            num_steps += 1
+
+            finished = clause[:, 0] == self.end
+            if finished.any():
+                keep = (~finished).nonzero(as_tuple=True)[0]
+                if len(keep) == 0:
+                    break
+                active = active[keep]
+                new_clauses = new_clauses[keep]
+                cache = self.transformer.select_cache(cache, keep)
+
+    def iter_cached(self, mlvl_feats, input_seqs):
+        """Token by token view of :meth:`iter_clauses`, with the same
+        outputs as `ARRNTRHead.iter_cached`. Padding slots of a clause come
+        out as `no_known` tokens."""
+        for active, value, clause in self.iter_clauses(mlvl_feats, input_seqs):
+            for slot in range(self.clause_width):
+                yield active, value[:, slot:slot + 1], clause[:, slot:slot + 1]
+
+    def loss_by_seqs(self, bev_feats, gt_lines_sequences):
+        """Teacher-forced clause loss.
+        Args:
+            bev_feats (Tensor): BEV features with shape [B, C, H, W].
+            gt_lines_sequences (list[list[int]]): `centerline_sequence` of
+                `TransformGraph2Seq` for each sample.
+        Returns:
+            dict[str, Tensor]: A dictionary of loss components.
+        """
+        device = bev_feats.device
+        pad_clause = [self.no_known] * self.clause_width
+        clause_seqs = [
+            seq2clauses([self.start] + list(seq) + [self.end], self.n_control,
+                        self.idx_start, self.coeff_start, self.no_known)
+            for seq in gt_lines_sequences]
+        max_len = max(len(clauses) for clauses in clause_seqs)
+        num_positions = self.embedding.position_embeddings.num_embeddings
+        assert max_len <= num_positions, (
+            f'{max_len} clauses exceed max_center_len={num_positions}')
+        clause_seqs = torch.tensor(
+            [clauses + [pad_clause] * (max_len - len(clauses))
+             for clauses in clause_seqs], device=device)
+
+        x = bev_feats
+        if self.in_channels != self.embed_dims:
+            x = self.bev_proj(x)
+        pos_embed = self.bev_position_encoding(x)
+        B, _, H, W = x.shape
+        masks = torch.zeros(B, H, W).bool().to(x.device)
+        tgt = self.embed_clauses(clause_seqs)
+        query_embed = self.embedding.position_embeddings.weight
+        # last decoder layer only, output heads on real clauses only
+        outs_dec, _ = self.transformer(tgt, x, masks, query_embed, pos_embed,
+                                       return_intermediate=False)
+        targets = clause_seqs[:, 1:]
+        real = targets[..., 0] != self.no_known
+        outs_dec = torch.nan_to_num(outs_dec[-1, :, :-1][real])
+        outputs = self.clause_logits(outs_dec).flatten(0, 1)
+        targets = targets[real].flatten()
+        valid = targets != self.no_known
+        return self.loss_by_feat_seq(outputs[valid], targets[valid])
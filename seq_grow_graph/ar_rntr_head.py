@@ -20,6 +20,9 @@ import numpy as np
 import math
 from mmseg.models.losses import accuracy
 from mmseg.models.builder import build_loss
+from .seq_grammar import GraphSeqGrammar
+from .decode_engine import StaticDecodeEngine
+from .seq_packing import build_packed_batch
 
 
 def pos2posemb3d(pos, num_pos_feats=128, temperature=10000):
@@ -143,14 +146,15 @@ class PryDecoderEmbeddings(nn.Module):
         self.LayerNorm = torch.nn.LayerNorm(
             hidden_dim)
 
-    def forward(self, x):
+    def forward(self, x, position_ids=None):
         input_shape = x.size()
         seq_length = input_shape[1]
         device = x.device
 
-        position_ids = torch.arange(
-            seq_length, dtype=torch.long, device=device)
-        position_ids = position_ids.unsqueeze(0).expand(input_shape)
+        if position_ids is None:
+            position_ids = torch.arange(
+                seq_length, dtype=torch.long, device=device)
+        position_ids = position_ids.expand(input_shape)
 
         input_embeds = self.word_embeddings(x)
         position_embeds = self.position_embeddings(position_ids)
@@ -219,6 +223,14 @@ class ARRNTRHead(AnchorFreeHead):
             transformer head.
         init_cfg (dict or list[dict], optional): Initialization config dict.
             Default: None
+        use_cache (bool): Whether to decode incrementally at test time,
+            feeding only the newest token to the transformer and keeping
+            self-attention keys/values of the prefix in a cache.
+            Default: False.
+        grammar_cfg (dict, optional): Config of `GraphSeqGrammar`. If given,
+            cached decoding only lets each row pick tokens of the class its
+            grammar state expects, and only computes the logits of those
+            classes. Default: None.
     """
     _version = 2
 
@@ -272,6 +284,11 @@ class ARRNTRHead(AnchorFreeHead):
                  with_fpe=False,
                  with_time=False,
                  with_multi=False,
+                 use_cache=False,
+                 grammar_cfg=None,
+                 draft_transformer=None,
+                 num_draft_tokens=4,
+                 decode_engine=None,
                  **kwargs):
 
         self.num_query = num_query
@@ -292,6 +309,8 @@ class ARRNTRHead(AnchorFreeHead):
         self.with_position = with_position
         self.with_multiview = with_multiview
         self.max_iteration = max_center_len - 1
+        self.use_cache = use_cache
+        self.num_draft_tokens = num_draft_tokens
         assert 'num_feats' in positional_encoding
         num_feats = positional_encoding['num_feats']
         assert num_feats * 2 == self.embed_dims, 'embed_dims should' \
@@ -334,6 +353,20 @@ class ARRNTRHead(AnchorFreeHead):
             
         self.embedding = PryDecoderEmbeddings(num_center_classes, self.embed_dims, max_center_len)
         self.vocab_embed = MLP(self.embed_dims, self.embed_dims, num_center_classes, 3)
+        if grammar_cfg is not None:
+            self.grammar = GraphSeqGrammar(num_classes=num_center_classes, **grammar_cfg)
+        else:
+            self.grammar = None
+        if draft_transformer is not None:
+            # shallow decoder proposing tokens for speculative decoding
+            self.draft_transformer = MODELS.build(draft_transformer)
+            self.draft_vocab_embed = MLP(self.embed_dims, self.embed_dims, num_center_classes, 3)
+        else:
+            self.draft_transformer = None
+        if decode_engine is not None:
+            self.decode_engine = StaticDecodeEngine(self, **decode_engine)
+        else:
+            self.decode_engine = None
         self.bbox_coder = TASK_UTILS.build(bbox_coder)
         self.pc_range = self.bbox_coder.pc_range
         self._init_layers()
@@ -356,6 +389,8 @@ class ARRNTRHead(AnchorFreeHead):
         """Initialize weights of the transformer head."""
         # The initialization for transformer is important
         self.transformer.init_weights()
+        if self.draft_transformer is not None:
+            self.draft_transformer.init_weights()
 
     def position_embeding(self, img_feats, img_metas, masks=None):
         eps = 1e-5
@@ -438,6 +473,13 @@ class ARRNTRHead(AnchorFreeHead):
                 head with normalized coordinate format (cx, cy, w, l, cz, h, theta, vx, vy). \
                 Shape [nb_dec, bs, num_query, 9].
         """
+        if not self.training and self.use_cache:
+            if self.draft_transformer is not None:
+                return self.forward_speculative(mlvl_feats, input_seqs)
+            if self.decode_engine is not None:
+                return self.decode_engine.generate(mlvl_feats, input_seqs)
+            return self.forward_cached(mlvl_feats, input_seqs)
+
         x = mlvl_feats  # [1, 256, 200, 200]
         if self.in_channels != self.embed_dims:
             x = self.bev_proj(x)
@@ -476,6 +518,330 @@ class ARRNTRHead(AnchorFreeHead):
             values = torch.cat(values, dim=-1)
             return input_seqs, values
 
+    def init_cache(self, mlvl_feats, transformer=None):
+        """Build the decoding cache of a batch of BEV features.
+        Args:
+            mlvl_feats (Tensor): BEV features with shape [B, C, H, W].
+            transformer (LssSeqLineTransformer, optional): The decoder to
+                build the cache for. Default: `self.transformer`.
+        Returns:
+            list[dict]: Per-layer caches holding the projected BEV memory,
+                see `LssSeqLineTransformer.prepare_memory`.
+        """
+        if transformer is None:
+            transformer = self.transformer
+        x = mlvl_feats
+        if self.in_channels != self.embed_dims:
+            x = self.bev_proj(x)
+        pos_embed = self.bev_position_encoding(x)
+        B, _, H, W = x.shape
+        masks = torch.zeros(B, H, W).bool().to(x.device)
+        return transformer.prepare_memory(x, masks, pos_embed)
+
+    def decode_step(self, new_seqs, position_ids, cache, allowed=None,
+                    num_outputs=1, draft=False, position=None):
+        """Run the newly fed tokens through the decoder and pick the next
+        token greedily.
+        Args:
+            new_seqs (Tensor): Tokens not in `cache` yet, shape [B, T].
+            position_ids (Tensor): Their positions, shape [T] or [B, T].
+            cache (list[dict]): Updated in place.
+            allowed (Tensor, optional): Bool mask of the tokens each row may
+                pick, shape [B, num_center_classes], or
+                [B * num_outputs, num_center_classes].
+            num_outputs (int): Predict after each of the last `num_outputs`
+                tokens instead of the last one only. Default: 1.
+            draft (bool): Use the draft decoder. Default: False.
+            position (Tensor, optional): Write positions of the new tokens
+                in a preallocated cache, see
+                `LssSeqLineTransformer.forward_step`. Default: None.
+        Returns:
+            tuple[Tensor]: score and index of the next token, each with
+                shape [B, num_outputs].
+        """
+        transformer = self.draft_transformer if draft else self.transformer
+        vocab_embed = self.draft_vocab_embed if draft else self.vocab_embed
+        tgt = self.embedding(new_seqs.long(), position_ids)
+        query_embed = self.embedding.position_embeddings(position_ids)
+        query_embed = query_embed.expand_as(tgt)
+
+        outs_dec = transformer.forward_step(tgt, query_embed, cache, position)
+        outs_dec = torch.nan_to_num(outs_dec)[:, -num_outputs:, :]
+        value, extra_seq = self.predict_tokens(
+            outs_dec.flatten(0, 1), allowed, vocab_embed)
+        return (value.view(len(new_seqs), num_outputs),
+                extra_seq.view(len(new_seqs), num_outputs))
+
+    def predict_tokens(self, outs_dec, allowed=None, vocab_embed=None):
+        """Greedy token choice from decoder outputs.
+        With `allowed`, the last layer of `vocab_embed` is only evaluated
+        for the tokens allowed in at least one row, and the score is the
+        probability among the allowed tokens of the row.
+        Returns:
+            tuple[Tensor]: score and index of the next token, each with
+                shape [B, 1].
+        """
+        if vocab_embed is None:
+            vocab_embed = self.vocab_embed
+        if allowed is None:
+            out = vocab_embed(outs_dec)
+            out = out.softmax(-1)
+            return out.topk(dim=-1, k=1)
+
+        hidden = outs_dec
+        for layer in vocab_embed.layers[:-1]:
+            hidden = F.relu(layer(hidden))
+        last_layer = vocab_embed.layers[-1]
+        index = allowed.any(0).nonzero(as_tuple=True)[0]
+        out = F.linear(hidden, last_layer.weight[index], last_layer.bias[index])
+        out = out.masked_fill(~allowed[:, index], float('-inf'))
+        out = out.softmax(-1)
+        value, extra_seq = out.topk(dim=-1, k=1)
+        return value, index[extra_seq]
+
+    def loss_by_tokens(self, mlvl_feats, input_seqs, no_known=575,
+                       draft=False):
+        """Teacher-forced token loss computing only the logits it needs.
+        Compared with ``self(...)[-1]``, the decoder returns its last layer
+        only and `vocab_embed` runs on the non-padding positions only, whose
+        logits go straight into `loss_coords`.
+        Args:
+            mlvl_feats (Tensor): BEV features with shape [B, C, H, W].
+            input_seqs (Tensor): `start`, the target tokens and `end`,
+                padded with `no_known`, shape [B, L].
+            draft (bool): Train the draft decoder instead. Its inputs are
+                detached, so the main model is left unchanged.
+                Default: False.
+        Returns:
+            dict[str, Tensor]: A dictionary of loss components.
+        """
+        transformer = self.draft_transformer if draft else self.transformer
+        vocab_embed = self.draft_vocab_embed if draft else self.vocab_embed
+        x = mlvl_feats
+        if self.in_channels != self.embed_dims:
+            x = self.bev_proj(x)
+        pos_embed = self.bev_position_encoding(x)
+        B, _, H, W = x.shape
+        masks = torch.zeros(B, H, W).bool().to(x.device)
+        tgt = self.embedding(input_seqs.long())
+        query_embed = self.embedding.position_embeddings.weight
+        if draft:
+            x, tgt, query_embed = x.detach(), tgt.detach(), query_embed.detach()
+
+        outs_dec, _ = transformer(tgt, x, masks, query_embed, pos_embed,
+                                  return_intermediate=False)
+        targets = input_seqs[:, 1:]
+        valid = targets != no_known
+        outs_dec = torch.nan_to_num(outs_dec[-1, :, :-1][valid])
+        return self.loss_by_feat_seq(vocab_embed(outs_dec), targets[valid])
+
+    def loss_by_packed_tokens(self, mlvl_feats, seqs, pack_len, no_known=575,
+                              draft=False):
+        """:meth:`loss_by_tokens` on packed sequences. The sequences of the
+        batch are packed into rows of about `pack_len` tokens instead of
+        being padded to the longest one, see :func:`build_packed_batch`.
+        Self attention stays within a sequence and every token attends to
+        the BEV features of its own sample only, so the loss is the one of
+        :meth:`loss_by_tokens`.
+        Args:
+            mlvl_feats (Tensor): BEV features with shape [B, C, H, W].
+            seqs (list[list[int]]): `start`, the target tokens and `end` of
+                every sample.
+            pack_len (int): token budget of a packed row.
+            draft (bool): Train the draft decoder instead, as in
+                :meth:`loss_by_tokens`. Default: False.
+        Returns:
+            dict[str, Tensor]: A dictionary of loss components.
+        """
+        transformer = self.draft_transformer if draft else self.transformer
+        vocab_embed = self.draft_vocab_embed if draft else self.vocab_embed
+        x = mlvl_feats
+        if self.in_channels != self.embed_dims:
+            x = self.bev_proj(x)
+        pos_embed = self.bev_position_encoding(x)
+        B, _, H, W = x.shape
+        masks = torch.zeros(B, H, W).bool().to(x.device)
+        packed = build_packed_batch(seqs, pack_len, no_known, x.device)
+        tgt = self.embedding(packed['input_seqs'], packed['position_ids'])
+        query_embed = self.embedding.position_embeddings(packed['position_ids'])
+        if draft:
+            x, tgt, query_embed = x.detach(), tgt.detach(), query_embed.detach()
+
+        outs_dec, _ = transformer(tgt, x, masks, query_embed, pos_embed,
+                                  return_intermediate=False,
+                                  attn_mask=packed['attn_mask'],
+                                  memory_index=packed['memory_index'])
+        targets = packed['targets']
+        valid = targets != no_known
+        outs_dec = torch.nan_to_num(outs_dec[-1][valid])
+        return self.loss_by_feat_seq(vocab_embed(outs_dec), targets[valid])
+
+    def forward_cached(self, mlvl_feats, input_seqs):
+        """Greedy decoding with a key/value cache.
+        Produces the same tokens as the uncached loop in :meth:`forward`,
+        but after the prompt only the newest token goes through the
+        decoder, so each step is O(L) instead of O(L^2). The BEV memory is
+        projected for every cross attention once per frame.
+        Rows that emitted the end token (573) are dropped from the active
+        batch, so the per-step cost shrinks as sequences finish. Their
+        outputs are padded with 573 after the end token and the scores with
+        0. With a grammar, every row is restricted to the token class its
+        grammar state expects.
+        Returns:
+            tuple[Tensor]: the generated sequences with the prompt and
+                their scores, as in :meth:`forward`.
+        """
+        bs, prompt_len = input_seqs.shape
+        seqs = input_seqs.new_full((bs, prompt_len + self.max_iteration), 573)
+        seqs[:, :prompt_len] = input_seqs
+        values = mlvl_feats.new_zeros(bs, self.max_iteration)
+        i = 0
+        for active, value, extra_seq in self.iter_cached(mlvl_feats, input_seqs):
+            seqs[active, prompt_len + i] = extra_seq[:, 0].to(seqs.dtype)
+            values[active, i] = value[:, 0].to(values.dtype)
+            i += 1
+        return seqs[:, :prompt_len + i], values[:, :i]
+
+    def iter_cached(self, mlvl_feats, input_seqs):
+        """Decoding loop of :meth:`forward_cached` as a generator.
+        Yields:
+            tuple[Tensor]: batch indices of the active rows, and the score
+                and index of their next token, each of shape [num_active, 1].
+        """
+        bs, prompt_len = input_seqs.shape
+        cache = self.init_cache(mlvl_feats)
+        active = torch.arange(bs, device=input_seqs.device)
+        new_seqs = input_seqs
+        if self.grammar is not None:
+            state, count = self.grammar.init_state(input_seqs)
+        i = 0
+        while i < self.max_iteration:
+            cur_len = prompt_len + i
+            position_ids = torch.arange(
+                cur_len - new_seqs.shape[1], cur_len,
+                dtype=torch.long, device=input_seqs.device)
+            allowed = None
+            if self.grammar is not None:
+                allowed = self.grammar.allowed(state)
+            value, extra_seq = self.decode_step(
+                new_seqs, position_ids, cache, allowed)
+            yield active, value, extra_seq
+            new_seqs = extra_seq
+            if self.grammar is not None:
+                state, count = self.grammar.update(state, count, extra_seq[:, 0])
+            i += 1
+
+            finished = extra_seq[:, 0] == 573
+            if finished.any():
+                keep = (~finished).nonzero(as_tuple=True)[0]
+                if len(keep) == 0:
+                    break
+                active = active[keep]
+                new_seqs = new_seqs[keep]
+                cache = self.transformer.select_cache(cache, keep)
+                if self.grammar is not None:
+                    state, count = state[keep], count[keep]
+
+    def forward_speculative(self, mlvl_feats, input_seqs):
+        """Greedy decoding sped up by the draft decoder.
+        Every round the draft decoder proposes `num_draft_tokens` tokens one
+        by one, then the full decoder scores all of them in a single
+        `forward_step`. The longest prefix the full decoder agrees with is
+        kept together with its own prediction at the first mismatch, and
+        both key/value caches are rolled back to the kept tokens. All rows
+        advance by the prefix accepted for the whole batch, so the tokens
+        are those of :meth:`forward_cached` (up to floating point ties).
+        Returns:
+            tuple[Tensor]: the generated sequences with the prompt and
+                their scores, as in :meth:`forward`.
+        """
+        bs, prompt_len = input_seqs.shape
+        device = input_seqs.device
+        cache = self.init_cache(mlvl_feats)
+        draft_cache = self.init_cache(mlvl_feats, self.draft_transformer)
+        seqs = input_seqs.new_full((bs, prompt_len + self.max_iteration), 573)
+        seqs[:, :prompt_len] = input_seqs
+        values = mlvl_feats.new_zeros(bs, self.max_iteration)
+        active = torch.arange(bs, device=device)
+        # tokens of the active rows not in the full / draft cache yet
+        new_seqs = draft_seqs = input_seqs
+        if self.grammar is not None:
+            state, count = self.grammar.init_state(input_seqs)
+        i = 0
+        while i < self.max_iteration:
+            cur_len = prompt_len + i
+            num_draft = min(self.num_draft_tokens, self.max_iteration - i - 1)
+
+            drafts = []
+            states = [(state, count)] if self.grammar is not None else None
+            for j in range(num_draft):
+                position_ids = torch.arange(
+                    cur_len + j - draft_seqs.shape[1], cur_len + j,
+                    dtype=torch.long, device=device)
+                allowed = None
+                if self.grammar is not None:
+                    allowed = self.grammar.allowed(states[j][0])
+                _, draft_seqs = self.decode_step(
+                    draft_seqs, position_ids, draft_cache, allowed, draft=True)
+                drafts.append(draft_seqs)
+                if self.grammar is not None:
+                    states.append(self.grammar.update(*states[j], draft_seqs[:, 0]))
+            drafts = torch.cat(drafts, dim=1) if drafts \
+                else new_seqs.new_zeros(len(active), 0)
+
+            # the full decoder predicts after the pending token and every draft
+            verify_seqs = torch.cat([new_seqs, drafts.to(new_seqs.dtype)], dim=1)
+            position_ids = torch.arange(
+                cur_len - new_seqs.shape[1], cur_len + num_draft,
+                dtype=torch.long, device=device)
+            allowed = None
+            if self.grammar is not None:
+                allowed = torch.stack(
+                    [self.grammar.allowed(s) for s, _ in states], dim=1)
+                allowed = allowed.flatten(0, 1)
+            value, pred = self.decode_step(
+                verify_seqs, position_ids, cache, allowed, num_draft + 1)
+            matched = (drafts == pred[:, :num_draft]).long().cumprod(1).sum(1)
+            num_accept = int(matched.min()) if num_draft > 0 else 0
+
+            # accepted drafts equal the predictions, plus one corrected token
+            seqs[active, cur_len:cur_len + num_accept + 1] = \
+                pred[:, :num_accept + 1].to(seqs.dtype)
+            values[active, i:i + num_accept + 1] = \
+                value[:, :num_accept + 1].to(values.dtype)
+            new_seqs = pred[:, num_accept:num_accept + 1]
+            self.transformer.truncate_cache(cache, cur_len + num_accept)
+            draft_len = min(self.draft_transformer.cache_length(draft_cache),
+                            cur_len + num_accept)
+            self.draft_transformer.truncate_cache(draft_cache, draft_len)
+            draft_seqs = seqs[active, draft_len:cur_len + num_accept + 1]
+            if self.grammar is not None:
+                state, count = self.grammar.update(
+                    *states[num_accept], new_seqs[:, 0])
+            i += num_accept + 1
+
+            finished = (pred[:, :num_accept + 1] == 573).any(1)
+            if finished.any():
+                keep = (~finished).nonzero(as_tuple=True)[0]
+                if len(keep) == 0:
+                    break
+                active = active[keep]
+                new_seqs = new_seqs[keep]
+                draft_seqs = draft_seqs[keep]
+                cache = self.transformer.select_cache(cache, keep)
+                draft_cache = self.draft_transformer.select_cache(draft_cache, keep)
+                if self.grammar is not None:
+                    state, count = state[keep], count[keep]
+
+        # a round may run past the end token, pad as forward_cached does
+        gen_seqs, values = seqs[:, prompt_len:prompt_len + i], values[:, :i]
+        ended = (gen_seqs == 573).long().cumsum(1)
+        after_end = ended - (gen_seqs == 573).long() > 0
+        gen_seqs.masked_fill_(after_end, 573)
+        values.masked_fill_(after_end, 0)
+        if bs > 0:
+            i = min(i, int((ended == 0).sum(1).max()) + 1)
+        return seqs[:, :prompt_len + i], values[:, :i]
 
     def get_targets(self,
                     cls_scores_list,
@@ -0,0 +1,124 @@
+import glob
+import os
+import os.path as osp
+from collections import defaultdict
+
+import numpy as np
+from mmengine.fileio import dump, load
+
+NO_AUG = 'noaug'
+
+
+def store_key(token, variant=NO_AUG):
+    """Key of the features of sample `token` under augmentation `variant`,
+    an augmentation seed or `NO_AUG`."""
+    return f'{token}/{variant}'
+
+
+class BEVFeatureStoreWriter:
+    """Writes BEV features into fp16 shards of `shard_size` maps.
+
+    Every writer owns the shards and the index file of its `prefix`, so
+    several processes can fill the same store at once.
+    Args:
+        root (str): directory of the store.
+        shape (tuple[int]): shape of a BEV map, (C, H, W).
+        shard_size (int): BEV maps per shard file. Default: 1024.
+        prefix (str): name of the shards and index of this writer.
+            Default: '0'.
+    """
+
+    def __init__(self, root, shape, shard_size=1024, prefix='0'):
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.shape = tuple(shape)
+        self.shard_size = shard_size
+        self.prefix = prefix
+        self.entries = {}
+        self.metas = {}
+        self._shard = None
+        self._num_shards = 0
+        self._row = shard_size
+
+    def add(self, key, feat, meta=None):
+        """Append the BEV map `feat` [C, H, W] and its `meta` dict."""
+        if self._row == self.shard_size:
+            self._new_shard()
+        self._shard[self._row] = feat
+        self.entries[key] = (self._shard_file, self._row)
+        self.metas[key] = meta
+        self._row += 1
+
+    def _new_shard(self):
+        if self._shard is not None:
+            self._shard.flush()
+        self._shard_file = f'shard_{self.prefix}_{self._num_shards:05d}.npy'
+        self._shard = np.lib.format.open_memmap(
+            osp.join(self.root, self._shard_file), mode='w+',
+            dtype=np.float16, shape=(self.shard_size, ) + self.shape)
+        self._num_shards += 1
+        self._row = 0
+
+    def _truncate_shard(self):
+        shard_path = osp.join(self.root, self._shard_file)
+        tmp_path = shard_path + '.tmp.npy'
+        shard = np.lib.format.open_memmap(
+            tmp_path, mode='w+', dtype=np.float16,
+            shape=(self._row, ) + self.shape)
+        shard[:] = self._shard[:self._row]
+        shard.flush()
+        del shard
+        self._shard = None
+        os.replace(tmp_path, shard_path)
+
+    def close(self):
+        """Flush the last shard, cut to the rows written, and write the
+        index."""
+        if self._shard is not None:
+            self._shard.flush()
+            if self._row < self.shard_size:
+                self._truncate_shard()
+            self._shard = None
+        dump(dict(shape=self.shape, entries=self.entries, metas=self.metas),
+             osp.join(self.root, f'index_{self.prefix}.pkl'))
+
+
+class BEVFeatureStore:
+    """Read access to a store written by :class:`BEVFeatureStoreWriter`.
+
+    The shards are memory mapped on first use in every process, so the
+    store can be shared with dataloader workers.
+    Args:
+        root (str): directory of the store.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.entries = {}
+        self.metas = {}
+        self.shape = None
+        for index_file in sorted(glob.glob(osp.join(root, 'index_*.pkl'))):
+            index = load(index_file)
+            self.shape = tuple(index['shape'])
+            self.entries.update(index['entries'])
+            self.metas.update(index['metas'])
+        assert self.entries, f'no BEV features found in {root}'
+        self.variants = defaultdict(list)
+        for key in self.entries:
+            token, variant = key.rsplit('/', 1)
+            self.variants[token].append(variant)
+        self._shards = {}
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """Returns the fp16 BEV map [C, H, W] and the meta dict of `key`."""
+        shard_file, row = self.entries[key]
+        if shard_file not in self._shards:
+            self._shards[shard_file] = np.load(
+                osp.join(self.root, shard_file), mmap_mode='r')
+        return np.array(self._shards[shard_file][row]), self.metas[key]
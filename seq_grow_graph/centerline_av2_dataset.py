@@ -10,6 +10,8 @@ from mmdet3d.structures import LiDARInstance3DBoxes
 from mmengine.dataset import BaseDataset
 from mmengine.fileio import join_path, list_from_file, load
 
+from .core.centerline.ragged import num_centerline_points
+
 
 @DATASETS.register_module()
 class CenterlineAV2Dataset(BaseDataset):
@@ -286,5 +288,6 @@ class CenterlineAV2Dataset(BaseDataset):
 
         if 'center_lines' in info.keys():
             input_dict['center_lines'] = info['center_lines']
-            num_points=sum([len(i) for i in info['center_lines']["centerlines"]])
+            num_points=num_centerline_points(info['center_lines'])
+            input_dict['num_points'] = num_points
         return input_dict,num_points
\ No newline at end of file
@@ -0,0 +1,97 @@
+from functools import lru_cache
+from math import factorial
+
+import numpy as np
+
+# polylines shorter than this are replaced by the straight line between
+# their end points before fitting
+MIN_FIT_POINTS = 10
+
+
+def comb(n, k):
+    return factorial(n) // (factorial(k) * factorial(n - k))
+
+
+@lru_cache(maxsize=None)
+def bernstein_matrix(n_points, n_control):
+    """Bernstein design matrix [n_points, n_control] at `n_points` evenly
+    spaced parameters in [0, 1]. Read only, shared between calls."""
+    t = np.arange(n_points)[:, None] / (n_points - 1)
+    j = np.arange(n_control)[None]
+    binom = np.array([comb(n_control - 1, k) for k in range(n_control)])
+    A = binom * np.power(1 - t, n_control - 1 - j) * np.power(t, j)
+    A.flags.writeable = False
+    return A
+
+
+@lru_cache(maxsize=None)
+def _fit_operator(n_points, n_control):
+    """Least squares operator of the inner control points, with the end
+    points fixed: inner = pinv(A[:, 1:-1]) @ (points - A[:, :1] * start -
+    A[:, -1:] * end)."""
+    A = bernstein_matrix(n_points, n_control)
+    pinv = np.linalg.pinv(A[:, 1:-1])
+    pinv.flags.writeable = False
+    return pinv
+
+
+def _prepare(points):
+    if len(points) < MIN_FIT_POINTS:
+        points = np.linspace(points[0], points[-1], num=MIN_FIT_POINTS)
+    return points
+
+
+def get_bezier_coeff(points, n_control):
+    """Fit a Bezier curve through the end points of a polyline.
+    Args:
+        points (np.ndarray): polyline with shape [n, 2].
+        n_control (int): number of control points, end points included.
+    Returns:
+        np.ndarray: control points with shape [n_control, 2].
+    """
+    return get_bezier_coeffs([points], n_control)[0]
+
+
+def get_bezier_coeffs(points_list, n_control, num_points=None):
+    """Batched :func:`get_bezier_coeff`.
+
+    Polylines of the same length share one cached design matrix and are
+    solved with a single matrix product. With `num_points`, every polyline
+    is first resampled to `num_points` points at evenly spaced parameters,
+    so all of them are solved at once, at the cost of a slightly different
+    fit.
+    Args:
+        points_list (list[np.ndarray]): polylines with shape [n_i, 2].
+        n_control (int): number of control points, end points included.
+        num_points (int, optional): resample every polyline to this
+            length. Default: None.
+    Returns:
+        list[np.ndarray]: control points of every polyline, [n_control, 2].
+    """
+    points_list = [_prepare(np.asarray(points)) for points in points_list]
+    if num_points is not None:
+        points_list = [_resample(points, num_points) for points in points_list]
+    groups = {}
+    for i, points in enumerate(points_list):
+        groups.setdefault(len(points), []).append(i)
+
+    coeffs = [None] * len(points_list)
+    for n_points, indices in groups.items():
+        points = np.stack([points_list[i] for i in indices])  # [B, n, 2]
+        A = bernstein_matrix(n_points, n_control)
+        start, end = points[:, :1], points[:, -1:]
+        inner = _fit_operator(n_points, n_control) @ (
+            points - A[:, :1] * start - A[:, -1:] * end)
+        fits = np.concatenate([start, inner, end], axis=1)
+        for i, fit in zip(indices, fits):
+            coeffs[i] = fit
+    return coeffs
+
+
+def _resample(points, num_points):
+    """Polyline at `num_points` evenly spaced values of the point index
+    parameter used by the fit."""
+    t = np.linspace(0, len(points) - 1, num_points)
+    return np.stack(
+        [np.interp(t, np.arange(len(points)), points[:, k])
+         for k in range(points.shape[1])], axis=1)
@@ -0,0 +1,169 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components, depth_first_order
+
+
+def merge_close_nodes(nodes, radius):
+    """Greedy merge of nodes closer than `radius`, as `nodes_merge` did
+    pairwise: in order, a node closer than `radius` to a kept node is
+    merged into the last such kept node, any other node is kept.
+
+    Every kept node is hashed into its cell of a grid of size `radius` and
+    the neighbouring cells, so a node is only compared with the kept nodes
+    of its own cell, latest first.
+    Args:
+        nodes (list): nodes with a `position` and an `__eq__` that is True
+            below `radius`, e.g. `BzNode`.
+        radius (float): merge distance of the nodes' `__eq__`.
+    Returns:
+        tuple[list[int], np.ndarray]: indices of the kept nodes and, for
+            every node, the index of its kept node in that list.
+    """
+    merged_into = np.zeros(len(nodes), dtype=np.int64)
+    if not len(nodes):
+        return [], merged_into
+    # pairs closer than `radius` are at most one cell apart per axis
+    cell_size = radius * (1 + 1e-6)
+    positions = np.array([node.position for node in nodes], dtype=np.float64)
+    cells = np.floor(positions / cell_size).astype(np.int64)
+    neighbours = np.stack(np.meshgrid(
+        *[[-1, 0, 1]] * cells.shape[1], indexing='ij'), -1).reshape(-1, cells.shape[1])
+    grid = {}
+    kept = []
+    for idx, (node, cell) in enumerate(zip(nodes, map(tuple, cells.tolist()))):
+        for kept_idx in reversed(grid.get(cell, ())):
+            if nodes[kept[kept_idx]] == node:
+                merged_into[idx] = kept_idx
+                break
+        else:
+            merged_into[idx] = len(kept)
+            for neighbour in map(tuple, (cells[idx] + neighbours).tolist()):
+                grid.setdefault(neighbour, []).append(len(kept))
+            kept.append(idx)
+    return kept, merged_into
+
+
+def connected_subgraphs(adj):
+    """Connected components of `adj` with more than one node, ordered by
+    their smallest node, each listing its nodes in depth first order with
+    neighbours visited in index order.
+    Args:
+        adj (np.ndarray): adjacency [N, N], non zero where connected.
+    Returns:
+        list[list[int]]: nodes of every subgraph.
+    """
+    if not len(adj):
+        return []
+    graph = csr_matrix(adj != 0)
+    _, labels = connected_components(graph, directed=False)
+    _, roots, sizes = np.unique(labels, return_index=True, return_counts=True)
+    return [
+        depth_first_order(graph, root, directed=True,
+                          return_predecessors=False).tolist()
+        for root in np.sort(roots[sizes > 1])]
+
+
+def subgraph_adj(adj, nodes):
+    """Adjacency among `nodes`, antisymmetric from its upper triangle."""
+    upper = np.triu(adj[np.ix_(nodes, nodes)], 1)
+    return upper - upper.T
+
+
+class GraphEdges(object):
+    """Directed edges src[e] -> dst[e] of a graph of `num_nodes` nodes with
+    the polylines in between, `polylines[e]`.
+
+    Edges are sorted by source, `out_indptr` giving the edges of every
+    source node as in a CSR matrix, and `in_edges[in_indptr[i]:in_indptr[i
+    + 1]]` are the edges into node i, sorted by source.
+    Args:
+        num_nodes (int): number of nodes.
+        src (np.ndarray): source node of every edge.
+        dst (np.ndarray): target node of every edge.
+        polylines (list): polylines of every edge.
+    """
+
+    def __init__(self, num_nodes, src, dst, polylines):
+        src = np.asarray(src, dtype=np.int64).reshape(-1)
+        dst = np.asarray(dst, dtype=np.int64).reshape(-1)
+        order = np.lexsort((dst, src))
+        self.num_nodes = num_nodes
+        self.src = src[order]
+        self.dst = dst[order]
+        self.polylines = [polylines[e] for e in order]
+        nodes = np.arange(num_nodes + 1)
+        self.out_indptr = np.searchsorted(self.src, nodes)
+        self.in_edges = np.lexsort((self.src, self.dst))
+        self.in_indptr = np.searchsorted(self.dst[self.in_edges], nodes)
+
+    @classmethod
+    def from_points_dict(cls, num_nodes, points_in_between_nodes):
+        """Edges of a `{(src, dst): polylines}` dict."""
+        keys = np.array(list(points_in_between_nodes.keys()),
+                        dtype=np.int64).reshape(-1, 2)
+        return cls(num_nodes, keys[:, 0], keys[:, 1],
+                   list(points_in_between_nodes.values()))
+
+    def __len__(self):
+        return len(self.src)
+
+    def children(self, node):
+        """Targets of the edges from `node` and the edges, by target."""
+        edges = np.arange(self.out_indptr[node], self.out_indptr[node + 1])
+        return self.dst[edges], edges
+
+    def parents(self, node):
+        """Sources of the edges into `node` and the edges, by source."""
+        edges = self.in_edges[self.in_indptr[node]:self.in_indptr[node + 1]]
+        return self.src[edges], edges
+
+    def permute(self, order):
+        """Edges with node order[k] renumbered to k, `order` being a
+        permutation of the nodes."""
+        new_index = np.empty(self.num_nodes, dtype=np.int64)
+        new_index[np.asarray(order, dtype=np.int64)] = np.arange(len(order))
+        return GraphEdges(self.num_nodes, new_index[self.src],
+                          new_index[self.dst], self.polylines)
+
+    def to_points_dict(self):
+        """`{(src, dst): polylines}`, ordered by the smaller node of an
+        edge, then the larger one."""
+        order = np.lexsort((np.maximum(self.src, self.dst),
+                            np.minimum(self.src, self.dst)))
+        return {(int(self.src[e]), int(self.dst[e])): self.polylines[e]
+                for e in order}
+
+    def to_adj(self, dtype=np.int64):
+        """Dense adjacency, 1 from source to target and -1 back."""
+        adj = np.zeros((self.num_nodes, self.num_nodes), dtype=dtype)
+        adj[self.src, self.dst] = 1
+        adj[self.dst, self.src] = -1
+        return adj
+
+
+def dfs_order(indptr, indices, roots):
+    """Depth first preorder of the nodes reachable from `roots`, tried in
+    order, following the CSR graph `indptr`, `indices` with neighbours in
+    the order they are stored."""
+    visited = np.zeros(len(indptr) - 1, dtype=bool)
+    order = []
+    for root in roots:
+        if visited[root]:
+            continue
+        visited[root] = True
+        order.append(root)
+        stack = [(root, indptr[root])]
+        while stack:
+            node, pos = stack[-1]
+            end = indptr[node + 1]
+            while pos < end and visited[indices[pos]]:
+                pos += 1
+            if pos == end:
+                stack.pop()
+                continue
+            stack[-1] = (node, pos + 1)
+            child = indices[pos]
+            visited[child] = True
+            order.append(child)
+            stack.append((child, indptr[child]))
+    return order
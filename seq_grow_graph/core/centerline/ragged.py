@@ -0,0 +1,160 @@
+import numpy as np
+
+# per-line fields of `info['center_lines']` besides the points
+ID_KEYS = ('type', 'centerline_ids')
+RAGGED_ID_KEYS = ('incoming_ids', 'outgoing_ids')
+IDX_KEYS = ('start_point_idxs', 'end_point_idxs')
+
+
+def is_packed(center_lines):
+    return 'offsets' in center_lines
+
+
+def pack_points(lines, dtype=None):
+    """Concatenate polylines into one array.
+    Args:
+        lines (list[np.ndarray]): polylines with shape [n_i, 3].
+        dtype (np.dtype, optional): dtype of the points, the dtype of
+            `lines` by default.
+    Returns:
+        tuple[np.ndarray]: points [sum(n_i), 3] and offsets [L + 1], line i
+            being points[offsets[i]:offsets[i + 1]].
+    """
+    lengths = np.array([len(line) for line in lines], dtype=np.int64)
+    offsets = np.zeros(len(lines) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    if len(lines):
+        points = np.concatenate(lines, axis=0)
+    else:
+        points = np.zeros((0, 3))
+    if dtype is not None:
+        points = points.astype(dtype, copy=False)
+    return points, offsets
+
+
+def split_points(points, offsets):
+    """Views of every line of packed points."""
+    if len(offsets) <= 1:
+        return []
+    return np.split(points, offsets[1:-1])
+
+
+def ragged_arange(starts, stops):
+    """Concatenation of np.arange(start, stop) for every pair."""
+    lengths = stops - starts
+    if not len(lengths) or lengths.sum() == 0:
+        return np.zeros(0, dtype=np.int64)
+    run_offsets = np.cumsum(lengths) - lengths
+    return np.arange(lengths.sum()) + np.repeat(starts - run_offsets, lengths)
+
+
+def true_runs(mask, offsets):
+    """Runs of True of a per-point mask, not crossing line boundaries.
+    Args:
+        mask (np.ndarray): bool mask of the packed points.
+        offsets (np.ndarray): line offsets [L + 1].
+    Returns:
+        tuple[np.ndarray]: first and last point index of every run and
+            the line of every run, in point order.
+    """
+    line_starts = offsets[:-1][offsets[:-1] < offsets[1:]]
+    line_ends = offsets[1:][offsets[:-1] < offsets[1:]] - 1
+    prev = np.zeros_like(mask)
+    prev[1:] = mask[:-1]
+    prev[line_starts] = False
+    following = np.zeros_like(mask)
+    following[:-1] = mask[1:]
+    following[line_ends] = False
+    starts = np.flatnonzero(mask & ~prev)
+    ends = np.flatnonzero(mask & ~following)
+    lines = np.searchsorted(offsets, starts, side='right') - 1
+    return starts, ends, lines
+
+
+def first_equal_points(points, starts, ends, anchors):
+    """Index of the first point of every run starts[i]:ends[i] + 1 equal to
+    points[anchors[i]], which lies in the run."""
+    idxs = ragged_arange(starts, ends + 1)
+    lengths = ends + 1 - starts
+    equal = np.all(points[idxs] == np.repeat(points[anchors], lengths, axis=0), axis=1)
+    equal_idxs = np.flatnonzero(equal)
+    run_offsets = np.cumsum(lengths) - lengths
+    return idxs[equal_idxs[np.searchsorted(equal_idxs, run_offsets)]]
+
+
+def pack_centerlines(center_lines, dtype=np.float32):
+    """Packed form of `info['center_lines']`.
+
+    The points of all lines are stored in one `dtype` array with offsets,
+    ids as fixed width byte string arrays, the incoming and outgoing ids
+    flattened with their own offsets and the start and end indices as int32
+    arrays. Keys missing from `center_lines` are left out.
+    Args:
+        center_lines (dict): annotation of the info converter.
+        dtype (np.dtype): dtype of the points. Default: np.float32.
+    Returns:
+        dict: packed annotation, see :func:`unpack_centerlines`.
+    """
+    if is_packed(center_lines):
+        return center_lines
+    points, offsets = pack_points(center_lines['centerlines'], dtype)
+    packed = dict(points=points, offsets=offsets)
+    for key in ID_KEYS:
+        if key in center_lines:
+            packed[key] = np.array(center_lines[key], dtype=np.bytes_)
+    for key in RAGGED_ID_KEYS:
+        if key in center_lines:
+            ids = center_lines[key]
+            packed[key] = np.array(
+                [i for line_ids in ids for i in line_ids], dtype=np.bytes_)
+            packed[key.replace('_ids', '_offsets')] = np.cumsum(
+                [0] + [len(line_ids) for line_ids in ids], dtype=np.int64)
+    for key in IDX_KEYS:
+        if key in center_lines:
+            packed[key] = np.array(center_lines[key], dtype=np.int32)
+    if 'start_end_point' in center_lines:
+        packed['start_end_point'] = np.array(
+            center_lines['start_end_point'], dtype=dtype)
+    return packed
+
+
+def _decode(ids):
+    return [i.decode() for i in ids.tolist()]
+
+
+def unpack_ids(center_lines):
+    """Per-line id and index lists of packed `center_lines`."""
+    unpacked = {}
+    for key in ID_KEYS:
+        if key in center_lines:
+            unpacked[key] = _decode(center_lines[key])
+    for key in RAGGED_ID_KEYS:
+        if key in center_lines:
+            ids = _decode(center_lines[key])
+            id_offsets = center_lines[key.replace('_ids', '_offsets')]
+            unpacked[key] = [
+                ids[s:e] for s, e in zip(id_offsets[:-1], id_offsets[1:])]
+    for key in IDX_KEYS:
+        if key in center_lines:
+            unpacked[key] = center_lines[key].tolist()
+    return unpacked
+
+
+def unpack_centerlines(center_lines):
+    """Inverse of :func:`pack_centerlines`, with new arrays for the lines.
+    Unpacked annotations are returned as is."""
+    if not is_packed(center_lines):
+        return center_lines
+    unpacked = unpack_ids(center_lines)
+    unpacked['centerlines'] = [
+        line.copy() for line in split_points(
+            center_lines['points'], center_lines['offsets'])]
+    if 'start_end_point' in center_lines:
+        unpacked['start_end_point'] = list(center_lines['start_end_point'])
+    return unpacked
+
+
+def num_centerline_points(center_lines):
+    if is_packed(center_lines):
+        return int(center_lines['offsets'][-1])
+    return sum(len(line) for line in center_lines['centerlines'])
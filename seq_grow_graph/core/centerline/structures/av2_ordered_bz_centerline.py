@@ -2,7 +2,6 @@ import torch
 import mmcv
 import os
 import numpy as np
-from math import factorial
 from tqdm import tqdm
 import cv2
 import copy
@@ -11,35 +10,9 @@ import warnings
 import pdb
 import math
 import bezier
-from math import factorial
 from projects.SeqGrowGraph.seq_grow_graph.core.centerline.structures.pryordered_bz_centerline import NusOrederedBzCenterLine
+from ..bezier import get_bezier_coeff
 
-def comb(n, k):
-    return factorial(n) // (factorial(k) * factorial(n - k))
-
-def get_bezier_coeff(points, n_control):
-    """points.shape: [n, 2]"""
-    if len(points)<10:
-        points = np.linspace(points[0], points[-1], num=10)
-    n_points = len(points)
-    A = np.zeros((n_points, n_control))
-    t = np.arange(n_points) / (n_points - 1)
-
-    for i in range(n_points):
-        for j in range(n_control):
-            A[i, j] = comb(n_control - 1, j) * np.power(1 - t[i], n_control - 1 - j) * np.power(t[i], j)
-    A_BE = A[:, 1:-1]  # (L. N-2)
-    points_BE = points - np.stack(
-        ((A[:, 0] * points[0][0] + A[:, -1] * points[-1][0]), (A[:, 0] * points[0][1] + A[:, -1] * points[-1][1]))).T
-    try:
-        conts = np.linalg.lstsq(A_BE, points_BE, rcond=None)
-    except:
-        raise Exception("Maybe there are some lane whose point number is one!")
-
-    res = conts[0]
-    fin_res = np.r_[[points[0]], res, [points[-1]]]
-    # fin_res = fin_res.astype(int)
-    return fin_res
 
 def convert_coeff_coord(nodelist, pc_range, dx, bz_pc_range, bz_dx):
     seqnodelen = len(nodelist)
@@ -2,7 +2,6 @@ import torch
 import mmcv
 import os
 import numpy as np
-from math import factorial
 from tqdm import tqdm
 import cv2
 import copy
@@ -11,36 +10,14 @@ import warnings
 import pdb
 import math
 import bezier
-from math import factorial
 import random
 from pyquaternion import Quaternion
+from ..bezier import get_bezier_coeff
+from ..graph import (GraphEdges, connected_subgraphs, dfs_order, merge_close_nodes,
+                     subgraph_adj)
+from ..ragged import (first_equal_points, is_packed, pack_points, ragged_arange,
+                      split_points, true_runs, unpack_centerlines, unpack_ids)
 
-def comb(n, k):
-    return factorial(n) // (factorial(k) * factorial(n - k))
-
-def get_bezier_coeff(points, n_control):
-    """points.shape: [n, 2]"""
-    if len(points)<10:
-        points = np.linspace(points[0], points[-1], num=10)
-    n_points = len(points)
-    A = np.zeros((n_points, n_control))
-    t = np.arange(n_points) / (n_points - 1)
-
-    for i in range(n_points):
-        for j in range(n_control):
-            A[i, j] = comb(n_control - 1, j) * np.power(1 - t[i], n_control - 1 - j) * np.power(t[i], j)
-    A_BE = A[:, 1:-1]  # (L. N-2)
-    points_BE = points - np.stack(
-        ((A[:, 0] * points[0][0] + A[:, -1] * points[-1][0]), (A[:, 0] * points[0][1] + A[:, -1] * points[-1][1]))).T
-    try:
-        conts = np.linalg.lstsq(A_BE, points_BE, rcond=None)
-    except:
-        raise Exception("Maybe there are some lane whose point number is one!")
-
-    res = conts[0]
-    fin_res = np.r_[[points[0]], res, [points[-1]]]
-    # fin_res = fin_res.astype(int)
-    return fin_res
 
 def convert_coeff_coord(nodelist, pc_range, dx, bz_pc_range, bz_dx):
     seqnodelen = len(nodelist)
@@ -54,6 +31,10 @@ def convert_coeff_coord(nodelist, pc_range, dx, bz_pc_range, bz_dx):
     return nodelist
 
 
+# nodes closer than this are the same node
+BZ_NODE_MERGE_RADIUS = 2.1
+
+
 class BzNode(object):
     def __init__(self, position):
         self.parents = []
@@ -84,7 +65,7 @@ class BzNode(object):
         return f"Node_sque_index : {self.sque_index}, Node_type : {self.type}, sque_type : {self.sque_type}, fork_from : {self.fork_from_index}, merge with : {self.merge_with_index}, coord : {self.position}\n"
 
     def __eq__(self, __o):
-        if np.linalg.norm(np.array(self.position) - np.array(__o.position)) < 2.1:
+        if np.linalg.norm(np.array(self.position) - np.array(__o.position)) < BZ_NODE_MERGE_RADIUS:
             return True
         return False
 
@@ -424,9 +405,46 @@ class OrderedBzSceneGraph(object):
 
 
 class OrderedBzSceneGraphNew(OrderedBzSceneGraph):
+    """Scene graph serialized from the edge arrays of its subgraphs,
+    `subgraph.edges`, see `GraphEdges`."""
+
     def __init__(self, Nodes_list: list, adj: list, nodes_points: list, ncontrol=3):
         super(OrderedBzSceneGraphNew, self).__init__(Nodes_list, adj, nodes_points)
         self.ncontrol = ncontrol
+        for subgraph in self.subgraph:
+            subgraph.edges = GraphEdges.from_points_dict(
+                len(subgraph.nodes_list), subgraph.nodes_points)
+
+    def sort_node_adj(self, subgraph):
+        """sort nodelist and adj in each subgraph again to get ordered dfs result"""
+        nodes_list = subgraph.nodes_list
+        x_list = [(abs(i.position[0]),abs(i.position[1])) for i in nodes_list]  #!
+        x_new = sorted(x_list)
+        # first occurrences, as list.index
+        x_index, x_new_index = {}, {}
+        for idx, x in enumerate(x_list):
+            x_index.setdefault(x, idx)
+        for idx, x in enumerate(x_new):
+            x_new_index.setdefault(x, idx)
+        idx_list_new = [x_index[i] for i in x_new]
+        idx_list = [x_new_index[i] for i in x_list]
+        nodes_points_new = {}
+        for k, v in subgraph.nodes_points.items():
+            nodes_points_new[(idx_list[k[0]], idx_list[k[1]])] = v
+        subgraph.nodes_points = nodes_points_new
+        subgraph.edges = GraphEdges.from_points_dict(len(nodes_list), nodes_points_new)
+        subgraph.nodes_adj = subgraph.edges.to_adj(np.float64)
+        subgraph.nodes_list = [nodes_list[i] for i in idx_list_new]
+
+    @staticmethod
+    def reorder_subgraph(subgraph, order):
+        """Nodes, edges and `{(src, dst): polylines}` of `subgraph` with
+        node order[k] renumbered to k, which also becomes its sque_index."""
+        new_subgraphs_nodes = [subgraph.nodes_list[idx] for idx in order]
+        new_subgraphs_edges = subgraph.edges.permute(order)
+        for idx, node in enumerate(new_subgraphs_nodes):
+            node.sque_index = idx
+        return new_subgraphs_nodes, new_subgraphs_edges, new_subgraphs_edges.to_points_dict()
 
 
     
@@ -456,55 +474,26 @@ class OrderedBzSceneGraphNew(OrderedBzSceneGraph):
         # self.subgraphs_sorted = sorted(self.subgraph, key=lambda x: (x.nearest_node.position[0]**2+x.nearest_node.position[1]**2))
         self.subgraphs_sorted = sorted(self.subgraph, key=lambda x: x.first_start_node.position[0])
         
-        adj_list=[]
+        edges_list=[]
         result_list = []
         new_subgraphs_points_in_between_nodes_list=[]
         for idx, subgraph in enumerate(self.subgraphs_sorted):
-            subgraph_scene_sentance, adj,new_subgraphs_points_in_between_nodes = self.subgraph_sequelize(subgraph)
-            # subgraph_scene_sentance, adj,new_subgraphs_points_in_between_nodes = self.subgraph_sequelize_start_from_center(subgraph)
+            subgraph_scene_sentance, edges,new_subgraphs_points_in_between_nodes = self.subgraph_sequelize(subgraph)
+            # subgraph_scene_sentance, edges,new_subgraphs_points_in_between_nodes = self.subgraph_sequelize_start_from_center(subgraph)
             # self.set_coeff(subgraph_scene_sentance, new_subgraphs_points_in_between_nodes) #?
             new_subgraphs_points_in_between_nodes_list.append(new_subgraphs_points_in_between_nodes)
             result_list.append(subgraph_scene_sentance)
-            adj_list.append(adj)
+            edges_list.append(edges)
 
 
-        return result_list,adj_list,new_subgraphs_points_in_between_nodes_list
+        return result_list,edges_list,new_subgraphs_points_in_between_nodes_list
     
     
     def subgraph_sequelize_random(self, subgraph):
         """pry subgragh search"""
-        # subgraph.nodes_list  subgraph.nodes_adj
-        nodes = subgraph.nodes_list
-        adj = subgraph.nodes_adj
-        nodes_points = subgraph.nodes_points
-
-
-        new_subgraphs_points_in_between_nodes = {}
-        random_list = list(range(len(nodes)))
+        random_list = list(range(len(subgraph.nodes_list)))
         random.shuffle(random_list)
-        sub_nodes = random_list
-        subgraph_adj = np.zeros((len(sub_nodes), len(sub_nodes)), dtype=int)
-        _list = []
-        for idx in sub_nodes:
-            _list.append(nodes[idx])
-        for i in range(len(sub_nodes) - 1):
-            for j in range(i + 1, len(sub_nodes)):
-                subgraph_adj[i][j] = adj[sub_nodes[i]][sub_nodes[j]]
-                subgraph_adj[j][i] = -subgraph_adj[i][j]
-                if subgraph_adj[i][j] == 1:
-                    new_subgraphs_points_in_between_nodes[(i, j)] = nodes_points[
-                        (sub_nodes[i], sub_nodes[j])]
-                if subgraph_adj[i][j] == -1:
-                    new_subgraphs_points_in_between_nodes[(j, i)] = nodes_points[
-                        (sub_nodes[j], sub_nodes[i])]
-
-        new_subgraphs_nodes = _list
-        new_subgraphs_adj = subgraph_adj
-
-        for idx, node in enumerate(new_subgraphs_nodes):
-            node.sque_index = idx
-    
-        return new_subgraphs_nodes,new_subgraphs_adj, new_subgraphs_points_in_between_nodes
+        return self.reorder_subgraph(subgraph, random_list)
     
     
     def subgraph_sequelize_start_from_center(self, subgraph):
@@ -512,7 +501,6 @@ class OrderedBzSceneGraphNew(OrderedBzSceneGraph):
         # subgraph.nodes_list  subgraph.nodes_adj
         nodes = subgraph.nodes_list
         adj = subgraph.nodes_adj
-        nodes_points = subgraph.nodes_points
 
         def dfs(index, visited, subgraph_nodes, adj):
             if visited[index]:
@@ -542,131 +530,36 @@ class OrderedBzSceneGraphNew(OrderedBzSceneGraph):
         if len(subgraphs_nodes) != len(nodes):
             raise Exception("len(subgraphs_nodes_) != len(nodes)! Check dfs!")
 
-        new_subgraphs_points_in_between_nodes = {}
-
-        sub_nodes = subgraphs_nodes
-        subgraph_adj = np.zeros((len(sub_nodes), len(sub_nodes)), dtype=int)
-        _list = []
-        for idx in sub_nodes:
-            _list.append(nodes[idx])
-        for i in range(len(sub_nodes) - 1):
-            for j in range(i + 1, len(sub_nodes)):
-                subgraph_adj[i][j] = adj[sub_nodes[i]][sub_nodes[j]]
-                subgraph_adj[j][i] = -subgraph_adj[i][j]
-                if subgraph_adj[i][j] == 1:
-                    new_subgraphs_points_in_between_nodes[(i, j)] = nodes_points[
-                        (sub_nodes[i], sub_nodes[j])]
-                if subgraph_adj[i][j] == -1:
-                    new_subgraphs_points_in_between_nodes[(j, i)] = nodes_points[
-                        (sub_nodes[j], sub_nodes[i])]
-
-        new_subgraphs_nodes = _list
-        new_subgraphs_adj = subgraph_adj
-
-        for idx, node in enumerate(new_subgraphs_nodes):
-            node.sque_index = idx
-
-        return new_subgraphs_nodes,new_subgraphs_adj, new_subgraphs_points_in_between_nodes
+        return self.reorder_subgraph(subgraph, subgraphs_nodes)
     
     
     def subgraph_sequelize_by_coord(self, subgraph):
         """pry subgragh search"""
-        # subgraph.nodes_list  subgraph.nodes_adj
-        nodes = subgraph.nodes_list
-        adj = subgraph.nodes_adj
-        nodes_points = subgraph.nodes_points
-        new_subgraphs_points_in_between_nodes = {}
-    
-        coord_list=[i.position for i in  nodes]
+        coord_list=[i.position for i in  subgraph.nodes_list]
         coord_list_sort=sorted(enumerate(coord_list), key=lambda x: (x[1][0],x[1][1]))
-        
-        
-        sub_nodes = [i[0] for i in coord_list_sort]
-        subgraph_adj = np.zeros((len(sub_nodes), len(sub_nodes)), dtype=int)
-        _list = []
-        for idx in sub_nodes:
-            _list.append(nodes[idx])
-        for i in range(len(sub_nodes) - 1):
-            for j in range(i + 1, len(sub_nodes)):
-                subgraph_adj[i][j] = adj[sub_nodes[i]][sub_nodes[j]]
-                subgraph_adj[j][i] = -subgraph_adj[i][j]
-                if subgraph_adj[i][j] == 1:
-                    new_subgraphs_points_in_between_nodes[(i, j)] = nodes_points[
-                        (sub_nodes[i], sub_nodes[j])]
-                if subgraph_adj[i][j] == -1:
-                    new_subgraphs_points_in_between_nodes[(j, i)] = nodes_points[
-                        (sub_nodes[j], sub_nodes[i])]
-
-        new_subgraphs_nodes = _list
-        new_subgraphs_adj = subgraph_adj
-
-        for idx, node in enumerate(new_subgraphs_nodes):
-            node.sque_index = idx
-        return new_subgraphs_nodes,new_subgraphs_adj, new_subgraphs_points_in_between_nodes
+        return self.reorder_subgraph(subgraph, [i[0] for i in coord_list_sort])
     
     
     def subgraph_sequelize(self, subgraph):
-        """pry subgragh search"""
-        # subgraph.nodes_list  subgraph.nodes_adj
+        """pry subgragh search: depth first along the edges from the sorted
+        start nodes.
+        Returns:
+            tuple: the reordered nodes, their `GraphEdges` and
+                `{(src, dst): polylines}`.
+        """
         nodes = subgraph.nodes_list
-        adj = subgraph.nodes_adj
-        nodes_points = subgraph.nodes_points
-
-        start_nodes_idx_sorted = subgraph.start_nodes_idx_sorted
+        edges = subgraph.edges
 
-        def dfs(index, visited, subgraph_nodes, adj):
-            if visited[index]:
-                return
-
-            visited[index] = True
-            subgraph_nodes.append(index)
-            for idx, i in enumerate(adj[index]):
-                if adj[index][idx] == 1:
-                    dfs(idx, visited, subgraph_nodes, adj)
-
-        if nodes is None or adj is None:
+        if nodes is None or edges is None:
             raise Exception("construction nodes & adj raw first!")
 
-        subgraph_count = 0
-        visted = [False for i in nodes]
-        # subgraphs_nodes_ = []
-        subgraphs_nodes = []
-        for idx in start_nodes_idx_sorted:  # dfs every connected graph and save the idx of nodes
-            subgraph_nodes = []
-            if not visted[idx]:
-                subgraph_count += 1
-                dfs(idx, visted, subgraph_nodes, adj)
-            subgraphs_nodes += subgraph_nodes
+        subgraphs_nodes = dfs_order(edges.out_indptr, edges.dst,
+                                    subgraph.start_nodes_idx_sorted)
 
         if len(subgraphs_nodes) != len(nodes):
             raise Exception("len(subgraphs_nodes_) != len(nodes)! Check dfs!")
 
-        new_subgraphs_points_in_between_nodes = {}
-
-        sub_nodes = subgraphs_nodes
-        subgraph_adj = np.zeros((len(sub_nodes), len(sub_nodes)), dtype=int)
-        _list = []
-        for idx in sub_nodes:
-            _list.append(nodes[idx])
-        for i in range(len(sub_nodes) - 1):
-            for j in range(i + 1, len(sub_nodes)):
-                subgraph_adj[i][j] = adj[sub_nodes[i]][sub_nodes[j]]
-                subgraph_adj[j][i] = -subgraph_adj[i][j]
-                if subgraph_adj[i][j] == 1:
-                    new_subgraphs_points_in_between_nodes[(i, j)] = nodes_points[
-                        (sub_nodes[i], sub_nodes[j])]
-                if subgraph_adj[i][j] == -1:
-                    new_subgraphs_points_in_between_nodes[(j, i)] = nodes_points[
-                        (sub_nodes[j], sub_nodes[i])]
-
-        new_subgraphs_nodes = _list
-        new_subgraphs_adj = subgraph_adj
-
-        for idx, node in enumerate(new_subgraphs_nodes):
-            node.sque_index = idx
-
-
-        return new_subgraphs_nodes,new_subgraphs_adj, new_subgraphs_points_in_between_nodes
+        return self.reorder_subgraph(subgraph, subgraphs_nodes)
 
 
 
@@ -695,15 +588,26 @@ def perspective(cam_coords, proj_mat):
 
 
 class NusOrederedBzCenterLine(object):
+    """Centerlines of a sample. The points of all lines are kept in one
+    array `self.points`, line i being points[offsets[i]:offsets[i + 1]].
+
+    `centerlines` is the annotation of the info converter or its packed
+    form, see `pack_centerlines`.
+    """
+
     def __init__(self, centerlines, grid_conf, bz_grid_conf,cam_intrinsic,token=None):
-        self.types = copy.deepcopy(centerlines['type'])
-        self.centerline_ids = copy.deepcopy(centerlines['centerline_ids'])
+        if is_packed(centerlines):
+            self._set_points(centerlines['points'].copy(),
+                             centerlines['offsets'].copy())
+            centerlines = unpack_ids(centerlines)
+        else:
+            self.centerlines = centerlines['centerlines']
+        self.types = list(centerlines['type'])
+        self.centerline_ids = list(centerlines['centerline_ids'])
         self.incoming_ids = copy.deepcopy(centerlines['incoming_ids'])
         self.outgoing_ids = copy.deepcopy(centerlines['outgoing_ids'])
-        self.start_point_idxs = copy.deepcopy(centerlines['start_point_idxs'])  
-        self.end_point_idxs = copy.deepcopy(centerlines['end_point_idxs'])
-        self.centerlines = copy.deepcopy(centerlines['centerlines'])
-        self.coeff = copy.deepcopy(centerlines)
+        self.start_point_idxs = list(centerlines['start_point_idxs'])
+        self.end_point_idxs = list(centerlines['end_point_idxs'])
         self.token=token
         self.all_nodes = None
         self.adj = None
@@ -738,35 +642,37 @@ class NusOrederedBzCenterLine(object):
         nx = np.floor(np.array([(row[1] - row[0]) / row[2] for row in [xbound, ybound, zbound]]))
         return dx, bx, nx
     
+    @property
+    def centerlines(self):
+        """Views of every line into `self.points`."""
+        if self._centerlines is None:
+            self._centerlines = split_points(self.points, self.offsets)
+        return self._centerlines
+
+    @centerlines.setter
+    def centerlines(self, centerlines):
+        self._set_points(*pack_points(centerlines))
+
+    def _set_points(self, points, offsets=None):
+        self.points = points
+        if offsets is not None:
+            self.offsets = offsets
+        self._centerlines = None
+
     def flip(self, type):
         if type not in ['horizontal', 'vertical']:
             return
-        aug_centerlines = []
-        for i in range(len(self.centerlines)):
-            centerline = self.centerlines[i]
-            if type == 'horizontal':
-                centerline[:,0] = -centerline[:,0]
-            else:
-                centerline[:,1] = -centerline[:,1]
-            aug_centerlines.append(centerline)
-        self.centerlines = aug_centerlines
-    
+        if type == 'horizontal':
+            self.points[:, 0] = -self.points[:, 0]
+        else:
+            self.points[:, 1] = -self.points[:, 1]
+
     def scale(self, scale_ratio):
         scaling_matrix = self._get_scaling_matrix(scale_ratio)
-        aug_centerlines = []
-        for i in range(len(self.centerlines)):
-            centerline = self.centerlines[i]
-            aug_centerline = centerline @ scaling_matrix.T
-            aug_centerlines.append(aug_centerline)
-        self.centerlines = aug_centerlines
-    
+        self._set_points(self.points @ scaling_matrix.T)
+
     def rotate(self, rotation_matrix):
-        aug_centerlines = []
-        for i in range(len(self.centerlines)):
-            centerline = self.centerlines[i]
-            aug_centerline = centerline @ rotation_matrix.T
-            aug_centerlines.append(aug_centerline)
-        self.centerlines = aug_centerlines
+        self._set_points(self.points @ rotation_matrix.T)
 
     def get_visible_mask(self,instrinsics, image_width, extents, resolution):
 
@@ -828,82 +734,50 @@ class NusOrederedBzCenterLine(object):
         return list(zip(starts, ends))
     
     def filter_bev(self):
-        aug_types = []
-        aug_centerlines = []
-        aug_centerline_ids = []
-        aug_start_point_idxs = []
-        aug_end_point_idxs = []
-        aug_incoming_ids = []
-        aug_outgoing_ids = []
-        for i in range(len(self.centerlines)):
-            centerline = self.centerlines[i]
-            idxs = np.arange(len(centerline))
-            in_bev_x = np.logical_and(centerline[:, 0] < self.pc_range[3], centerline[:, 0] >= self.pc_range[0])
-            in_bev_y = np.logical_and(centerline[:, 1] <= self.pc_range[4], centerline[:, 1] >= self.pc_range[1])
-            in_bev_xy = np.logical_and(in_bev_x, in_bev_y)
-            if self.vis_mask is not None:
-                centerline_points_int=centerline.astype(int)
-                for index,centerline_point_int in enumerate(centerline_points_int):
-                    if in_bev_xy[index] and not self.vis_mask[centerline_point_int[0]-int(self.pc_range[0]),centerline_point_int[1]-int(self.pc_range[1])]:
-                        in_bev_xy[index]=False
-                
-            if not np.max(in_bev_xy):
-                continue
-            if np.min(in_bev_xy):
-                aug_types.append(self.types[i])
-                aug_centerlines.append(centerline)
-                aug_centerline_ids.append(self.centerline_ids[i])
-                aug_start_point_idxs.append(self.start_point_idxs[i])
-                aug_end_point_idxs.append(self.end_point_idxs[i])
-                aug_incoming_ids.append(self.incoming_ids[i])
-                aug_outgoing_ids.append(self.outgoing_ids[i])
-                continue
-            # if not self.are_trues_connected(in_bev_xy):
-            #     print(in_bev_xy)
-            #     in_bev_xy=self.make_trues_connected(in_bev_xy[::-1])[::-1]
-            
-            segments=self.find_true_segments(in_bev_xy)
-            for segment in segments:
-                start,end=segment[0],segment[1]
-                if end<=start:
-                    continue
-                new_in_bev_xy=np.zeros_like(in_bev_xy,dtype=bool)
-                new_in_bev_xy[start:end+1]=True
-                # print(new_in_bev_xy)
-                
-                start_point_idx = self.start_point_idxs[i]
-                end_point_idx = self.end_point_idxs[i]
-                aug_start_point = centerline[start_point_idx]
-                aug_end_point = centerline[end_point_idx]
-                aug_centerline = centerline[new_in_bev_xy,:]
-                aug_idxs = idxs[new_in_bev_xy]
-
-                if not start_point_idx in aug_idxs:
-                    aug_start_point = aug_centerline[0]
-
-                if not end_point_idx in aug_idxs:
-                    aug_end_point = aug_centerline[-1]
-   
-        
-                start_distance = np.linalg.norm(aug_centerline - aug_start_point, ord=2, axis=1)
-                start_point_idx = np.argmin(start_distance)
-                end_distance = np.linalg.norm(aug_centerline - aug_end_point, ord=2, axis=1)
-                end_point_idx = np.argmin(end_distance)
-                
-                aug_types.append(self.types[i])
-                aug_centerlines.append(aug_centerline)
-                aug_centerline_ids.append(self.centerline_ids[i])
-                aug_start_point_idxs.append(start_point_idx)
-                aug_end_point_idxs.append(end_point_idx)
-                aug_incoming_ids.append(self.incoming_ids[i])
-                aug_outgoing_ids.append(self.outgoing_ids[i])
-        self.types = aug_types
-        self.centerlines = aug_centerlines
-        self.centerline_ids = aug_centerline_ids
-        self.incoming_ids = aug_incoming_ids
-        self.outgoing_ids = aug_outgoing_ids
-        self.start_point_idxs = aug_start_point_idxs
-        self.end_point_idxs = aug_end_point_idxs
+        """Keep the parts of every line inside the BEV range, and visible
+        with `vis_mask`. Lines partly inside are split into their runs of
+        at least two points, the start/end point of a run being the point
+        closest to the original one if it is kept, its first/last point
+        otherwise."""
+        points, offsets = self.points, self.offsets
+        in_bev_x = np.logical_and(points[:, 0] < self.pc_range[3], points[:, 0] >= self.pc_range[0])
+        in_bev_y = np.logical_and(points[:, 1] <= self.pc_range[4], points[:, 1] >= self.pc_range[1])
+        in_bev_xy = np.logical_and(in_bev_x, in_bev_y)
+        if self.vis_mask is not None:
+            in_bev_idxs = np.flatnonzero(in_bev_xy)
+            points_int = points[in_bev_idxs, :2].astype(int)
+            in_bev_xy[in_bev_idxs] = self.vis_mask[
+                points_int[:, 0] - int(self.pc_range[0]),
+                points_int[:, 1] - int(self.pc_range[1])]
+
+        starts, ends, lines = true_runs(in_bev_xy, offsets)
+        whole = (starts == offsets[lines]) & (ends == offsets[lines + 1] - 1)
+        keep = whole | (ends > starts)
+        starts, ends, lines, whole = starts[keep], ends[keep], lines[keep], whole[keep]
+
+        start_point_idxs = np.asarray(self.start_point_idxs, dtype=np.int64)[lines]
+        end_point_idxs = np.asarray(self.end_point_idxs, dtype=np.int64)[lines]
+        split = ~whole
+        for point_idxs, fallback in ((start_point_idxs, starts), (end_point_idxs, ends)):
+            # the closest point of a run to its start/end point is the
+            # first one equal to it
+            anchors = offsets[lines[split]] + point_idxs[split]
+            in_run = (anchors >= starts[split]) & (anchors <= ends[split])
+            anchors = np.where(in_run, anchors, fallback[split])
+            point_idxs[split] = first_equal_points(
+                points, starts[split], ends[split], anchors) - starts[split]
+
+        idxs = ragged_arange(starts, ends + 1)
+        run_offsets = np.zeros(len(starts) + 1, dtype=np.int64)
+        np.cumsum(ends + 1 - starts, out=run_offsets[1:])
+        self._set_points(points[idxs], run_offsets)
+        lines = lines.tolist()
+        self.types = [self.types[i] for i in lines]
+        self.centerline_ids = [self.centerline_ids[i] for i in lines]
+        self.incoming_ids = [self.incoming_ids[i] for i in lines]
+        self.outgoing_ids = [self.outgoing_ids[i] for i in lines]
+        self.start_point_idxs = start_point_idxs.tolist()
+        self.end_point_idxs = end_point_idxs.tolist()
 
     @staticmethod
     def _get_rotation_matrix(rotate_degrees):
@@ -925,60 +799,26 @@ class NusOrederedBzCenterLine(object):
             
 
     def sub_graph_split(self):
-
-        def dfs(index, visited, subgraph_nodes, adj):
-            if visited[index]:
-                return
-
-            visited[index] = True
-            subgraph_nodes.append(index)
-            for idx, i in enumerate(adj[index]):
-                if adj[index][idx] == 1 or adj[index][idx] == -1:
-                    dfs(idx, visited, subgraph_nodes, adj)
-
         if self.all_nodes is None or self.adj is None:
             raise Exception("construction nodes & adj raw first!")
 
-        subgraph_count = 0
-        visted = [False for i in self.all_nodes]
-        subgraphs_nodes_ = []
-        subgraphs_nodes = []
-        for idx, node in enumerate(self.all_nodes):  # dfs every connected graph and save the idx of nodes
-            subgraph_nodes = []
-            if not visted[idx]:
-                subgraph_count += 1
-                dfs(idx, visted, subgraph_nodes, self.adj)
-            subgraphs_nodes_.append(subgraph_nodes)
-
-        for subgraph_node in subgraphs_nodes_:  # delete empty lists
-            if len(subgraph_node) <= 1:
-                continue
-            else:
-                subgraphs_nodes.append(subgraph_node)
-
         self.subgraphs_nodes = []
         self.subgraphs_adj = []
-        self.subgraphs_points_in_between_nodes = [{} for i in subgraphs_nodes]
-        for idx_, sub_nodes in enumerate(subgraphs_nodes):
-            _list = []
-            if len(sub_nodes) == 0:
-                continue
-            subgraph_adj = np.zeros((len(sub_nodes), len(sub_nodes)), dtype=np.int64)
-            for idx in sub_nodes:
-                _list.append(self.all_nodes[idx])
-            for i in range(len(sub_nodes) - 1):
-                for j in range(i + 1, len(sub_nodes)):
-                    subgraph_adj[i][j] = self.adj[sub_nodes[i]][sub_nodes[j]]
-                    subgraph_adj[j][i] = -subgraph_adj[i][j]
-                    if subgraph_adj[i][j] == 1:
-                        self.subgraphs_points_in_between_nodes[idx_][(i, j)] = self.points_in_between_nodes[
-                            (sub_nodes[i], sub_nodes[j])]
-                    if subgraph_adj[i][j] == -1:
-                        self.subgraphs_points_in_between_nodes[idx_][(j, i)] = self.points_in_between_nodes[
-                            (sub_nodes[j], sub_nodes[i])]
-
-            self.subgraphs_nodes.append(_list)
-            self.subgraphs_adj.append(subgraph_adj)
+        self.subgraphs_points_in_between_nodes = []
+        for sub_nodes in connected_subgraphs(self.adj):
+            sub_adj = subgraph_adj(self.adj, sub_nodes)
+            sub_points_in_between_nodes = {}
+            for i, j in zip(*np.nonzero(np.triu(sub_adj, 1))):
+                i, j = int(i), int(j)
+                if sub_adj[i, j] == 1:
+                    sub_points_in_between_nodes[(i, j)] = self.points_in_between_nodes[
+                        (sub_nodes[i], sub_nodes[j])]
+                else:
+                    sub_points_in_between_nodes[(j, i)] = self.points_in_between_nodes[
+                        (sub_nodes[j], sub_nodes[i])]
+            self.subgraphs_nodes.append([self.all_nodes[idx] for idx in sub_nodes])
+            self.subgraphs_adj.append(sub_adj)
+            self.subgraphs_points_in_between_nodes.append(sub_points_in_between_nodes)
 
     def export_node_adj(self):
         # self.construct_nodes_adj_raw()
@@ -1025,28 +865,9 @@ class NusOrederedBzCenterLine(object):
         '''
         merge same nodes in node list and adjcent matrix
         '''
-        self.all_nodes = []
-        nodes_raw_nodes_map = [None for i in self.all_nodes_raw]  # 54
-        all_nodes_index = []
-        picked_raw_nodes = []
-        for idx, node in enumerate(self.all_nodes_raw):
-            if idx in picked_raw_nodes:
-                continue
-            self.all_nodes.append(self.all_nodes_raw[idx])
-            all_nodes_index.append(idx)
-            nodes_raw_nodes_map[idx] = idx
-            picked_raw_nodes.append(idx)
-            for idx_j in range(idx + 1, len(self.all_nodes_raw)):
-                if self.all_nodes_raw[idx] == self.all_nodes_raw[idx_j]:
-                    picked_raw_nodes.append(idx_j)
-                    nodes_raw_nodes_map[idx_j] = idx
-
-        # len: self.all_nodes 22
-        nodes_raw_nodes_map = np.array(nodes_raw_nodes_map, dtype=np.int64)
-        nodes_raw_nodes_index_map = []
-        for idx in range(len(nodes_raw_nodes_map)):
-            nodes_raw_nodes_index_map.append(all_nodes_index.index(nodes_raw_nodes_map[idx]))
-        nodes_raw_nodes_index_map = np.array(nodes_raw_nodes_index_map, dtype=np.int64)
+        all_nodes_index, nodes_raw_nodes_index_map = merge_close_nodes(
+            self.all_nodes_raw, BZ_NODE_MERGE_RADIUS)
+        self.all_nodes = [self.all_nodes_raw[idx] for idx in all_nodes_index]
         ## map raw points in between
         self.points_in_between_nodes = {}
         for i, j in self.raw_points_in_between:
@@ -1098,6 +919,7 @@ class NusOrederedBzCenterLine(object):
 
 class NusOrederedBzCenterLineRandomCam(NusOrederedBzCenterLine):
     def __init__(self, centerlines, grid_conf, bz_grid_conf,cams,chosen_cams,token=None):
+        centerlines = unpack_centerlines(centerlines)
         self.types = copy.deepcopy(centerlines['type'])
         self.centerline_ids = copy.deepcopy(centerlines['centerline_ids'])
         self.incoming_ids = copy.deepcopy(centerlines['incoming_ids'])
@@ -1727,6 +1549,7 @@ class NusOrederedRMcontinuedBzCenterLine(NusOrederedBzCenterLine):
     
 class NusClearOrederedBzCenterLine(object):
     def __init__(self, centerlines, grid_conf, bz_grid_conf, clear=True):
+        centerlines = unpack_centerlines(centerlines)
         self.types = copy.deepcopy(centerlines['type'])
         self.centerline_ids = copy.deepcopy(centerlines['centerline_ids'])
         self.incoming_ids = copy.deepcopy(centerlines['incoming_ids'])
@@ -2081,6 +1904,7 @@ class NusClearOrederedBzCenterLine(object):
 
 class PryMonoOrederedBzCenterLine(object):
     def __init__(self, centerlines, grid_conf, bz_grid_conf):
+        centerlines = unpack_centerlines(centerlines)
         self.types = copy.deepcopy(centerlines['type'])
         self.centerline_ids = copy.deepcopy(centerlines['centerline_ids'])
         self.incoming_ids = copy.deepcopy(centerlines['incoming_ids'])
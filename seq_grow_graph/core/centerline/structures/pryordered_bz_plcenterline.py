@@ -2,7 +2,6 @@ import torch
 import mmcv
 import os
 import numpy as np
-from math import factorial
 from tqdm import tqdm
 import cv2
 import copy
@@ -11,35 +10,10 @@ import warnings
 import pdb
 import math
 import bezier
-from math import factorial
-
-
-def comb(n, k):
-    return factorial(n) // (factorial(k) * factorial(n - k))
-
-def get_bezier_coeff(points, n_control):
-    """points.shape: [n, 2]"""
-    if len(points)<10:
-        points = np.linspace(points[0], points[-1], num=10)
-    n_points = len(points)
-    A = np.zeros((n_points, n_control))
-    t = np.arange(n_points) / (n_points - 1)
-
-    for i in range(n_points):
-        for j in range(n_control):
-            A[i, j] = comb(n_control - 1, j) * np.power(1 - t[i], n_control - 1 - j) * np.power(t[i], j)
-    A_BE = A[:, 1:-1]  # (L. N-2)
-    points_BE = points - np.stack(
-        ((A[:, 0] * points[0][0] + A[:, -1] * points[-1][0]), (A[:, 0] * points[0][1] + A[:, -1] * points[-1][1]))).T
-    try:
-        conts = np.linalg.lstsq(A_BE, points_BE, rcond=None)
-    except:
-        raise Exception("Maybe there are some lane whose point number is one!")
-
-    res = conts[0]
-    fin_res = np.r_[[points[0]], res, [points[-1]]]
-    # fin_res = fin_res.astype(int)
-    return fin_res
+from ..bezier import get_bezier_coeff
+from ..ragged import unpack_centerlines
+
+
 
 def convert_plcoeff_coord(nodelists, pc_range, dx, bz_pc_range, bz_dx):
     sublistlen = len(nodelists)
@@ -696,6 +670,7 @@ class OrderedBzPlSceneGraph(object):
 
 class PryOrederedBzPlCenterLine(object):
     def __init__(self, centerlines, grid_conf, bz_grid_conf):
+        centerlines = unpack_centerlines(centerlines)
         self.types = copy.deepcopy(centerlines['type'])
         self.centerline_ids = copy.deepcopy(centerlines['centerline_ids'])
         self.incoming_ids = copy.deepcopy(centerlines['incoming_ids'])
@@ -978,6 +953,7 @@ class PryOrederedBzPlCenterLine(object):
 
 class PryMonoOrederedBzPlCenterLine(object):
     def __init__(self, centerlines, grid_conf, bz_grid_conf):
+        centerlines = unpack_centerlines(centerlines)
         self.types = copy.deepcopy(centerlines['type'])
         self.centerline_ids = copy.deepcopy(centerlines['centerline_ids'])
         self.incoming_ids = copy.deepcopy(centerlines['incoming_ids'])
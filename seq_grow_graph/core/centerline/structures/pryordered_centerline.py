@@ -10,6 +10,7 @@ import time
 import warnings
 import pdb
 import math
+from ..ragged import unpack_centerlines
 
 class Node(object):
     def __init__(self, position):
@@ -350,6 +351,7 @@ class OrderedSceneGraph(object):
 
 class PryOrederedCenterLine(object):
     def __init__(self, centerlines, grid_conf):
+        centerlines = unpack_centerlines(centerlines)
         self.types = copy.deepcopy(centerlines['type'])
         self.centerline_ids = copy.deepcopy(centerlines['centerline_ids'])
         self.incoming_ids = copy.deepcopy(centerlines['incoming_ids'])
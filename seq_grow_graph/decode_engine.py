@@ -0,0 +1,112 @@
+import torch
+
+
+class StaticDecodeEngine:
+    """Greedy decoding of an `ARRNTRHead` with static shapes.
+
+    Tokens and scores are written into buffers of shape [B, max_center_len]
+    and the self-attention keys/values into caches preallocated for the
+    whole sequence, so :meth:`step` never allocates a tensor of a new shape
+    and can be captured by ``torch.compile``. Rows that emitted the end token
+    keep stepping and are padded with it; whether every row has finished is
+    only checked on the host every `check_every` steps.
+
+    Args:
+        head (ARRNTRHead): The head to decode with. Grammar constraints are
+            not supported.
+        check_every (int): Steps between two termination checks.
+            Default: 16.
+        compile (bool): Compile :meth:`step` with ``torch.compile``.
+            Default: False.
+        compile_cfg (dict, optional): Keyword arguments of
+            ``torch.compile``. Default: None.
+        end (int): The end token. Default: 573.
+    """
+
+    def __init__(self, head, check_every=16, compile=False, compile_cfg=None,
+                 end=573):
+        assert head.grammar is None, \
+            'grammar masks have a dynamic shape, use forward_cached instead'
+        self.head = head
+        self.max_len = head.max_iteration + 1
+        self.check_every = check_every
+        self.end = end
+        self.step_fn = self.step
+        if compile:
+            self.step_fn = torch.compile(self.step, **(compile_cfg or dict()))
+
+    def init_state(self, mlvl_feats, input_seqs):
+        """Allocate the buffers of one batch.
+
+        Args:
+            mlvl_feats (Tensor): BEV features with shape [B, C, H, W].
+            input_seqs (Tensor): Prompt tokens with shape [B, L].
+        Returns:
+            dict: `tokens`, `values`, `done`, `prompt_len` and `cache`, the
+                arguments of :meth:`step` besides the position.
+        """
+        bs, prompt_len = input_seqs.shape
+        cache = self.head.init_cache(mlvl_feats)
+        self.head.transformer.alloc_cache(cache, self.max_len)
+        tokens = input_seqs.new_full((bs, self.max_len), self.end).long()
+        tokens[:, :prompt_len] = input_seqs
+        return dict(
+            tokens=tokens,
+            values=mlvl_feats.new_zeros(bs, self.max_len),
+            done=torch.zeros(bs, dtype=torch.bool, device=input_seqs.device),
+            prompt_len=torch.tensor(prompt_len, device=input_seqs.device),
+            cache=cache)
+
+    def step(self, position, tokens, values, done, prompt_len, cache):
+        """Feed the tokens at `position` and write the greedy next tokens
+        and their scores at ``position + 1``, in place.
+
+        Args:
+            position (Tensor): The step counter, shape [1].
+            tokens (Tensor): Token buffer with shape [B, max_center_len].
+            values (Tensor): Score buffer with the same shape.
+            done (Tensor): Rows that emitted the end token, shape [B].
+            prompt_len (Tensor): Number of prompt tokens, kept as they are.
+            cache (list[dict]): Preallocated decoder caches.
+        Returns:
+            Tensor: The updated `done`.
+        """
+        new_seqs = tokens.index_select(1, position)
+        value, extra_seq = self.head.decode_step(
+            new_seqs, position, cache, position=position)
+        next_position = position + 1
+        keep = (next_position < prompt_len) | done[:, None]
+        prompt = tokens.index_select(1, next_position)
+        extra_seq = torch.where(keep, prompt, extra_seq)
+        value = torch.where(keep, torch.zeros_like(value), value)
+        tokens.index_copy_(1, next_position, extra_seq)
+        values.index_copy_(1, next_position, value.to(values.dtype))
+        return done | (extra_seq[:, 0] == self.end)
+
+    @torch.no_grad()
+    def generate(self, mlvl_feats, input_seqs):
+        """Decode a batch.
+
+        Returns:
+            tuple[Tensor]: the generated sequences with the prompt and
+                their scores, as `ARRNTRHead.forward_cached`.
+        """
+        prompt_len = input_seqs.shape[1]
+        state = self.init_state(mlvl_feats, input_seqs)
+        device = input_seqs.device
+        num_steps = self.max_len - 1
+        for i in range(self.max_len - 1):
+            position = torch.tensor([i], device=device)
+            state['done'] = self.step_fn(position, **state)
+            if (i + 1) % self.check_every == 0 and bool(state['done'].all()):
+                num_steps = i + 1
+                break
+
+        # drop the steps run after every row had finished
+        num_gen = num_steps - prompt_len + 1
+        gen_seqs = state['tokens'][:, prompt_len:prompt_len + num_gen]
+        not_ended = (gen_seqs == self.end).long().cumsum(1) == 0
+        if len(gen_seqs) > 0:
+            num_gen = min(num_gen, int(not_ended.sum(1).max()) + 1)
+        return (state['tokens'][:, :prompt_len + num_gen],
+                state['values'][:, prompt_len:prompt_len + num_gen])
@@ -0,0 +1,230 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+import torch
+
+
+class GraphGenerationServer:
+    """Continuous-batching lane graph generation around a `SeqGrowGraph`.
+
+    Frames are put on a request queue and encoded by the image/LSS branch in
+    small batches. Decoding runs one rolling batch: every step feeds the
+    newest token of each active sequence through the cached decoder of
+    `ARRNTRHead`, and slots freed by sequences that emitted the end token
+    are refilled with newly encoded frames right away instead of waiting for
+    the whole batch to finish.
+
+    Args:
+        model (SeqGrowGraph): The model, switched to eval mode here.
+        max_batch_size (int): Number of slots of the rolling decode batch.
+            Default: 8.
+        encode_batch_size (int): Max number of frames encoded at once.
+            Default: 4.
+    """
+
+    def __init__(self, model, max_batch_size=8, encode_batch_size=4):
+        self.model = model.eval()
+        self.head = model.pts_bbox_head
+        self.max_batch_size = max_batch_size
+        self.encode_batch_size = encode_batch_size
+        self.device = next(model.parameters()).device
+        self.max_len = self.head.max_iteration + 1
+
+        self.requests = queue.Queue()
+        self.cache = None
+        self.grammar_state = None
+        self.slots = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def submit(self, img, img_meta):
+        """Queue one frame for graph generation.
+
+        Args:
+            img (Tensor): Preprocessed multi-view images with shape
+                [N, C, H, W], as in `batch_inputs_dict['img']`.
+            img_meta (dict): Its meta information (`lidar2img`, `token`,
+                `n_control`, ...).
+        Returns:
+            Future: Resolves to a dict with `line_results` and `token`, the
+                same as one item of `SeqGrowGraph.simple_test`.
+        """
+        future = Future()
+        self.requests.put(dict(img=img, img_meta=img_meta, future=future))
+        return future
+
+    def start(self):
+        """Run :meth:`serve_forever` in a background thread."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def serve_forever(self):
+        while not self._stop.is_set():
+            self.admit(block=not self.slots)
+            if self.slots:
+                self.step()
+
+    def _pop_requests(self, num, block):
+        reqs = []
+        try:
+            if block:
+                reqs.append(self.requests.get(timeout=0.05))
+            while len(reqs) < num:
+                reqs.append(self.requests.get_nowait())
+        except queue.Empty:
+            pass
+        return reqs
+
+    @torch.no_grad()
+    def admit(self, block=False):
+        """Encode waiting frames into the free slots of the decode batch.
+
+        Args:
+            block (bool): Wait briefly for a request if the queue is empty.
+        Returns:
+            int: Number of admitted frames.
+        """
+        num_free = min(self.max_batch_size - len(self.slots),
+                       self.encode_batch_size)
+        if num_free <= 0:
+            return 0
+        reqs = self._pop_requests(num_free, block)
+        if not reqs:
+            return 0
+
+        try:
+            img = torch.stack([r['img'] for r in reqs]).to(self.device)
+            img_metas = [r['img_meta'] for r in reqs]
+            bev_feats = self.model.extract_feat(img=img, img_metas=img_metas)
+            new_cache = self.head.init_cache(bev_feats)
+        except Exception as e:
+            for r in reqs:
+                r['future'].set_exception(e)
+            return 0
+        if self.cache is None:
+            self.cache = new_cache
+        else:
+            self.cache = self.head.transformer.merge_cache(
+                self.cache, new_cache)
+        if self.head.grammar is not None:
+            prompt = torch.full((len(reqs), 1), self.model.start,
+                                device=self.device)
+            state = self.head.grammar.init_state(prompt)
+            if self.grammar_state is not None:
+                state = tuple(torch.cat([old, new]) for old, new in zip(
+                    self.grammar_state, state))
+            self.grammar_state = state
+        for r in reqs:
+            self.slots.append(dict(request=r, tokens=[self.model.start]))
+        return len(reqs)
+
+    @torch.no_grad()
+    def step(self):
+        """Decode one token for every active sequence and retire the
+        finished ones.
+
+        If decoding fails, every active request gets the exception and the
+        decode batch is emptied, so the server keeps serving new frames.
+        """
+        try:
+            self._step()
+        except Exception as e:
+            for slot in self.slots:
+                if not slot['request']['future'].done():
+                    slot['request']['future'].set_exception(e)
+            self.slots = []
+            self.cache = None
+            self.grammar_state = None
+
+    def _step(self):
+        new_seqs = torch.tensor([[slot['tokens'][-1]] for slot in self.slots],
+                                device=self.device)
+        position_ids = torch.tensor(
+            [[len(slot['tokens']) - 1] for slot in self.slots],
+            device=self.device)
+        allowed = None
+        if self.grammar_state is not None:
+            allowed = self.head.grammar.allowed(self.grammar_state[0])
+        _, extra_seq = self.head.decode_step(new_seqs, position_ids,
+                                             self.cache, allowed)
+        if self.grammar_state is not None:
+            self.grammar_state = self.head.grammar.update(
+                *self.grammar_state, extra_seq[:, 0])
+
+        keep = []
+        for i, (slot, token) in enumerate(
+                zip(self.slots, extra_seq[:, 0].tolist())):
+            slot['tokens'].append(token)
+            if token == self.model.end or len(slot['tokens']) >= self.max_len:
+                self._finish(slot)
+            else:
+                keep.append(i)
+
+        if len(keep) == len(self.slots):
+            return
+        if keep:
+            keep_index = torch.tensor(keep, device=self.device)
+            self.cache = self.head.transformer.select_cache(
+                self.cache, keep_index)
+            if self.grammar_state is not None:
+                self.grammar_state = tuple(
+                    s[keep_index] for s in self.grammar_state)
+        else:
+            self.cache = None
+            self.grammar_state = None
+        self.slots = [self.slots[i] for i in keep]
+
+    def _finish(self, slot):
+        tokens = slot['tokens'][1:]
+        if self.model.end in tokens:
+            tokens = tokens[:tokens.index(self.model.end)]
+        img_meta = slot['request']['img_meta']
+        slot['request']['future'].set_result(dict(
+            line_results=dict(line_seqs=np.array(tokens, dtype=np.int64)),
+            token=img_meta['token']))
+
+
+def run_load(submit, frames, rate, seed=0):
+    """Submit `frames` with Poisson arrivals and collect latencies.
+
+    Args:
+        submit (callable): Takes (img, img_meta), returns a Future.
+        frames (list[tuple]): (img, img_meta) pairs.
+        rate (float): Mean arrival rate in frames per second.
+    Returns:
+        dict: `latency_p50`, `latency_p99` (seconds) and `fps`.
+    """
+    rng = np.random.default_rng(seed)
+    latencies = []
+    futures = []
+    lock = threading.Lock()
+    start = time.perf_counter()
+    for i, (img, img_meta) in enumerate(frames):
+        if i > 0:
+            time.sleep(rng.exponential(1.0 / rate))
+        sent = time.perf_counter()
+        future = submit(img, img_meta)
+
+        def _done(_, sent=sent):
+            with lock:
+                latencies.append(time.perf_counter() - sent)
+
+        future.add_done_callback(_done)
+        futures.append(future)
+    for future in futures:
+        future.result()
+    elapsed = time.perf_counter() - start
+    return dict(latency_p50=float(np.percentile(latencies, 50)),
+                latency_p99=float(np.percentile(latencies, 99)),
+                fps=len(frames) / elapsed)
@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os.path as osp
+
+import numpy as np
+from mmengine.fileio import load
+
+
+def seq_cache_key(centerline_type, grid_conf, bz_grid_conf, cam_intrinsic,
+                  n_control, ordered_dfs):
+    """Hash of everything the unaugmented `centerline_sequence` of a sample
+    depends on besides its annotation.
+
+    Args:
+        centerline_type (str): name of the centerline class of the loader.
+        grid_conf (dict): grid config of the loader.
+        bz_grid_conf (dict): Bezier grid config of the loader.
+        cam_intrinsic (array | None): camera intrinsic of the loader.
+        n_control (int): Bezier control points of `TransformGraph2Seq`.
+        ordered_dfs (bool): `orderedDFS` of `TransformGraph2Seq`.
+    """
+    if cam_intrinsic is not None:
+        cam_intrinsic = np.asarray(cam_intrinsic).tolist()
+    cfg = dict(centerline_type=centerline_type, grid_conf=grid_conf,
+               bz_grid_conf=bz_grid_conf, cam_intrinsic=cam_intrinsic,
+               n_control=n_control, ordered_dfs=ordered_dfs)
+    cfg = json.dumps(cfg, sort_keys=True, default=str)
+    return hashlib.sha1(cfg.encode()).hexdigest()[:16]
+
+
+def annotation_fingerprint(annotation):
+    """Hash of the raw `center_lines` annotation of a sample, so sequences
+    cached from an older annotation file are not used."""
+    sha1 = hashlib.sha1()
+
+    def update(value):
+        if isinstance(value, dict):
+            for name in sorted(value):
+                sha1.update(repr(name).encode())
+                update(value[name])
+        elif isinstance(value, (list, tuple)):
+            sha1.update(f'[{len(value)}'.encode())
+            for item in value:
+                update(item)
+        elif isinstance(value, np.ndarray):
+            sha1.update(f'{value.dtype}{value.shape}'.encode())
+            sha1.update(np.ascontiguousarray(value).tobytes())
+        else:
+            sha1.update(repr(value).encode())
+
+    update(annotation)
+    return sha1.hexdigest()[:16]
+
+
+def seq_cache_file(cache_dir, key, split):
+    return osp.join(cache_dir, f'{key}_{split}.pkl')
+
+
+class GTSequenceCache:
+    """`centerline_sequence` by sample token, for the cache key `key`, read
+    from the `split` file of `tools/create_gt_seq_cache.py` in `cache_dir`.
+
+    Every entry is an (annotation fingerprint, sequence) pair, a sequence is
+    only returned for the annotation it was computed from.
+    """
+
+    def __init__(self, cache_dir, key, split):
+        cache_file = seq_cache_file(cache_dir, key, split)
+        self.sequences = load(cache_file) if osp.exists(cache_file) else {}
+
+    def get(self, token, fingerprint):
+        fingerprint_sequence = self.sequences.get(token)
+        if fingerprint_sequence is None or fingerprint_sequence[0] != fingerprint:
+            return None
+        return fingerprint_sequence[1]
+
+
+class LazyCenterLine:
+    """Builds `centerline_type(centerlines, grid_conf, bz_grid_conf,
+    cam_intrinsic, token)` on first use.
+
+    Samples whose centerlines are never touched by an augmentation do not
+    need them at all when their sequence is cached, see
+    `TransformGraph2Seq`. Any attribute access builds and forwards to the
+    centerlines.
+    Args:
+        centerline_type (type): e.g. `NusOrederedBzCenterLine`.
+        centerlines (dict): raw `center_lines` annotation of the sample.
+        grid_conf (dict): grid config.
+        bz_grid_conf (dict): Bezier grid config.
+        cam_intrinsic (array, optional): camera intrinsic.
+        token (str, optional): sample token.
+    """
+
+    def __init__(self, centerline_type, centerlines, grid_conf, bz_grid_conf,
+                 cam_intrinsic=None, token=None):
+        object.__setattr__(self, 'centerline_type', centerline_type)
+        object.__setattr__(self, 'annotation', centerlines)
+        object.__setattr__(self, 'grid_conf', grid_conf)
+        object.__setattr__(self, 'bz_grid_conf', bz_grid_conf)
+        object.__setattr__(self, 'cam_intrinsic', cam_intrinsic)
+        object.__setattr__(self, '_build', lambda: centerline_type(
+            centerlines, grid_conf, bz_grid_conf, cam_intrinsic, token))
+        object.__setattr__(self, '_centerlines', None)
+
+    def cache_key(self, n_control, ordered_dfs):
+        return seq_cache_key(self.centerline_type.__name__, self.grid_conf,
+                             self.bz_grid_conf, self.cam_intrinsic,
+                             n_control, ordered_dfs)
+
+    @property
+    def loaded(self):
+        return self._centerlines is not None
+
+    def load(self):
+        if self._centerlines is None:
+            object.__setattr__(self, '_centerlines', self._build())
+        return self._centerlines
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.load(), name, value)
@@ -9,7 +9,7 @@ from .centerline_utils import SceneGraph, sentance2seq, sentance2bzseq, sentance
 from .encode_centerline import NusOrederedBzCenterLine, OrderedBzSceneGraph
 LOCATIONS = ['boston-seaport', 'singapore-onenorth', 'singapore-queenstown',
              'singapore-hollandvillage']
-from math import factorial
+from .core.centerline.ragged import unpack_centerlines
 class LoadCenterlineSegFromPkl(object):
     """Load multi channel images from a list of separate channel files.
 
@@ -47,7 +47,7 @@ class LoadCenterlineSegFromPkl(object):
                 - img_norm_cfg (dict): Normalization configuration of images.
         """
         centerline_seg = np.zeros((int(self.nx[1]), int(self.nx[0])))
-        center_lines = results['center_lines']['centerlines']
+        center_lines = unpack_centerlines(results['center_lines'])['centerlines']
         for i in range(len(center_lines)):
             center_line = center_lines[i]
             inbev_x = np.logical_and(center_line[:,0] < self.pc_range[3], center_line[:,0] >= self.pc_range[0])
@@ -101,33 +101,6 @@ class LoadNusOrderedBzCenterline(object):
 
 
 
-def comb(n, k):
-    return factorial(n) // (factorial(k) * factorial(n - k))
-
-
-def get_bezier_coeff(points, n_control):
-    """points.shape: [n, 2]"""
-    if len(points)<10:
-        points = np.linspace(points[0], points[-1], num=10)
-    n_points = len(points)
-    A = np.zeros((n_points, n_control))
-    t = np.arange(n_points) / (n_points - 1)
-
-    for i in range(n_points):
-        for j in range(n_control):
-            A[i, j] = comb(n_control - 1, j) * np.power(1 - t[i], n_control - 1 - j) * np.power(t[i], j)
-    A_BE = A[:, 1:-1]  # (L. N-2)
-    points_BE = points - np.stack(
-        ((A[:, 0] * points[0][0] + A[:, -1] * points[-1][0]), (A[:, 0] * points[0][1] + A[:, -1] * points[-1][1]))).T
-    try:
-        conts = np.linalg.lstsq(A_BE, points_BE, rcond=None)
-    except:
-        raise Exception("Maybe there are some lane whose point number is one!")
-
-    res = conts[0]
-    fin_res = np.r_[[points[0]], res, [points[-1]]]
-    # fin_res = fin_res.astype(int)
-    return fin_res
 
 
 class TransformOrderedBzLane2Graph(object):
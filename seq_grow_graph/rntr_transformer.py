@@ -78,7 +78,8 @@ class LssSeqLineTransformer(BaseModule):
         self._is_init = True
 
 
-    def forward(self, tgt, x, mask, query_embed, pos_embed):
+    def forward(self, tgt, x, mask, query_embed, pos_embed,
+                return_intermediate=None, attn_mask=None, memory_index=None):
         """Forward function for `Transformer`.
         Args:
             x (Tensor): Input query with shape [bs, c, h, w] where
@@ -89,6 +90,15 @@ class LssSeqLineTransformer(BaseModule):
                 [num_query, c].
             pos_embed (Tensor): The positional encoding for encoder and
                 decoder, with the same shape as `x`.
+            return_intermediate (bool, optional): Overrides
+                `return_intermediate` of the decoder. Default: None.
+            attn_mask (Tensor, optional): Bool self attention mask with
+                shape [bs, num_query, num_query] replacing the causal one,
+                True means attend. Default: None.
+            memory_index (Tensor, optional): For packed sequences, the
+                sample of `x` every query belongs to, shape [bs, num_query].
+                `x` then holds one BEV map per sample and `query_embed` has
+                shape [bs, num_query, c]. Default: None.
         Returns:
             tuple[Tensor]: results of decoder containing the following tensor.
                 - out_dec: Output from decoder. If return_intermediate_dec \
@@ -108,9 +118,20 @@ class LssSeqLineTransformer(BaseModule):
         # pos_embed = pos_embed.permute(1, 3, 4, 0, 2).reshape(-1, bs, c) # [bs, n, c, h, w] -> [n*h*w, bs, c]
         # mask = mask.view(bs, -1)  # [bs, n, h, w] -> [bs, n*h*w]
         tgt = tgt.transpose(0, 1)  # [301, 1, 256]
-        query_embed = query_embed.unsqueeze(1).repeat(1, bs, 1)[:len(tgt)]  # [301, 1, 256]
-        tgt_mask = generate_square_subsequent_mask(len(tgt)).to(tgt.device)
+        if query_embed.dim() == 3:
+            query_embed = query_embed.transpose(0, 1)
+        else:
+            query_embed = query_embed.unsqueeze(1).repeat(1, bs, 1)[:len(tgt)]  # [301, 1, 256]
+        if attn_mask is not None:
+            tgt_mask = attn_mask
+        else:
+            tgt_mask = generate_square_subsequent_mask(len(tgt)).to(tgt.device)
 
+        decoder_kwargs = dict()
+        if return_intermediate is not None:
+            decoder_kwargs['return_intermediate'] = return_intermediate
+        if memory_index is not None:
+            decoder_kwargs['memory_index'] = memory_index
         # out_dec: [num_layers, num_query, bs, dim]
         out_dec = self.decoder(
             query=tgt,
@@ -119,12 +140,174 @@ class LssSeqLineTransformer(BaseModule):
             key_pos=pos_embed,
             query_pos=query_embed,
             key_padding_mask=mask,
-            attn_masks=[tgt_mask, None]
+            attn_masks=[tgt_mask, None],
+            **decoder_kwargs
             )
         out_dec = out_dec.transpose(1, 2)
         # memory = memory.reshape(n, h, w, bs, c).permute(3, 0, 4, 1, 2)
         return out_dec, memory
 
+    def init_cache(self):
+        """Create empty per-layer caches for :meth:`forward_step`."""
+        return [dict(self_attn=dict()) for _ in self.decoder.layers]
+
+    def prepare_memory(self, x, mask, pos_embed, cache=None):
+        """Prepare the BEV memory once per frame for :meth:`forward_step`.
+        `memory + pos_embed` and the cross attention keys/values of every
+        decoder layer are computed here instead of at every decoding step.
+        Args:
+            x (Tensor): BEV features with shape [bs, c, h, w].
+            mask (Tensor): Key padding mask with shape [bs, h, w].
+            pos_embed (Tensor): The positional encoding of `x`.
+            cache (list[dict], optional): Caches to fill. A new one is
+                created by :meth:`init_cache` if not given.
+        Returns:
+            list[dict]: The per-layer caches.
+        """
+        if cache is None:
+            cache = self.init_cache()
+        memory = x.flatten(2).permute(2, 0, 1)
+        pos_embed = pos_embed.flatten(2).permute(2, 0, 1)
+        return self.decoder.prepare_memory(
+            cache, key=memory, value=memory, key_pos=pos_embed)
+
+    def select_cache(self, cache, index):
+        """Keep the batch rows in `index` of every cached tensor, e.g. to
+        drop finished sequences from the active decoding batch. Leading
+        self-attention positions that are padding for every kept row are
+        trimmed."""
+        cache = [{name: {k: v.index_select(0, index) for k, v in kv.items()}
+                  for name, kv in layer_cache.items()}
+                 for layer_cache in cache]
+        self_attn = cache[0]['self_attn']
+        if 'key_padding_mask' in self_attn:
+            num_pad = int(self_attn['key_padding_mask'].all(0).long().cumprod(0).sum())
+            if num_pad > 0:
+                for layer_cache in cache:
+                    layer_cache['self_attn'] = {
+                        k: v[:, num_pad:] if k == 'key_padding_mask'
+                        else v[:, :, num_pad:]
+                        for k, v in layer_cache['self_attn'].items()}
+        return cache
+
+    @staticmethod
+    def cache_length(cache):
+        """Number of positions in the self-attention caches."""
+        self_attn = cache[0]['self_attn']
+        return self_attn['key'].shape[2] if 'key' in self_attn else 0
+
+    def alloc_cache(self, cache, max_len):
+        """Preallocate the self-attention caches of :meth:`prepare_memory`
+        for `max_len` positions, for decoding with static shapes, see
+        `position` of :meth:`forward_step`."""
+        for layer_cache in cache:
+            bs, num_heads, _, head_dims = layer_cache['cross_attn']['key'].shape
+            key = layer_cache['cross_attn']['key'].new_zeros(
+                bs, num_heads, max_len, head_dims)
+            layer_cache['self_attn'] = dict(key=key, value=torch.zeros_like(key))
+        return cache
+
+    def truncate_cache(self, cache, length):
+        """Drop every self-attention position from `length` on, e.g. to
+        roll back draft tokens rejected during speculative decoding. The
+        cache is updated in place and returned."""
+        for layer_cache in cache:
+            layer_cache['self_attn'] = {
+                k: v[:, :length] if k == 'key_padding_mask'
+                else v[:, :, :length]
+                for k, v in layer_cache['self_attn'].items()}
+        return cache
+
+    def merge_cache(self, cache, new_cache):
+        """Append the rows of `new_cache` to the batch of `cache`.
+        The sequences may have different lengths: the shorter self-attention
+        caches are left padded and the padding is recorded in a
+        `key_padding_mask`, so every row keeps attending to its own prefix
+        only. Positions must then be tracked per row by the caller.
+        Returns:
+            list[dict]: The merged caches.
+        """
+        merged = []
+        for layer_cache, new_layer_cache in zip(cache, new_cache):
+            cross_attn = {
+                k: torch.cat([layer_cache['cross_attn'][k],
+                              new_layer_cache['cross_attn'][k]])
+                for k in layer_cache['cross_attn']}
+            self_attn = self._merge_self_attn(
+                [layer_cache, new_layer_cache])
+            merged.append(dict(self_attn=self_attn, cross_attn=cross_attn))
+        return merged
+
+    @staticmethod
+    def _merge_self_attn(layer_caches):
+        """Concatenate self-attention caches along the batch, left padding
+        the shorter ones."""
+        kvs = [c['self_attn'] for c in layer_caches]
+        if all('key' not in kv for kv in kvs):
+            return dict()
+        ref = next(kv['key'] for kv in kvs if 'key' in kv)
+        _, num_heads, _, head_dims = ref.shape
+        max_len = max(kv['key'].shape[2] for kv in kvs if 'key' in kv)
+        keys, values, masks = [], [], []
+        for c, kv in zip(layer_caches, kvs):
+            num_rows = len(c['cross_attn']['key'])
+            if 'key' in kv:
+                key, value = kv['key'], kv['value']
+                mask = kv.get('key_padding_mask', key.new_zeros(
+                    key.shape[:1] + key.shape[2:3], dtype=torch.bool))
+            else:
+                key = value = ref.new_zeros(num_rows, num_heads, 0, head_dims)
+                mask = ref.new_zeros(num_rows, 0, dtype=torch.bool)
+            pad_len = max_len - key.shape[2]
+            keys.append(F.pad(key, (0, 0, pad_len, 0)))
+            values.append(F.pad(value, (0, 0, pad_len, 0)))
+            masks.append(F.pad(mask, (pad_len, 0), value=True))
+        return dict(key=torch.cat(keys),
+                    value=torch.cat(values),
+                    key_padding_mask=torch.cat(masks))
+
+    def forward_step(self, tgt, query_embed, cache, position=None):
+        """Incremental decoding: only the newly fed tokens are processed,
+        earlier positions and the BEV memory are read from ``cache``.
+        Args:
+            tgt (Tensor): Embeddings of the new tokens with shape
+                [bs, num_new, c].
+            query_embed (Tensor): Positional embedding of the new tokens
+                with shape [bs, num_new, c].
+            cache (list[dict]): Caches from :meth:`prepare_memory`,
+                updated in place.
+            position (Tensor, optional): Positions of the new tokens with
+                shape [num_new] in a cache from :meth:`alloc_cache`. Keeps
+                every shape fixed during decoding. Default: None.
+        Returns:
+            Tensor: Output of the last decoder layer with shape
+                [bs, num_new, c].
+        """
+        tgt = tgt.transpose(0, 1)
+        query_embed = query_embed.transpose(0, 1)
+
+        num_new = len(tgt)
+        past_len = self.cache_length(cache)
+        if position is not None:
+            # positions after the new tokens are not written yet
+            tgt_mask = torch.arange(past_len, device=tgt.device)[None, :] \
+                <= position[:, None]
+        elif num_new > 1:
+            # causal among the new tokens, every cached token is visible
+            tgt_mask = torch.ones(num_new, past_len + num_new,
+                                  dtype=torch.bool, device=tgt.device)
+            tgt_mask = tgt_mask.tril(diagonal=past_len)
+        else:
+            tgt_mask = None
+
+        out_dec = self.decoder.forward_step(
+            tgt,
+            cache,
+            query_pos=query_embed,
+            self_attn_mask=tgt_mask,
+            position=position)
+        return out_dec.transpose(0, 1)
+
 
 @MODELS.register_module()
 class LssSeqLineFlashTransformer(BaseModule):
@@ -839,12 +1022,16 @@ class PETRTransformerLineDecoder(TransformerLayerSequence):
         Args:
             query (Tensor): Input query with shape
                 `(num_query, bs, embed_dims)`.
+            return_intermediate (bool, optional): Overrides
+                `self.return_intermediate` for this call.
         Returns:
             Tensor: Results with shape [1, num_query, bs, embed_dims] when
                 return_intermediate is `False`, otherwise it has shape
                 [num_layers, num_query, bs, embed_dims].
         """
-        if not self.return_intermediate:
+        return_intermediate = kwargs.pop('return_intermediate',
+                                         self.return_intermediate)
+        if not return_intermediate:
             x = super().forward(query, *args, **kwargs)
             if self.post_norm:
                 x = self.post_norm(x)[None]
@@ -853,13 +1040,35 @@ class PETRTransformerLineDecoder(TransformerLayerSequence):
         intermediate = []
         for layer in self.layers:
             query = layer(query, *args, **kwargs)
-            if self.return_intermediate:
+            if return_intermediate:
                 if self.post_norm is not None:
                     intermediate.append(self.post_norm(query))
                 else:
                     intermediate.append(query)
         return torch.stack(intermediate)
 
+    def forward_step(self, query, caches, **kwargs):
+        """Incremental decoding, see `PETRLineTransformerDecoderLayer`.
+        Args:
+            query (Tensor): Newly fed queries with shape
+                `(num_new, bs, embed_dims)`.
+            caches (list[dict]): One cache per layer.
+        Returns:
+            Tensor: Output of the last layer with shape
+                [num_new, bs, embed_dims].
+        """
+        for layer, cache in zip(self.layers, caches):
+            query = layer.forward_step(query, cache=cache, **kwargs)
+        if self.post_norm is not None:
+            query = self.post_norm(query)
+        return query
+
+    def prepare_memory(self, caches, **kwargs):
+        """Fill the cross attention part of every layer cache."""
+        for layer, cache in zip(self.layers, caches):
+            layer.prepare_memory(cache=cache, **kwargs)
+        return caches
+
 
 @MODELS.register_module()
 class PETRSelfMultiheadAttention(BaseModule):
@@ -1023,6 +1232,11 @@ class RNTR2MultiheadAttention(BaseModule):
         batch_first (bool): When it is True,  Key, Query and Value are shape of
             (batch, n, embed_dim), otherwise (n, batch, embed_dim).
              Default to False.
+        memory_efficient (bool): Compute the attention with
+            ``F.scaled_dot_product_attention``, whose fused kernels do not
+            materialize the [bs * num_heads, num_queries, num_keys] score
+            matrix, instead of ``nn.MultiheadAttention``. The parameters
+            are the same. Default: False.
     """
 
     def __init__(self,
@@ -1033,6 +1247,7 @@ class RNTR2MultiheadAttention(BaseModule):
                  dropout_layer=dict(type='Dropout', drop_prob=0.),
                  init_cfg=None,
                  batch_first=False,
+                 memory_efficient=False,
                  **kwargs):
         super().__init__(init_cfg)
         if 'dropout' in kwargs:
@@ -1047,6 +1262,7 @@ class RNTR2MultiheadAttention(BaseModule):
         self.embed_dims = embed_dims
         self.num_heads = num_heads
         self.batch_first = batch_first
+        self.memory_efficient = memory_efficient
 
         self.attn = nn.MultiheadAttention(embed_dims, num_heads, 0.0,
                                           **kwargs)
@@ -1066,6 +1282,7 @@ class RNTR2MultiheadAttention(BaseModule):
                 key_pos=None,
                 attn_mask=None,
                 key_padding_mask=None,
+                memory_index=None,
                 **kwargs):
         """Forward function for `MultiheadAttention`.
         **kwargs allow passing a more general data flow when combining
@@ -1094,9 +1311,16 @@ class RNTR2MultiheadAttention(BaseModule):
                 will be used for `key_pos`. Defaults to None.
             attn_mask (Tensor): ByteTensor mask with shape [num_queries,
                 num_keys]. Same in `nn.MultiheadAttention.forward`.
-                Defaults to None.
+                A bool mask with shape [bs, num_queries, num_keys] instead
+                gives every row its own mask, True means the key takes part
+                in attention. Defaults to None.
             key_padding_mask (Tensor): ByteTensor with shape [bs, num_keys].
                 Defaults to None.
+            memory_index (Tensor, optional): For packed sequences, the
+                sample of every query with shape [bs, num_queries], -1 for
+                padding. `key` and `value` then hold one memory per sample,
+                [num_keys, num_samples, embed_dims], and each query attends
+                to the memory of its sample only. Defaults to None.
         Returns:
             Tensor: forwarded results with shape
             [num_queries, bs, embed_dims]
@@ -1133,25 +1357,186 @@ class RNTR2MultiheadAttention(BaseModule):
             query = query.transpose(0, 1)
             key = key.transpose(0, 1)
             value = value.transpose(0, 1)
-        if attn_mask == None:
-            is_causal = False
+        if memory_index is not None:
+            out = self._sdpa_by_sample(query, key, value, memory_index)
+        elif attn_mask is not None and attn_mask.dtype == torch.bool:
+            if self.memory_efficient:
+                out = self._sdpa(query, key, value, attn_mask=attn_mask[:, None])
+            else:
+                # nn.MultiheadAttention masks True, per (row, head)
+                out = self.attn(
+                    query=query,
+                    key=key,
+                    value=value,
+                    need_weights=False,
+                    attn_mask=~attn_mask.repeat_interleave(self.num_heads, 0)
+                    )[0]
+        elif self.memory_efficient:
+            out = self._sdpa(query, key, value, attn_mask is not None)
         else:
-            is_causal = True
-
-        out = self.attn(
-            query=query,
-            key=key,
-            value=value,
-            is_causal=is_causal, 
-            need_weights=False,
-            attn_mask=attn_mask
-            )[0]
+            is_causal = attn_mask is not None
+            out = self.attn(
+                query=query,
+                key=key,
+                value=value,
+                is_causal=is_causal, 
+                need_weights=False,
+                attn_mask=attn_mask
+                )[0]
 
         if self.batch_first:
             out = out.transpose(0, 1)
 
         return identity + self.dropout_layer(self.proj_drop(out))
 
+    def _split_heads(self, x):
+        """[len, bs, embed_dims] -> [bs, num_heads, len, head_dims]."""
+        length, bs, _ = x.shape
+        return x.view(length, bs, self.num_heads, -1).permute(1, 2, 0, 3)
+
+    def _in_proj(self, x, index):
+        """Apply the query (0), key (1) or value (2) part of the packed
+        input projection of ``self.attn`` and split the heads."""
+        weight = self.attn.in_proj_weight.chunk(3)[index]
+        bias = self.attn.in_proj_bias
+        if bias is not None:
+            bias = bias.chunk(3)[index]
+        return self._split_heads(F.linear(x, weight, bias))
+
+    def _sdpa(self, query, key, value, is_causal=False, attn_mask=None):
+        """Attention of ``self.attn`` through
+        ``F.scaled_dot_product_attention``, inputs and output are
+        [len, bs, embed_dims]."""
+        q = self._in_proj(query, 0)
+        k = self._in_proj(key, 1)
+        v = self._in_proj(value, 2)
+        out = F.scaled_dot_product_attention(
+            q, k, v, attn_mask=attn_mask, is_causal=is_causal)
+        num_queries, bs = query.shape[:2]
+        out = out.permute(2, 0, 1, 3).reshape(num_queries, bs, self.embed_dims)
+        return self.attn.out_proj(out)
+
+    def _sdpa_by_sample(self, query, key, value, memory_index):
+        """Attention of packed queries to the memory of their own sample,
+        see `memory_index` of :meth:`forward`. Queries of padding get a
+        zero output."""
+        q = self._in_proj(query, 0).transpose(1, 2)  # [bs, len, heads, dims]
+        k = self._in_proj(key, 1)
+        v = self._in_proj(value, 2)
+        out = q.new_zeros(q.shape)
+        for i in range(len(k)):
+            index = (memory_index == i).nonzero(as_tuple=True)
+            if len(index[0]) == 0:
+                continue
+            q_i = q[index].transpose(0, 1)[None]
+            out_i = F.scaled_dot_product_attention(q_i, k[i:i + 1], v[i:i + 1])
+            out = out.index_put(index, out_i[0].transpose(0, 1))
+        num_queries, bs = query.shape[:2]
+        out = out.transpose(0, 1).reshape(num_queries, bs, self.embed_dims)
+        return self.attn.out_proj(out)
+
+    def forward_step(self,
+                     query,
+                     key=None,
+                     value=None,
+                     identity=None,
+                     query_pos=None,
+                     key_pos=None,
+                     attn_mask=None,
+                     cache=None,
+                     static_kv=False,
+                     position=None,
+                     **kwargs):
+        """Incremental counterpart of :meth:`forward` used for decoding.
+        Keys and values of the new positions are projected once and
+        appended to ``cache``, so the query only has to cover the newly
+        fed tokens. The math is the one of ``nn.MultiheadAttention``.
+        Args:
+            query (Tensor): New queries with shape [num_new, bs, embed_dims].
+            attn_mask (Tensor): Bool mask with shape [num_new, num_keys],
+                True means the key takes part in attention. None when every
+                cached key is visible.
+            cache (dict): Holds `key` / `value` with shape [bs, num_heads,
+                num_keys, head_dims] and optionally a bool
+                `key_padding_mask` with shape [bs, num_keys] marking
+                padded keys with True. Filled in place.
+            static_kv (bool): Whether `cache` already holds the keys and
+                values filled by :meth:`prepare_kv`, in which case `key`,
+                `value` and `key_pos` are ignored. Default: False.
+            position (Tensor, optional): Indices of the new positions with
+                shape [num_new] in a cache preallocated for the whole
+                sequence. The new keys and values are written there in place
+                instead of being appended, and `attn_mask` has to hide the
+                positions not written yet. Default: None.
+        Returns:
+            Tensor: forwarded results with shape [num_new, bs, embed_dims].
+        """
+        assert not self.batch_first
+        if identity is None:
+            identity = query
+        if static_kv:
+            k = cache['key']
+            v = cache['value']
+        else:
+            if key is None:
+                key = query
+            if value is None:
+                value = key
+            if key_pos is None and query_pos is not None \
+                    and query_pos.shape == key.shape:
+                key_pos = query_pos
+            if key_pos is not None:
+                key = key + key_pos
+            k = self._in_proj(key, 1)
+            v = self._in_proj(value, 2)
+            if position is not None:
+                cache['key'].index_copy_(2, position, k)
+                cache['value'].index_copy_(2, position, v)
+                k = cache['key']
+                v = cache['value']
+            elif 'key' in cache:
+                k = torch.cat([cache['key'], k], dim=2)
+                v = torch.cat([cache['value'], v], dim=2)
+            cache['key'] = k
+            cache['value'] = v
+            if 'key_padding_mask' in cache and position is None:
+                pad = cache['key_padding_mask']
+                cache['key_padding_mask'] = torch.cat(
+                    [pad, pad.new_zeros(len(pad), len(query))], dim=1)
+        if 'key_padding_mask' in cache:
+            key_mask = ~cache['key_padding_mask'][:, None, None, :]
+            attn_mask = key_mask if attn_mask is None \
+                else key_mask & attn_mask
+        if query_pos is not None:
+            query = query + query_pos
+
+        q = self._in_proj(query, 0)
+        out = F.scaled_dot_product_attention(q, k, v, attn_mask=attn_mask)
+        num_new, bs = query.shape[:2]
+        out = out.permute(2, 0, 1, 3).reshape(num_new, bs, self.embed_dims)
+        out = self.attn.out_proj(out)
+        return identity + self.dropout_layer(self.proj_drop(out))
+
+    def prepare_kv(self, key, value=None, key_pos=None, cache=None):
+        """Project keys and values that stay fixed during decoding (e.g. the
+        BEV memory of cross attention) once, for :meth:`forward_step` with
+        ``static_kv=True``.
+        Args:
+            key (Tensor): The key tensor with shape [num_keys, bs,
+                embed_dims].
+            cache (dict): Filled in place with `key` / `value` of shape
+                [bs, num_heads, num_keys, head_dims].
+        Returns:
+            dict: `cache`.
+        """
+        if value is None:
+            value = key
+        if key_pos is not None:
+            key = key + key_pos
+        cache['key'] = self._in_proj(key, 1)
+        cache['value'] = self._in_proj(value, 2)
+        return cache
+
 
 @MODELS.register_module()
 class RNTRMultiheadFlashAttention(BaseModule):
@@ -2054,11 +2439,15 @@ class PETRLineTransformerDecoderLayer(BaseTransformerLayer):
                 attn_masks=None,
                 query_key_padding_mask=None,
                 key_padding_mask=None,
+                memory_index=None,
                 ):
         """Forward function for `TransformerCoder`.
         Returns:
             Tensor: forwarded results with shape [num_query, bs, embed_dims].
         """
+        if memory_index is not None:
+            return self._forward_packed(query, key, value, query_pos, key_pos,
+                                        attn_masks, memory_index)
         x = super(PETRLineTransformerDecoderLayer, self).forward(
                 query,
                 key=key,
@@ -2072,6 +2461,48 @@ class PETRLineTransformerDecoderLayer(BaseTransformerLayer):
 
         return x
 
+    def _forward_packed(self, query, key, value, query_pos, key_pos,
+                        attn_masks, memory_index):
+        """`BaseTransformerLayer.forward` for packed sequences: only the
+        cross attention receives `memory_index`, see
+        `RNTR2MultiheadAttention.forward`."""
+        norm_index = 0
+        attn_index = 0
+        ffn_index = 0
+        identity = query
+        for layer in self.operation_order:
+            if layer == 'self_attn':
+                query = self.attentions[attn_index](
+                    query,
+                    query,
+                    query,
+                    identity if self.pre_norm else None,
+                    query_pos=query_pos,
+                    key_pos=query_pos,
+                    attn_mask=attn_masks[attn_index])
+                attn_index += 1
+                identity = query
+            elif layer == 'norm':
+                query = self.norms[norm_index](query)
+                norm_index += 1
+            elif layer == 'cross_attn':
+                query = self.attentions[attn_index](
+                    query,
+                    key,
+                    value,
+                    identity if self.pre_norm else None,
+                    query_pos=query_pos,
+                    key_pos=key_pos,
+                    attn_mask=attn_masks[attn_index],
+                    memory_index=memory_index)
+                attn_index += 1
+                identity = query
+            elif layer == 'ffn':
+                query = self.ffns[ffn_index](
+                    query, identity if self.pre_norm else None)
+                ffn_index += 1
+        return query
+
     def forward(self, 
                 query,
                 key=None,
@@ -2081,6 +2512,7 @@ class PETRLineTransformerDecoderLayer(BaseTransformerLayer):
                 attn_masks=None,
                 query_key_padding_mask=None,
                 key_padding_mask=None,
+                memory_index=None,
                 **kwargs
                 ):
         """Forward function for `TransformerCoder`.
@@ -2099,6 +2531,7 @@ class PETRLineTransformerDecoderLayer(BaseTransformerLayer):
                 attn_masks,
                 query_key_padding_mask,
                 key_padding_mask,
+                memory_index,
                 )
         else:
             x = self._forward(
@@ -2109,10 +2542,70 @@ class PETRLineTransformerDecoderLayer(BaseTransformerLayer):
             key_pos=key_pos,
             attn_masks=attn_masks,
             query_key_padding_mask=query_key_padding_mask,
-            key_padding_mask=key_padding_mask
+            key_padding_mask=key_padding_mask,
+            memory_index=memory_index
             )
         return x
 
+    def forward_step(self,
+                     query,
+                     query_pos=None,
+                     self_attn_mask=None,
+                     cache=None,
+                     position=None):
+        """Incremental decoding over the newly fed positions only.
+        Follows `operation_order` like `BaseTransformerLayer.forward`, but
+        the self attention reads and extends `cache['self_attn']` and the
+        cross attention reads the memory prepared in `cache['cross_attn']`.
+        Returns:
+            Tensor: forwarded results with shape [num_new, bs, embed_dims].
+        """
+        norm_index = 0
+        attn_index = 0
+        ffn_index = 0
+        identity = query
+        for layer in self.operation_order:
+            if layer == 'self_attn':
+                query = self.attentions[attn_index].forward_step(
+                    query,
+                    query,
+                    query,
+                    identity if self.pre_norm else None,
+                    query_pos=query_pos,
+                    key_pos=query_pos,
+                    attn_mask=self_attn_mask,
+                    cache=cache['self_attn'],
+                    position=position)
+                attn_index += 1
+                identity = query
+            elif layer == 'norm':
+                query = self.norms[norm_index](query)
+                norm_index += 1
+            elif layer == 'cross_attn':
+                query = self.attentions[attn_index].forward_step(
+                    query,
+                    identity=identity if self.pre_norm else None,
+                    query_pos=query_pos,
+                    cache=cache['cross_attn'],
+                    static_kv=True)
+                attn_index += 1
+                identity = query
+            elif layer == 'ffn':
+                query = self.ffns[ffn_index](
+                    query, identity if self.pre_norm else None)
+                ffn_index += 1
+        return query
+
+    def prepare_memory(self, key, value=None, key_pos=None, cache=None):
+        """Project the memory for the cross attention once, so that
+        :meth:`forward_step` can reuse it at every decoding step."""
+        attn_order = [op for op in self.operation_order
+                      if op in ('self_attn', 'cross_attn')]
+        cross_attn = self.attentions[attn_order.index('cross_attn')]
+        cache['cross_attn'] = cross_attn.prepare_kv(
+            key, value, key_pos, dict())
+        return cache
+
 
 @MODELS.register_module()
 class RNTRLineFlashTransformerDecoderLayer(BaseModule):
@@ -0,0 +1,112 @@
+import math
+
+import numpy as np
+from torch.utils.data import BatchSampler, Sampler
+from mmengine.fileio import load
+from mmdet3d.registry import DATA_SAMPLERS
+
+
+@DATA_SAMPLERS.register_module()
+class LengthBucketBatchSampler(BatchSampler):
+    """Batch sampler grouping samples of similar target sequence length.
+
+    The samples are split into `num_buckets` buckets of equal size by
+    sequence length, so the sequences of a batch are padded to about the
+    same length. Every epoch the samples are shuffled within their bucket
+    and the batches across buckets. The batches are planned for all ranks
+    at once and split between them, so every rank runs the same number of
+    batches.
+
+    With `max_tokens`, every bucket uses the largest batch whose padded
+    token count, `batch size * longest sequence of the bucket`, fits into
+    it, with `batch_size` as upper bound.
+
+    The shuffle seed and epoch come from `sampler`, which is the
+    `DefaultSampler` built by the runner, so `DistSamplerSeedHook` keeps
+    working.
+
+    Args:
+        sampler (Sampler): sampler of the dataset, only its `dataset`,
+            `seed`, `epoch`, `shuffle`, `rank` and `world_size` are used.
+        batch_size (int): samples per batch and rank.
+        length_file (str, optional): sequence length of every sample by its
+            token, see `tools/compute_seq_lengths.py`. Without it the number
+            of centerline points is used as length. Default: None.
+        num_buckets (int): Default: 10.
+        max_tokens (int, optional): token budget of a batch. Default: None.
+        drop_last (bool): drop the last incomplete batch of every bucket.
+            Default: False.
+    """
+
+    def __init__(self,
+                 sampler: Sampler,
+                 batch_size: int,
+                 length_file=None,
+                 num_buckets=10,
+                 max_tokens=None,
+                 drop_last=False) -> None:
+        self.sampler = sampler
+        self.batch_size = batch_size
+        self.max_tokens = max_tokens
+        self.drop_last = drop_last
+        self.rank = getattr(sampler, 'rank', 0)
+        self.world_size = getattr(sampler, 'world_size', 1)
+
+        dataset = sampler.dataset
+        if length_file is not None:
+            lengths = load(length_file)
+            self.lengths = np.array([
+                lengths[dataset.get_data_info(i)['token']]
+                for i in range(len(dataset))])
+        else:
+            self.lengths = np.array([
+                dataset.get_data_info(i)['num_points']
+                for i in range(len(dataset))])
+
+        order = np.argsort(self.lengths, kind='stable')
+        self.buckets = [
+            bucket for bucket in np.array_split(order, num_buckets)
+            if len(bucket)]
+        self.bucket_batch_sizes = [
+            self._bucket_batch_size(int(self.lengths[bucket].max()))
+            for bucket in self.buckets]
+
+    def _bucket_batch_size(self, max_len):
+        if self.max_tokens is None:
+            return self.batch_size
+        return max(1, min(self.batch_size, self.max_tokens // max(max_len, 1)))
+
+    def _num_batches(self, size, batch_size):
+        if self.drop_last:
+            return size // batch_size
+        return math.ceil(size / batch_size)
+
+    def _plan(self):
+        """Batches of all ranks for the current epoch."""
+        shuffle = getattr(self.sampler, 'shuffle', True)
+        rng = np.random.default_rng(
+            getattr(self.sampler, 'seed', 0) + getattr(self.sampler, 'epoch', 0))
+        batches = []
+        for bucket, batch_size in zip(self.buckets, self.bucket_batch_sizes):
+            if shuffle:
+                bucket = rng.permutation(bucket)
+            num_batches = self._num_batches(len(bucket), batch_size)
+            batches.extend(
+                bucket[i * batch_size:(i + 1) * batch_size].tolist()
+                for i in range(num_batches))
+        if shuffle:
+            batches = [batches[i] for i in rng.permutation(len(batches))]
+        if not batches:
+            return []
+        # every rank gets the same number of batches
+        total = len(self) * self.world_size
+        return (batches * math.ceil(total / len(batches)))[:total]
+
+    def __iter__(self):
+        yield from self._plan()[self.rank::self.world_size]
+
+    def __len__(self) -> int:
+        num_batches = sum(
+            self._num_batches(len(bucket), batch_size)
+            for bucket, batch_size in zip(self.buckets, self.bucket_batch_sizes))
+        return math.ceil(num_batches / self.world_size)
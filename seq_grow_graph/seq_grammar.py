@@ -0,0 +1,117 @@
+import torch
+
+
+class GraphSeqGrammar:
+    """Finite-state description of the SeqGrowGraph token sequence.
+
+    A sequence is ``start (node)* end`` with every node serialized as::
+
+        x y idx (parent_idx coeff*)* split_connect (child_idx coeff*)* split_node
+
+    where coordinates live in ``[0, idx_start)``, node indices in
+    ``[idx_start, coeff_start)`` and Bezier coefficients in
+    ``[coeff_start, coeff_start + num_bz_coords)``, see `TransformGraph2Seq`.
+    The last coefficient, ``coeff_start + num_bz_coords - 1`` (569) at the
+    far edge of the Bezier grid, shares its id with the split_lines token of
+    other sequence formats, which `TransformGraph2Seq` never emits, so it is
+    a coefficient here. The grammar keeps
+    a state and a coefficient counter per row, gives the tokens allowed next
+    as a bool mask and advances all rows at once.
+
+    Args:
+        num_classes (int): Vocabulary size. Default: 576.
+        n_control (int): Number of Bezier control points, each edge carries
+            ``2 * (n_control - 2)`` coefficient tokens. Default: 3.
+        num_coords (int): Number of coordinate tokens. Default: 200.
+        num_bz_coords (int): Number of coefficient tokens, the cells of the
+            Bezier grid along an axis (`bz_nx`). Default: 220.
+    """
+    START, NODE_X, NODE_Y, NODE_IDX, PARENT, PARENT_COEFF, CHILD, \
+        CHILD_COEFF, END = range(9)
+
+    def __init__(self,
+                 num_classes=576,
+                 n_control=3,
+                 num_coords=200,
+                 idx_start=250,
+                 coeff_start=350,
+                 num_bz_coords=220,
+                 split_connect=571,
+                 split_node=572,
+                 end=573,
+                 start=574):
+        self.num_classes = num_classes
+        self.num_coeff = 2 * (n_control - 2)
+        coeff_end = coeff_start + num_bz_coords
+
+        allowed = torch.zeros(9, num_classes, dtype=torch.bool)
+        allowed[self.START, start] = True
+        allowed[self.NODE_X, :num_coords] = True
+        allowed[self.NODE_X, end] = True
+        allowed[self.NODE_Y, :num_coords] = True
+        allowed[self.NODE_IDX, idx_start:coeff_start] = True
+        allowed[self.PARENT, idx_start:coeff_start] = True
+        allowed[self.PARENT, split_connect] = True
+        allowed[self.PARENT_COEFF, coeff_start:coeff_end] = True
+        allowed[self.CHILD, idx_start:coeff_start] = True
+        allowed[self.CHILD, split_node] = True
+        allowed[self.CHILD_COEFF, coeff_start:coeff_end] = True
+        allowed[self.END, end] = True
+        self.allowed_tokens = allowed
+
+        # next state of (state, token), rows without an entry keep their state
+        parent_edge = self.PARENT_COEFF if self.num_coeff > 0 else self.PARENT
+        child_edge = self.CHILD_COEFF if self.num_coeff > 0 else self.CHILD
+        transitions = torch.arange(9).view(9, 1).repeat(1, num_classes)
+        transitions[self.START, start] = self.NODE_X
+        transitions[self.NODE_X, :num_coords] = self.NODE_Y
+        transitions[self.NODE_X, end] = self.END
+        transitions[self.NODE_Y, :num_coords] = self.NODE_IDX
+        transitions[self.NODE_IDX, idx_start:coeff_start] = self.PARENT
+        transitions[self.PARENT, idx_start:coeff_start] = parent_edge
+        transitions[self.PARENT, split_connect] = self.CHILD
+        transitions[self.PARENT_COEFF, coeff_start:coeff_end] = self.PARENT
+        transitions[self.CHILD, idx_start:coeff_start] = child_edge
+        transitions[self.CHILD, split_node] = self.NODE_X
+        transitions[self.CHILD_COEFF, coeff_start:coeff_end] = self.CHILD
+        self.transitions = transitions
+
+    def init_state(self, prompt):
+        """Grammar state after the prompt tokens.
+
+        Args:
+            prompt (Tensor): Tokens with shape [B, L], starting with `start`.
+        Returns:
+            tuple[Tensor]: state and coefficient counter, each of shape [B].
+        """
+        state = prompt.new_full(prompt.shape[:1], self.START)
+        count = torch.zeros_like(state)
+        for i in range(prompt.shape[1]):
+            state, count = self.update(state, count, prompt[:, i])
+        return state, count
+
+    def allowed(self, state):
+        """Bool mask with shape [B, num_classes] of the tokens allowed
+        next."""
+        self.allowed_tokens = self.allowed_tokens.to(state.device)
+        return self.allowed_tokens[state]
+
+    def update(self, state, count, tokens):
+        """Advance every row by one token.
+
+        Args:
+            state (Tensor): Current states with shape [B].
+            count (Tensor): Coefficients emitted for the current edge.
+            tokens (Tensor): The emitted tokens with shape [B].
+        Returns:
+            tuple[Tensor]: The new state and counter.
+        """
+        self.transitions = self.transitions.to(state.device)
+        next_state = self.transitions[state, tokens.long()]
+        in_coeff = (state == self.PARENT_COEFF) | (state == self.CHILD_COEFF)
+        count = torch.where(in_coeff, count + 1, torch.zeros_like(count))
+        # stay on the edge until all of its coefficients are emitted
+        edge_done = count >= self.num_coeff
+        next_state = torch.where(in_coeff & ~edge_done, state, next_state)
+        count = torch.where(edge_done, torch.zeros_like(count), count)
+        return next_state, count
@@ -1,4 +1,5 @@
 import os
+from functools import partial
 import cv2
 import torch
 import torch.nn as nn
@@ -47,6 +48,7 @@ class SeqGrowGraph(MVXTwoStageDetector):
                  max_box_num=700, #>=660+2
                  init_cfg=None,
                  data_preprocessor=None,front_camera_only=False,vis_dir="original",
+                 pack_len=None,
                  ):
         super(SeqGrowGraph, self).__init__(pts_voxel_layer, pts_middle_encoder,
                                                         pts_fusion_layer, img_backbone, pts_backbone,
@@ -57,6 +59,8 @@ class SeqGrowGraph(MVXTwoStageDetector):
         self.use_grid_mask = use_grid_mask
         self.front_camera_only=front_camera_only
         self.vis_dir=vis_dir
+        # token budget of a packed training row, None pads to the longest
+        self.pack_len = pack_len
         # data_aug_conf = {
         #     'final_dim': (128, 352),
         #     'H': 900, 'W': 1600,
@@ -158,6 +162,17 @@ class SeqGrowGraph(MVXTwoStageDetector):
         bev_feats = self.view_transformers(img_feats[down_level], img_metas)
         return bev_feats
 
+    def get_bev_feats(self, inputs, img_metas):
+        """BEV features of a batch. They are read from `inputs['bev_feats']`
+        when the pipeline loads them from a feature store (`LoadBEVFeatures`),
+        otherwise they are extracted from the images."""
+        bev_feats = inputs.get('bev_feats')
+        if bev_feats is None:
+            return self.extract_feat(img=inputs['img'], img_metas=img_metas)
+        if isinstance(bev_feats, list):
+            bev_feats = torch.stack(bev_feats, dim=0)
+        return bev_feats.float()
+
     def forward_pts_train(self,
                           bev_feats,
                           gt_lines_sequences,
@@ -176,26 +191,32 @@ class SeqGrowGraph(MVXTwoStageDetector):
         Returns:
             dict: Losses of each branch.
         """
-        device = bev_feats[0].device
-
-        input_seqs = []
+        if getattr(self.pts_bbox_head, 'predict_clauses', False):
+            return self.pts_bbox_head.loss_by_seqs(bev_feats, gt_lines_sequences)
 
-        max_len = max([len(target) for target in gt_lines_sequences])
+        device = bev_feats[0].device
 
         coeff_dim = num_coeff * 2
-        
 
-        input_seqs=[]
-        for gt_lines_sequence in gt_lines_sequences:
-            input_seq= [self.start]+gt_lines_sequence+[self.end]+[self.no_known]*(max_len-len(gt_lines_sequence))
-            input_seq=torch.tensor(input_seq, device=device).long()
-            input_seqs.append(input_seq.unsqueeze(0))
-
-            
- 
-        input_seqs = torch.cat(input_seqs , dim=0)  # [8,501]
- 
-        outputs = self.pts_bbox_head(bev_feats, input_seqs, img_metas)[-1, :, :-1, :]
+        # logits of the last decoder layer at the non-padding positions only
+        if self.pack_len is not None:
+            seqs = [[self.start] + gt_lines_sequence + [self.end]
+                    for gt_lines_sequence in gt_lines_sequences]
+            loss_fn = partial(self.pts_bbox_head.loss_by_packed_tokens,
+                              bev_feats, seqs, self.pack_len, self.no_known)
+        else:
+            max_len = max([len(target) for target in gt_lines_sequences])
+            input_seqs = []
+            for gt_lines_sequence in gt_lines_sequences:
+                input_seq = [self.start] + gt_lines_sequence + [self.end] + [self.no_known] * (max_len - len(gt_lines_sequence))
+                input_seq = torch.tensor(input_seq, device=device).long()
+                input_seqs.append(input_seq.unsqueeze(0))
+            input_seqs = torch.cat(input_seqs, dim=0)  # [8,501]
+            loss_fn = partial(self.pts_bbox_head.loss_by_tokens,
+                              bev_feats, input_seqs, self.no_known)
+        losses = loss_fn()
+        if getattr(self.pts_bbox_head, 'draft_transformer', None) is not None:
+            losses['loss_draft'] = loss_fn(draft=True)['loss_coords']
 
        
         clause_length = 4 + coeff_dim
@@ -230,24 +251,15 @@ class SeqGrowGraph(MVXTwoStageDetector):
 
         # =============================================
         
-        outputs = outputs.reshape(-1, self.num_center_classes)  # [602, 2003] last layer
-        input_seqs=input_seqs[:,1:]
-        input_seqs=input_seqs.flatten()
-        gt_seqs_pad=input_seqs[input_seqs!=self.no_known]
-        outputs=outputs[input_seqs!=self.no_known]
-
-        losses = self.pts_bbox_head.loss_by_feat_seq(outputs, gt_seqs_pad)
-
         return losses
     
     def loss(self,
              inputs=None,
              data_samples=None,**kwargs):
 
-        img = inputs['img']
         img_metas = [ds.metainfo for ds in data_samples]
 
-        bev_feats = self.extract_feat(img=img, img_metas=img_metas)
+        bev_feats = self.get_bev_feats(inputs, img_metas)
         if self.bev_scale != 1.0:
             b, c, h, w = bev_feats.shape
             bev_feats = F.interpolate(bev_feats, (int(h * self.bev_scale), int(w * self.bev_scale)))
@@ -288,8 +300,8 @@ class SeqGrowGraph(MVXTwoStageDetector):
                 contains a tensor with shape (num_instances, 7).
         """
         batch_input_metas = [item.metainfo for item in batch_data_samples]
-        batch_input_imgs = batch_inputs_dict['img']
-        return self.simple_test(batch_input_metas, batch_input_imgs)
+        bev_feats = self.get_bev_feats(batch_inputs_dict, batch_input_metas)
+        return self.simple_test(batch_input_metas, bev_feats=bev_feats)
 
     def simple_test_pts(self, pts_feats, img_metas):
         """Test function of point cloud branch."""
@@ -319,11 +331,12 @@ class SeqGrowGraph(MVXTwoStageDetector):
             ))
         return line_results
 
-    def simple_test(self, img_metas, img=None):
+    def simple_test(self, img_metas, img=None, bev_feats=None):
         """Test function without augmentaiton."""
         
 
-        bev_feats = self.extract_feat(img=img, img_metas=img_metas)
+        if bev_feats is None:
+            bev_feats = self.extract_feat(img=img, img_metas=img_metas)
         bbox_list = [dict() for i in range(len(img_metas))]
         line_results = self.simple_test_pts(
             bev_feats, img_metas)
@@ -344,3 +357,75 @@ class SeqGrowGraph(MVXTwoStageDetector):
 
         return bbox_list
 
+    def parse_node_seq(self, node_seq, n_control, decoded=None):
+        """Parse the tokens of one node, i.e. the tokens before its
+        `split_node`, the way `EvalSeq2Graph` parses a whole sequence.
+        Args:
+            node_seq (list[int]): ``x y idx (parent_idx coeff*)*
+                split_connect (child_idx coeff*)*``.
+            n_control (int): Number of Bezier control points.
+            decoded (set[int], optional): Indices of the nodes parsed so
+                far, edges to other nodes are dropped.
+        Returns:
+            dict | None: `index`, `coord` on the BEV grid, and `parents` /
+                `childs` as lists of (index, coeff) with the inner control
+                points `coeff` of shape [n_control - 2, 2] on the same grid.
+                None if the node is malformed.
+        """
+        if len(node_seq) < 3 or node_seq[2] < self.idx_start:
+            return None
+        if self.split_connect in node_seq:
+            split_connect_idx = node_seq.index(self.split_connect)
+        else:
+            split_connect_idx = len(node_seq)
+        edge_len = 1 + 2 * (n_control - 2)
+        edges = []
+        for edge_seq in (node_seq[3:split_connect_idx],
+                         node_seq[split_connect_idx + 1:]):
+            stop_idx = len(edge_seq) // edge_len * edge_len
+            edge_seq = np.array(edge_seq[:stop_idx]).reshape(-1, edge_len)
+            connections = []
+            for edge in edge_seq:
+                index = int(edge[0]) - self.idx_start
+                if decoded is not None and index not in decoded:
+                    continue
+                coeff = (edge[1:] - self.coeff_start).reshape(-1, 2)
+                coeff = coeff * self.bz_dx[:2] + self.bz_pc_range[:2]
+                coeff = ((coeff - self.pc_range[:2]) / self.dx[:2]).astype(int)
+                connections.append((index, coeff))
+            edges.append(connections)
+        return dict(index=node_seq[2] - self.idx_start,
+                    coord=np.array(node_seq[:2]),
+                    parents=edges[0],
+                    childs=edges[1])
+
+    @torch.no_grad()
+    def stream_test(self, batch_inputs_dict, img_metas):
+        """Generator counterpart of :meth:`predict`.
+        Every node is yielded as soon as its `split_node` token is decoded,
+        so consumers can use the nearby topology before the rest of the
+        graph is generated. Needs a head with `iter_cached`.
+        Args:
+            batch_inputs_dict (dict): `img` or stored `bev_feats` of the
+                batch, see :meth:`get_bev_feats`.
+            img_metas (list[dict]): Meta information of samples.
+        Yields:
+            tuple[int, dict]: the index of the sample in the batch and the
+                node, see :meth:`parse_node_seq`.
+        """
+        n_control = img_metas[0]['n_control']
+        bev_feats = self.get_bev_feats(batch_inputs_dict, img_metas)
+        input_seqs = (torch.ones(bev_feats.shape[0], 1).to(bev_feats.device) * self.start).long()
+        node_seqs = [[] for _ in img_metas]
+        decoded = [set() for _ in img_metas]
+        for active, _, extra_seq in self.pts_bbox_head.iter_cached(bev_feats, input_seqs):
+            for bi, token in zip(active.tolist(), extra_seq[:, 0].tolist()):
+                if token == self.split_node:
+                    node = self.parse_node_seq(node_seqs[bi], n_control, decoded[bi])
+                    node_seqs[bi] = []
+                    if node is not None:
+                        decoded[bi].add(node['index'])
+                        yield bi, node
+                elif token not in (self.end, self.no_known):
+                    node_seqs[bi].append(token)
+
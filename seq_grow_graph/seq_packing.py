@@ -0,0 +1,68 @@
+import torch
+
+
+def pack_sequences(lengths, pack_len):
+    """Group sequences into rows of at most `pack_len` tokens with first-fit
+    decreasing. A sequence longer than `pack_len` gets a row of its own.
+    Args:
+        lengths (list[int]): length of every sequence.
+        pack_len (int): token budget of a row.
+    Returns:
+        list[list[int]]: the sequence indices of every row.
+    """
+    rows, sizes = [], []
+    for i in sorted(range(len(lengths)), key=lambda i: -lengths[i]):
+        for row, size in enumerate(sizes):
+            if size + lengths[i] <= pack_len:
+                rows[row].append(i)
+                sizes[row] += lengths[i]
+                break
+        else:
+            rows.append([i])
+            sizes.append(lengths[i])
+    return rows
+
+
+def build_packed_batch(seqs, pack_len, pad=575, device=None):
+    """Pack token sequences of a batch into dense rows for teacher forcing.
+    Every token attends causally within its own sequence only, and
+    predicts the next token of that sequence; the last token of every
+    sequence and the padding predict `pad`, which the loss ignores.
+    Args:
+        seqs (list[list[int]]): `start`, the target tokens and `end` of
+            every sample.
+        pack_len (int): token budget of a row, see :func:`pack_sequences`.
+        pad (int): padding token. Default: 575.
+    Returns:
+        dict[str, Tensor]: with shape [num_rows, L], L being the longest row,
+            `input_seqs`, `targets`, `position_ids` restarting at 0 for
+            every sequence, `memory_index` the sample of every token (-1 for
+            padding), and the bool `attn_mask` [num_rows, L, L], True means
+            attend.
+    """
+    rows = pack_sequences([len(seq) for seq in seqs], pack_len)
+    L = max(sum(len(seqs[i]) for i in row) for row in rows)
+    input_seqs = torch.full((len(rows), L), pad, dtype=torch.long)
+    targets = torch.full((len(rows), L), pad, dtype=torch.long)
+    position_ids = torch.zeros((len(rows), L), dtype=torch.long)
+    memory_index = torch.full((len(rows), L), -1, dtype=torch.long)
+    for r, row in enumerate(rows):
+        start = 0
+        for i in row:
+            seq = torch.as_tensor(seqs[i], dtype=torch.long)
+            end = start + len(seq)
+            input_seqs[r, start:end] = seq
+            targets[r, start:end - 1] = seq[1:]
+            position_ids[r, start:end] = torch.arange(len(seq))
+            memory_index[r, start:end] = i
+            start = end
+
+    # padding attends to itself only, so no row of the mask is empty
+    segment = torch.where(memory_index >= 0, memory_index,
+                          -1 - torch.arange(L)[None])
+    attn_mask = (segment[:, :, None] == segment[:, None, :]) \
+        & torch.ones(L, L, dtype=torch.bool).tril()
+    batch = dict(input_seqs=input_seqs, targets=targets,
+                 position_ids=position_ids, memory_index=memory_index,
+                 attn_mask=attn_mask)
+    return {k: v.to(device) for k, v in batch.items()}
@@ -21,6 +21,7 @@ from .transform_3d import (
     )
 from .loading import (
     OrgLoadMultiViewImageFromFiles,
+    ReducedLoadMultiViewImageFromFiles,
     LoadMultiViewImageFromMultiSweepsFiles,
     LoadMapsFromFiles, 
     LoadAnnotationsLine3D, 
@@ -56,14 +57,15 @@ from .loading import (
     TransformUnitOrderedBzLane2Graph, 
     LoadRoadSegmentation, 
     LoadNusClearOrderedBzCenterline, 
-    TransformLaneGraph, TransformGraph2Seq,LoadNusOrderedBzCenterlineFrontCamera
+    TransformLaneGraph, TransformGraph2Seq,LoadNusOrderedBzCenterlineFrontCamera,
+    LoadBEVFeatures
     )
 from .formating import Pack3DCenterlineInputs
 from .roadnet_reach_dist_eval import BzRoadnetReachDistEval
 from .roadnet_reach_dist_eval_new import BzRoadnetReachDistEvalNew
 from .roadnet_reach_dist_eval_aaai import BzRoadnetReachDistEvalAAAI
 __all__ = [
-    'OrgLoadMultiViewImageFromFiles',
+    'OrgLoadMultiViewImageFromFiles', 'ReducedLoadMultiViewImageFromFiles',
     'PadMultiViewImage', 'NormalizeMultiviewImage', 'PhotoMetricDistortionMultiViewImage', 'LoadMultiViewImageFromMultiSweepsFiles','LoadMapsFromFiles',
     'ResizeMultiview3D','MSResizeCropFlipImage','AlbuMultiview3D','ResizeCropFlipImage','GlobalRotScaleTransImage', 'LoadAnnotationsLine3D',
     'ShuffleLane', 'LoadMiddleSegFromFiles', 'LoadDepthFromLidar', 'LoadCenterlineFromFiles',
@@ -74,5 +76,6 @@ __all__ = [
     'LoadMonoPryOrderedBzCenterline', 'MonoCenterlineRotateScale', 'LoadMonoPryOrderedBzPlCenterline', 
     'LoadAV2OrderedBzCenterline', 'TransformAV2OrderedBzLane2Graph', 'LoadAV2OrderedBzCenterline_new', 'TransformAV2OrderedBzLane2Graph_new',
     'LoadAV2OrderedBzCenterline_test', 'LoadUnitOrderedBzCenterline', 'TransformUnitOrderedBzLane2Graph', 'LoadRoadSegmentation', 'RoadSegFlip', 
-    'RoadSegRotateScale', 'LoadNusClearOrderedBzCenterline', 'TransformLaneGraph', 'Pack3DCenterlineInputs', 'BzRoadnetReachDistEval','BzRoadnetReachDistEvalNew','LoadNusOrderedBzCenterlineFrontCamera'
+    'RoadSegRotateScale', 'LoadNusClearOrderedBzCenterline', 'TransformLaneGraph', 'Pack3DCenterlineInputs', 'BzRoadnetReachDistEval','BzRoadnetReachDistEvalNew','LoadNusOrderedBzCenterlineFrontCamera',
+    'LoadBEVFeatures'
     ]
\ No newline at end of file
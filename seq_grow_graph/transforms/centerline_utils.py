@@ -2,7 +2,6 @@ import torch
 import mmcv
 import os
 import numpy as np
-from math import factorial
 from tqdm import tqdm
 import cv2
 import imageio
@@ -10,6 +9,8 @@ import copy
 import time
 import warnings
 import pdb
+from projects.SeqGrowGraph.seq_grow_graph.core.centerline.bezier import get_bezier_coeff
+from projects.SeqGrowGraph.seq_grow_graph.core.centerline.ragged import unpack_centerlines
 
 class Node(object):
     def __init__(self, position):
@@ -523,7 +524,7 @@ class SceneGraph(object):
 class LaneLine2NodesConverter(object):
     def __init__(self, results):
         self.results = results
-        self.centerlines = results['center_lines']
+        self.centerlines = unpack_centerlines(results['center_lines'])
         self.centerline_ids = self.centerlines['centerline_ids']
         self.incoming_ids = self.centerlines['incoming_ids']
         self.outgoing_ids = self.centerlines['outgoing_ids']
@@ -708,33 +709,6 @@ def sentance2seq(sentance, pc_range, dx):
     return  seq
 
 
-def comb(n, k):
-    return factorial(n) // (factorial(k) * factorial(n - k))
-
-
-def get_bezier_coeff(points, n_control):
-    """points.shape: [n, 2]"""
-    if len(points)<10:
-        points = np.linspace(points[0], points[-1], num=10)
-    n_points = len(points)
-    A = np.zeros((n_points, n_control))
-    t = np.arange(n_points) / (n_points - 1)
-
-    for i in range(n_points):
-        for j in range(n_control):
-            A[i, j] = comb(n_control - 1, j) * np.power(1 - t[i], n_control - 1 - j) * np.power(t[i], j)
-    A_BE = A[:, 1:-1]  # (L. N-2)
-    points_BE = points - np.stack(
-        ((A[:, 0] * points[0][0] + A[:, -1] * points[-1][0]), (A[:, 0] * points[0][1] + A[:, -1] * points[-1][1]))).T
-    try:
-        conts = np.linalg.lstsq(A_BE, points_BE, rcond=None)
-    except:
-        raise Exception("Maybe there are some lane whose point number is one!")
-
-    res = conts[0]
-    fin_res = np.r_[[points[0]], res, [points[-1]]]
-    # fin_res = fin_res.astype(int)
-    return fin_res
 
 
 
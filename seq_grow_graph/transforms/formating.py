@@ -46,7 +46,7 @@ def to_tensor(
 
 @TRANSFORMS.register_module()
 class Pack3DCenterlineInputs(BaseTransform):
-    INPUTS_KEYS = ['points', 'img', 'center_seg']
+    INPUTS_KEYS = ['points', 'img', 'center_seg', 'bev_feats']
     INSTANCEDATA_3D_KEYS = [
         'gt_bboxes_3d', 'gt_labels_3d', 'attr_labels', 'depths', 'centers_2d'
     ]
@@ -177,6 +177,10 @@ class Pack3DCenterlineInputs(BaseTransform):
                 center_seg = to_tensor(np.ascontiguousarray(center_seg))
             results['center_seg'] = center_seg
 
+        if 'bev_feats' in results:
+            results['bev_feats'] = to_tensor(
+                np.ascontiguousarray(results['bev_feats']))
+
         for key in [
                 'proposals', 'gt_bboxes', 'gt_bboxes_ignore', 'gt_labels',
                 'gt_bboxes_labels', 'attr_labels', 'pts_instance_mask',
@@ -18,9 +18,12 @@ from .depth_map_utils import fill_in_multiscale
 from projects.SeqGrowGraph.seq_grow_graph.bz_roadnet_reach_dist_eval import get_geom
 from .centerline_utils import SceneGraph, sentance2seq, sentance2bzseq, sentance2bzseq2, nodesbetween2seq,sentance2bzseqNew
 from projects.SeqGrowGraph.seq_grow_graph.core.centerline import PryCenterLine, PryOrederedCenterLine, OrderedSceneGraph, NusOrederedBzCenterLine, NusOrederedRMcontinuedBzCenterLine,OrderedBzLaneGraph, OrderedBzSceneGraph, OrderedBzSceneGraphNew,OrderedBzPlSceneGraph, PryOrederedBzPlCenterLine, get_semiAR_seq, match_keypoints, float2int, get_semiAR_seq_fromInt, PryMonoOrederedBzCenterLine, PryMonoOrederedBzPlCenterLine, AV2OrederedBzCenterLine, AV2OrderedBzSceneGraph, AV2OrderedBzLaneGraph, AV2OrederedRMcontinuedBzCenterLine,AV2OrederedBzCenterLine_new, AV2OrderedBzSceneGraph_new, NusOrederedBzCenterLine, NusClearOrederedBzCenterLine, Laneseq2Graph,NusOrederedBzCenterLineIsometry,NusOrederedBzCenterLineEqualQuantity,NusOrederedBzCenterLineRandomCam
+from projects.SeqGrowGraph.seq_grow_graph.core.centerline.ragged import unpack_centerlines
 from projects.SeqGrowGraph.seq_grow_graph.core.centerline import seq2nodelist, EvalMapGraph, seq2bznodelist, EvalMapBzGraph, EvalMapBzPlGraph, convert_coeff_coord, seq2bzplnodelist, convert_plcoeff_coord
 from projects.SeqGrowGraph.seq_grow_graph.core.centerline.structures.pryordered_bz_centerline import divide_line_with_shapely, split_line_include_original_points
-from math import factorial
+from projects.SeqGrowGraph.seq_grow_graph.bev_feature_store import BEVFeatureStore, NO_AUG, store_key
+from projects.SeqGrowGraph.seq_grow_graph.gt_seq_cache import GTSequenceCache, LazyCenterLine, annotation_fingerprint
+from projects.SeqGrowGraph.seq_grow_graph.core.centerline.bezier import get_bezier_coeffs
 
 LOCATIONS = ['boston-seaport', 'singapore-onenorth', 'singapore-queenstown',
              'singapore-hollandvillage']
@@ -142,10 +145,7 @@ class OrgLoadMultiViewImageFromFiles(object):
         img_bytes = [
             get(name, backend_args=self.backend_args) for name in filename
         ]
-        img = [
-            mmcv.imfrombytes(img_byte, flag=self.color_type)
-            for img_byte in img_bytes
-        ]
+        img = [self._decode(img_byte) for img_byte in img_bytes]
         img = np.stack(img, axis=-1)
         if self.to_float32:
             img = img.astype(np.float32)
@@ -165,6 +165,9 @@ class OrgLoadMultiViewImageFromFiles(object):
             to_rgb=False)
         return results
 
+    def _decode(self, img_byte):
+        return mmcv.imfrombytes(img_byte, flag=self.color_type)
+
     def __repr__(self):
         """str: Return a string that describes the module."""
         repr_str = self.__class__.__name__
@@ -173,6 +176,71 @@ class OrgLoadMultiViewImageFromFiles(object):
         return repr_str
 
 
+@TRANSFORMS.register_module()
+class ReducedLoadMultiViewImageFromFiles(OrgLoadMultiViewImageFromFiles):
+    """Load multi-view images decoded at a reduced resolution.
+
+    JPEGs are decoded by libjpeg at the smallest of the 1/2, 1/4 and 1/8
+    scales still larger than any resize `ResizeCropFlipImage` samples with
+    the same `data_aug_conf`, e.g. 1/4 for `final_dim=(128, 352)` of
+    1600x900 images, which then only resizes the reduced image the rest of
+    the way. Its resize and crop are relative to the full `H` x `W` frame,
+    so the intrinsics are unchanged.
+
+    Args:
+        data_aug_conf (dict): Config of the `ResizeCropFlipImage` after.
+        training (bool): Whether the random resize of training is sampled.
+            Defaults to True.
+        to_float32 (bool): Whether to convert the img to float32.
+            Defaults to False.
+        color_type (str): 'color' or 'grayscale', 'unchanged' decodes
+            reduced JPEGs in color. Defaults to 'color'.
+    """
+
+    REDUCED_FLAGS = {
+        'color': {2: cv2.IMREAD_REDUCED_COLOR_2,
+                  4: cv2.IMREAD_REDUCED_COLOR_4,
+                  8: cv2.IMREAD_REDUCED_COLOR_8},
+        'grayscale': {2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+                      4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+                      8: cv2.IMREAD_REDUCED_GRAYSCALE_8},
+    }
+
+    def __init__(self, data_aug_conf, training=True, to_float32=False,
+                 color_type='color',
+                 backend_args: Optional[dict] = None,):
+        super().__init__(to_float32, color_type, backend_args)
+        self.data_aug_conf = data_aug_conf
+        self.training = training
+        self.reduction = self.get_reduction(data_aug_conf, training)
+
+    @staticmethod
+    def get_reduction(data_aug_conf, training=True):
+        """Largest libjpeg scale denominator that does not go below the
+        resize of `ResizeCropFlipImage`."""
+        if training:
+            resize = max(data_aug_conf['resize_lim'])
+        else:
+            fH, fW = data_aug_conf['final_dim']
+            resize = max(fH / data_aug_conf['H'], fW / data_aug_conf['W'])
+        return max(d for d in (1, 2, 4, 8) if d * resize <= 1)
+
+    def _decode(self, img_byte):
+        if self.reduction == 1:
+            return super()._decode(img_byte)
+        color_type = 'grayscale' if self.color_type == 'grayscale' else 'color'
+        flag = self.REDUCED_FLAGS[color_type][self.reduction]
+        return cv2.imdecode(np.frombuffer(img_byte, np.uint8), flag)
+
+    def __repr__(self):
+        """str: Return a string that describes the module."""
+        repr_str = self.__class__.__name__
+        repr_str += f'(reduction=1/{self.reduction}, '
+        repr_str += f'to_float32={self.to_float32}, '
+        repr_str += f"color_type='{self.color_type}')"
+        return repr_str
+
+
 @TRANSFORMS.register_module()
 class LoadFrontViewImageFromFiles(object):
     """Load multi channel images from a list of separate channel files.
@@ -277,7 +345,7 @@ class LoadMonoCenterlineSegFromPkl(object):
                 - img_norm_cfg (dict): Normalization configuration of images.
         """
         centerline_seg = np.zeros((int(self.nx[1]), int(self.nx[0])))
-        center_lines = results['center_lines']['centerlines']
+        center_lines = unpack_centerlines(results['center_lines'])['centerlines']
         for i in range(len(center_lines)):
             center_line = center_lines[i]
             inbev_x = np.logical_and(
@@ -623,33 +691,6 @@ class NoiseOrderedLane2Graph(object):
         return results
 
 
-def comb(n, k):
-    return factorial(n) // (factorial(k) * factorial(n - k))
-
-
-def get_bezier_coeff(points, n_control):
-    """points.shape: [n, 2]"""
-    if len(points)<10:
-        points = np.linspace(points[0], points[-1], num=10)
-    n_points = len(points)
-    A = np.zeros((n_points, n_control))
-    t = np.arange(n_points) / (n_points - 1)
-
-    for i in range(n_points):
-        for j in range(n_control):
-            A[i, j] = comb(n_control - 1, j) * np.power(1 - t[i], n_control - 1 - j) * np.power(t[i], j)
-    A_BE = A[:, 1:-1]  # (L. N-2)
-    points_BE = points - np.stack(
-        ((A[:, 0] * points[0][0] + A[:, -1] * points[-1][0]), (A[:, 0] * points[0][1] + A[:, -1] * points[-1][1]))).T
-    try:
-        conts = np.linalg.lstsq(A_BE, points_BE, rcond=None)
-    except:
-        raise Exception("Maybe there are some lane whose point number is one!")
-
-    res = conts[0]
-    fin_res = np.r_[[points[0]], res, [points[-1]]]
-    # fin_res = fin_res.astype(int)
-    return fin_res
 
 
 @TRANSFORMS.register_module()
@@ -671,13 +712,13 @@ class TransformGraph2SeqWOBezier(object):
         centerlines.sub_graph_split()  # split sub graph
         scene_graph = OrderedBzSceneGraphNew(centerlines.subgraphs_nodes, centerlines.subgraphs_adj,
                                           centerlines.subgraphs_points_in_between_nodes, self.n_control)  # subgraph dfs already
-        scene_sentance_list,adj_list,new_subgraphs_points_in_between_nodes_list = scene_graph.sequelize_new(
+        scene_sentance_list,edges_list,new_subgraphs_points_in_between_nodes_list = scene_graph.sequelize_new(
             orderedDFS=self.order)
         
 
 
         centerline_sequence_list = self.sentance2bzseqNew(
-            scene_sentance_list,adj_list, new_subgraphs_points_in_between_nodes_list,centerlines.pc_range, centerlines.dx, centerlines.bz_pc_range, centerlines.bz_nx,self.n_control)
+            scene_sentance_list,edges_list, new_subgraphs_points_in_between_nodes_list,centerlines.pc_range, centerlines.dx, centerlines.bz_pc_range, centerlines.bz_nx,self.n_control)
         
         centerline_sequence=self.seqlist2seq(centerline_sequence_list)
 
@@ -691,13 +732,13 @@ class TransformGraph2SeqWOBezier(object):
         return results
     
     
-    def sentance2bzseqNew(self,sentance,adj_list,new_subgraphs_points_in_between_nodes_list,pc_range, dx, bz_pc_range, bz_nx,ncontrol):
+    def sentance2bzseqNew(self,sentance,edges_list,new_subgraphs_points_in_between_nodes_list,pc_range, dx, bz_pc_range, bz_nx,ncontrol):
         """ for each node, seq: x, y, cls, IDX
         if type == start or continue , IDX = 0"""
 
         seq_list = []
         
-        for idx, (sub_sent,adj,new_subgraphs_points_in_between_nodes) in enumerate(zip(sentance,adj_list,new_subgraphs_points_in_between_nodes_list)):
+        for idx, (sub_sent,edges) in enumerate(zip(sentance,edges_list)):
             for node_i,node in enumerate(sub_sent):
             
                 # node.position[0], node.position[1] = (node.position[0] - pc_range[0]) / dx[0], (node.position[1] - pc_range[1]) / dx[0]
@@ -707,13 +748,13 @@ class TransformGraph2SeqWOBezier(object):
                     node.sque_index = node.sque_index + sentance[idx-1][-1].sque_index +1
                 seq = np.round(node.position[:2]).astype(int).tolist()  # x y
                 seq.append(node.sque_index)  # cls
-                father_idx = np.argwhere(adj[node_i] == -1)
+                father_idx, father_edges = edges.parents(node_i)
                 father_seq=[]
                 if len(father_idx) != 0 :
         
-                    father_idx = father_idx[np.where(father_idx < node_i)]
-                    for f_idx in father_idx:
-                        centerlines=new_subgraphs_points_in_between_nodes [(f_idx, node_i)]
+                    earlier = father_idx < node_i
+                    for f_idx, edge in zip(father_idx[earlier], father_edges[earlier]):
+                        centerlines=edges.polylines[edge]
                         if not isinstance(centerlines,tuple):
                             centerlines=centerlines,
                         for centerline in centerlines:
@@ -734,12 +775,12 @@ class TransformGraph2SeqWOBezier(object):
                             
                 seq.append(father_seq)
                 
-                child_idx=np.argwhere(adj[node_i] == 1)
+                child_idx, child_edges = edges.children(node_i)
                 child_seq=[]
                 if len(child_idx)!=0:
-                    child_idx=child_idx[np.where(child_idx < node_i)]
-                    for c_idx in child_idx:
-                        centerlines=new_subgraphs_points_in_between_nodes [(node_i, c_idx)]
+                    earlier = child_idx < node_i
+                    for c_idx, edge in zip(child_idx[earlier], child_edges[earlier]):
+                        centerlines=edges.polylines[edge]
                         if not isinstance(centerlines,tuple):
                             centerlines=centerlines,
                         for centerline in centerlines:
@@ -793,7 +834,14 @@ class TransformGraph2SeqWOBezier(object):
     
 @TRANSFORMS.register_module()
 class TransformGraph2Seq(object):
-    def __init__(self, n_control=3, orderedDFS=True,grid_conf=None):
+    """Serialize the centerline graph into `centerline_sequence`.
+
+    With `cache_dir`, the sequences of centerlines loaded lazily and left
+    untouched by augmentation are read from the `cache_split` file of
+    `tools/create_gt_seq_cache.py`, without building the centerlines.
+    """
+    def __init__(self, n_control=3, orderedDFS=True,grid_conf=None, cache_dir=None,
+                 cache_split='train'):
         self.order = orderedDFS
         self.n_control = n_control
         self.split_connect=571
@@ -802,14 +850,33 @@ class TransformGraph2Seq(object):
         self.coeff_start = 350 
         self.idx_start=250
         self.grid_conf=grid_conf
+        self.cache_dir = cache_dir
+        self.cache_split = cache_split
+        self.caches = {}
+
+    def cached_sequence(self, results):
+        centerlines = results['center_lines']
+        if self.cache_dir is None or self.grid_conf is not None \
+                or not isinstance(centerlines, LazyCenterLine) or centerlines.loaded:
+            return None
+        key = centerlines.cache_key(self.n_control, self.order)
+        if key not in self.caches:
+            self.caches[key] = GTSequenceCache(self.cache_dir, key, self.cache_split)
+        return self.caches[key].get(
+            results['token'], annotation_fingerprint(centerlines.annotation))
 
     def __call__(self, results):
+        centerline_sequence = self.cached_sequence(results)
+        if centerline_sequence is not None:
+            results['centerline_sequence'] = list(centerline_sequence)
+            results['n_control'] = self.n_control
+            return results
         centerlines = results['center_lines']
         nodes, nodes_adj = centerlines.export_node_adj()  # get nodes and adj
         centerlines.sub_graph_split()  # split sub graph
         scene_graph = OrderedBzSceneGraphNew(centerlines.subgraphs_nodes, centerlines.subgraphs_adj,
                                           centerlines.subgraphs_points_in_between_nodes, self.n_control)  # subgraph dfs already
-        scene_sentance_list,adj_list,new_subgraphs_points_in_between_nodes_list = scene_graph.sequelize_new(
+        scene_sentance_list,edges_list,new_subgraphs_points_in_between_nodes_list = scene_graph.sequelize_new(
             orderedDFS=self.order)
         
         if self.grid_conf is not None:
@@ -818,7 +885,7 @@ class TransformGraph2Seq(object):
             pc_range=centerlines.pc_range
 
         centerline_sequence_list = self.sentance2bzseqNew(
-            scene_sentance_list,adj_list, new_subgraphs_points_in_between_nodes_list,pc_range, centerlines.dx, centerlines.bz_pc_range, centerlines.bz_nx,self.n_control)
+            scene_sentance_list,edges_list, new_subgraphs_points_in_between_nodes_list,pc_range, centerlines.dx, centerlines.bz_pc_range, centerlines.bz_nx,self.n_control)
         
         centerline_sequence=self.seqlist2seq_with_start(centerline_sequence_list)
         results['centerline_sequence'] = centerline_sequence
@@ -826,13 +893,14 @@ class TransformGraph2Seq(object):
         return results
     
     
-    def sentance2bzseqNew(self,sentance,adj_list,new_subgraphs_points_in_between_nodes_list,pc_range, dx, bz_pc_range, bz_nx,ncontrol):
+    def sentance2bzseqNew(self,sentance,edges_list,new_subgraphs_points_in_between_nodes_list,pc_range, dx, bz_pc_range, bz_nx,ncontrol):
         """ for each node, seq: x, y, cls, IDX
         if type == start or continue , IDX = 0"""
 
         seq_list = []
+        fits = self.fit_edges(edges_list, ncontrol)
         
-        for idx, (sub_sent,adj,new_subgraphs_points_in_between_nodes) in enumerate(zip(sentance,adj_list,new_subgraphs_points_in_between_nodes_list)):
+        for idx, (sub_sent,edges) in enumerate(zip(sentance,edges_list)):
             for node_i,node in enumerate(sub_sent):
             
                 # node.position[0], node.position[1] = (node.position[0] - pc_range[0]) / dx[0], (node.position[1] - pc_range[1]) / dx[0]
@@ -842,17 +910,12 @@ class TransformGraph2Seq(object):
                     node.sque_index = node.sque_index + sentance[idx-1][-1].sque_index +1
                 seq = node.position[:2].astype(int).tolist()  # x y
                 seq.append(node.sque_index)  # cls
-                father_idx = np.argwhere(adj[node_i] == -1)
+                father_idx, father_edges = edges.parents(node_i)
                 father_seq=[]
                 if len(father_idx) != 0 :
-                    father_idx = father_idx[np.where(father_idx < node_i)]
-                    for f_idx in father_idx:
-                        centerlines=new_subgraphs_points_in_between_nodes [(f_idx, node_i)]
-                        if not isinstance(centerlines,tuple):
-                            centerlines=centerlines,
-                        for centerline in centerlines:
-                            fin_res=get_bezier_coeff(centerline[:, :2],
-                                                    n_control=ncontrol)
+                    earlier = father_idx < node_i
+                    for f_idx, edge in zip(father_idx[earlier], father_edges[earlier]):
+                        for fin_res in fits[idx][edge]:
                             coeff=fin_res[1:-1]
                             
                             coeff=(coeff- bz_pc_range[:2]) / dx[:2]
@@ -868,17 +931,12 @@ class TransformGraph2Seq(object):
                             
                 seq.append(father_seq)
                 
-                child_idx=np.argwhere(adj[node_i] == 1)
+                child_idx, child_edges = edges.children(node_i)
                 child_seq=[]
                 if len(child_idx)!=0:
-                    child_idx=child_idx[np.where(child_idx < node_i)]
-                    for c_idx in child_idx:
-                        centerlines=new_subgraphs_points_in_between_nodes  [(node_i, c_idx)]
-                        if not isinstance(centerlines,tuple):
-                            centerlines=centerlines,
-                        for centerline in centerlines:
-                            fin_res=get_bezier_coeff(centerline[:, :2],
-                                                n_control=ncontrol)
+                    earlier = child_idx < node_i
+                    for c_idx, edge in zip(child_idx[earlier], child_edges[earlier]):
+                        for fin_res in fits[idx][edge]:
                             coeff=fin_res[1:-1]
                             
                             coeff=(coeff- bz_pc_range[:2]) / dx[:2]
@@ -896,6 +954,28 @@ class TransformGraph2Seq(object):
        
         return  seq_list
 
+    @staticmethod
+    def fit_edges(edges_list, ncontrol):
+        """Bezier control points of all edges of a scene in one batched fit.
+        Args:
+            edges_list (list[GraphEdges]): edges of every subgraph.
+            ncontrol (int): number of control points.
+        Returns:
+            list[list[tuple]]: per subgraph, the control points of every
+                polyline of an edge, as a tuple, by edge.
+        """
+        counts, polylines = [], []
+        for edges in edges_list:
+            for centerlines in edges.polylines:
+                if not isinstance(centerlines, tuple):
+                    centerlines = centerlines,
+                counts.append(len(centerlines))
+                polylines += [centerline[:, :2] for centerline in centerlines]
+        coeffs = iter(get_bezier_coeffs(polylines, ncontrol))
+        counts = iter(counts)
+        return [[tuple(next(coeffs) for _ in range(next(counts)))
+                 for _ in range(len(edges))] for edges in edges_list]
+
     def seqlist2seq_with_start(self,gt_lines_sequence_list):
         seq=[]
         for gt_lines_sequence in gt_lines_sequence_list:
@@ -1333,18 +1413,23 @@ class LoadNusOrderedBzCenterline(object):
     """Load multi channel images from a list of separate channel files.
 
     Expects results['img_filename'] to be a list of filenames.
+    With `lazy=True` the centerlines are only built when used, see
+    `LazyCenterLine`.
     """
 
-    def __init__(self, grid_conf, bz_grid_conf,cam_intrinsic=None):
+    def __init__(self, grid_conf, bz_grid_conf,cam_intrinsic=None, lazy=False):
         self.grid_conf = grid_conf
         self.bz_grid_conf = bz_grid_conf
         self.cam_intrinsic=cam_intrinsic
+        self.lazy = lazy
 
     def __call__(self, results):
         """Call function to load multi-view image from files.
         """
-        results['center_lines'] = NusOrederedBzCenterLine(
-            results['center_lines'], self.grid_conf, self.bz_grid_conf,self.cam_intrinsic,results['token'])
+        centerline_type = LazyCenterLine if self.lazy else NusOrederedBzCenterLine
+        args = (NusOrederedBzCenterLine, ) if self.lazy else ()
+        results['center_lines'] = centerline_type(
+            *args, results['center_lines'], self.grid_conf, self.bz_grid_conf,self.cam_intrinsic,results['token'])
         return results
 
     def __repr__(self):
@@ -1454,7 +1539,7 @@ class LoadNusOrderedBzCenterlineSeg(object):
         """Call function to load multi-view image from files.
         """
         centerline_seg = np.zeros((int(self.nx[1]), int(self.nx[0])))
-        center_lines = results['center_lines']['centerlines']
+        center_lines = unpack_centerlines(results['center_lines'])['centerlines']
         for i in range(len(center_lines)):
             center_line = center_lines[i]
             inbev_x = np.logical_and(
@@ -1987,7 +2072,7 @@ class LoadCenterlineSegFromPkl(object):
                 - img_norm_cfg (dict): Normalization configuration of images.
         """
         centerline_seg = np.zeros((int(self.nx[1]), int(self.nx[0])))
-        center_lines = results['center_lines']['centerlines']
+        center_lines = unpack_centerlines(results['center_lines'])['centerlines']
         for i in range(len(center_lines)):
             center_line = center_lines[i]
             inbev_x = np.logical_and(
@@ -2776,3 +2861,35 @@ class TransformAV2OrderedBzLane2Graph_new(object):
         # results['token'] = results['sample_idx']
 
         return results
+
+
+@TRANSFORMS.register_module()
+class LoadBEVFeatures(object):
+    """Load precomputed BEV features from a `BEVFeatureStore`, see
+    `tools/dump_bev_features.py`, in place of images.
+
+    In training a random stored augmentation of the sample is used together
+    with the target sequence stored with it, otherwise the features without
+    image augmentation.
+    Args:
+        store_root (str): directory of the store.
+        use_aug (bool): pick a random stored augmentation. Default: True.
+    """
+    def __init__(self, store_root, use_aug=True):
+        self.store_root = store_root
+        self.use_aug = use_aug
+        self.store = None
+
+    def __call__(self, results):
+        if self.store is None:
+            # opened lazily, once per dataloader worker
+            self.store = BEVFeatureStore(self.store_root)
+        token = results['token']
+        if self.use_aug:
+            variant = random.choice(self.store.variants[token])
+        else:
+            variant = NO_AUG
+        bev_feats, meta = self.store.get(store_key(token, variant))
+        results['bev_feats'] = bev_feats
+        results.update(meta)
+        return results
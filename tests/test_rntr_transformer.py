@@ -0,0 +1,63 @@
+import pytest
+import torch
+from mmdet3d.registry import MODELS
+from mmdet3d.utils import register_all_modules
+
+from projects.SeqGrowGraph.seq_grow_graph.rntr_transformer import \
+    PETRTransformerLineDecoder  # noqa: F401
+
+EMBED_DIMS = 64
+NUM_LAYERS = 3
+
+
+def build_decoder(return_intermediate):
+    register_all_modules()
+    attn_cfg = dict(type='RNTR2MultiheadAttention', embed_dims=EMBED_DIMS,
+                    num_heads=4, dropout=0.1)
+    decoder = MODELS.build(dict(
+        type='PETRTransformerLineDecoder',
+        return_intermediate=return_intermediate,
+        num_layers=NUM_LAYERS,
+        transformerlayers=dict(
+            type='PETRLineTransformerDecoderLayer',
+            attn_cfgs=[attn_cfg, attn_cfg],
+            ffn_cfgs=dict(type='FFN', embed_dims=EMBED_DIMS,
+                          feedforward_channels=EMBED_DIMS * 4, num_fcs=2,
+                          ffn_drop=0.1, act_cfg=dict(type='ReLU', inplace=True)),
+            with_cp=False,
+            operation_order=('self_attn', 'norm', 'cross_attn', 'norm',
+                             'ffn', 'norm'))))
+    return decoder.eval()
+
+
+def decoder_inputs(num_query=5, num_key=7, bs=2):
+    torch.manual_seed(0)
+    query = torch.randn(num_query, bs, EMBED_DIMS)
+    memory = torch.randn(num_key, bs, EMBED_DIMS)
+    return query, dict(key=memory, value=memory,
+                       key_pos=torch.zeros_like(memory),
+                       query_pos=torch.zeros_like(query),
+                       key_padding_mask=None, attn_masks=[None, None])
+
+
+@pytest.mark.parametrize('built', [False, True])
+@pytest.mark.parametrize('override', [None, False, True])
+def test_line_decoder_return_intermediate(built, override):
+    decoder = build_decoder(built)
+    query, kwargs = decoder_inputs()
+    if override is not None:
+        kwargs['return_intermediate'] = override
+    with torch.no_grad():
+        out = decoder(query, **kwargs)
+    return_intermediate = built if override is None else override
+    num_outs = NUM_LAYERS if return_intermediate else 1
+    assert out.shape == (num_outs, 5, 2, EMBED_DIMS)
+
+
+def test_line_decoder_intermediate_ends_with_last_layer():
+    decoder = build_decoder(False)
+    query, kwargs = decoder_inputs()
+    with torch.no_grad():
+        outs = decoder(query, return_intermediate=True, **kwargs)
+        last = decoder(query, **kwargs)
+    assert torch.allclose(outs[-1], last[0], atol=1e-5)
@@ -0,0 +1,116 @@
+"""Peak memory of a teacher-forced decoder pass with and without the
+memory-efficient attention of `RNTR2MultiheadAttention`.
+
+Runs forward and backward of the `LssSeqLineTransformer` of a config on
+random BEV features and target embeddings. On GPU the peak is read from the
+CUDA allocator, on CPU every mode runs in a fresh process and the peak
+resident set size is reported.
+
+Example:
+    python projects/SeqGrowGraph/tools/benchmark_attention_memory.py \
+        projects/SeqGrowGraph/configs/seq_grow_graph/seq_grow_graph_default.py \
+        --seq-len 700 --batch-size 1
+"""
+import argparse
+import multiprocessing as mp
+import resource
+import time
+
+import torch
+from mmengine.config import Config
+from mmengine.registry import init_default_scope
+from mmdet3d.registry import MODELS
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Benchmark decoder attention memory in training')
+    parser.add_argument('config', help='config file path')
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument(
+        '--seq-len', type=int, default=700, help='target sequence length')
+    parser.add_argument(
+        '--num-layers', type=int, default=None,
+        help='override the number of decoder layers')
+    parser.add_argument(
+        '--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+    return parser.parse_args()
+
+
+def bev_shape(cfg):
+    grid_conf = cfg.model.grid_conf
+    return tuple(
+        int(round((bound[1] - bound[0]) / bound[2]))
+        for bound in (grid_conf['ybound'], grid_conf['xbound']))
+
+
+def build_transformer(cfg, memory_efficient, num_layers=None):
+    transformer_cfg = cfg.model.pts_bbox_head.transformer
+    decoder_cfg = transformer_cfg.decoder
+    if num_layers is not None:
+        decoder_cfg.num_layers = num_layers
+    for attn_cfg in decoder_cfg.transformerlayers.attn_cfgs:
+        attn_cfg.memory_efficient = memory_efficient
+    return MODELS.build(transformer_cfg)
+
+
+def run(args, memory_efficient):
+    """Forward and backward once, returns (peak memory in MB, seconds)."""
+    cfg = Config.fromfile(args.config)
+    init_default_scope(cfg.get('default_scope', 'mmdet3d'))
+    device = torch.device(args.device)
+    transformer = build_transformer(
+        cfg, memory_efficient, args.num_layers).to(device).train()
+    dims = transformer.embed_dims
+    height, width = bev_shape(cfg)
+    x = torch.randn(args.batch_size, dims, height, width, device=device)
+    pos_embed = torch.randn_like(x)
+    mask = torch.zeros(args.batch_size, height, width, dtype=torch.bool,
+                       device=device)
+    tgt = torch.randn(args.batch_size, args.seq_len, dims, device=device,
+                      requires_grad=True)
+    query_embed = torch.randn(args.seq_len, dims, device=device)
+
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+    start = time.perf_counter()
+    out_dec, _ = transformer(tgt, x, mask, query_embed, pos_embed)
+    out_dec.sum().backward()
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+        peak = torch.cuda.max_memory_allocated() / 2**20
+    else:
+        # ru_maxrss is in KB on Linux
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+    return peak, time.perf_counter() - start
+
+
+def _worker(args, memory_efficient, results):
+    results.put(run(args, memory_efficient))
+
+
+def main():
+    args = parse_args()
+    results = []
+    for memory_efficient in (False, True):
+        if args.device == 'cpu':
+            # fresh process per mode, ru_maxrss never goes down
+            ctx = mp.get_context('spawn')
+            queue = ctx.Queue()
+            proc = ctx.Process(
+                target=_worker, args=(args, memory_efficient, queue))
+            proc.start()
+            result = queue.get()
+            proc.join()
+        else:
+            result = run(args, memory_efficient)
+        results.append(('sdpa' if memory_efficient else 'nn.MHA', *result))
+
+    print(f'{"attention":<12}{"peak (MB)":>12}{"time (s)":>10}')
+    for name, peak, elapsed in results:
+        print(f'{name:<12}{peak:>12.0f}{elapsed:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Per-scene Bezier fitting time, per-edge fitting vs the batched fit.
+
+`loop` is the former `get_bezier_coeff`, which builds the Bernstein matrix
+with a Python double loop and calls `np.linalg.lstsq` per edge. `cached`
+fits edge by edge with the cached pseudo-inverse, `batched` fits all edges
+of a scene at once (`get_bezier_coeffs`) and `resampled` additionally
+resamples every edge to `--num-points` points so a single product solves
+the scene. Scenes are random polylines of `--min-points` to `--max-points`
+points.
+
+Example:
+    python projects/SeqGrowGraph/tools/benchmark_bezier_fit.py --edges 60
+"""
+import argparse
+import time
+from math import factorial
+
+import numpy as np
+
+from projects.SeqGrowGraph.seq_grow_graph.core.centerline.bezier import (
+    get_bezier_coeff, get_bezier_coeffs)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark Bezier fitting')
+    parser.add_argument('--scenes', type=int, default=200)
+    parser.add_argument('--edges', type=int, default=60, help='edges per scene')
+    parser.add_argument('--min-points', type=int, default=2)
+    parser.add_argument('--max-points', type=int, default=80)
+    parser.add_argument('--num-points', type=int, default=32,
+                        help='resampled length of the resampled mode')
+    parser.add_argument('--n-control', type=int, default=3)
+    return parser.parse_args()
+
+
+def loop_bezier_coeff(points, n_control):
+    """The per-edge fit `get_bezier_coeff` replaced."""
+    if len(points) < 10:
+        points = np.linspace(points[0], points[-1], num=10)
+    n_points = len(points)
+    A = np.zeros((n_points, n_control))
+    t = np.arange(n_points) / (n_points - 1)
+    for i in range(n_points):
+        for j in range(n_control):
+            A[i, j] = factorial(n_control - 1) // (
+                factorial(j) * factorial(n_control - 1 - j)) * np.power(
+                    1 - t[i], n_control - 1 - j) * np.power(t[i], j)
+    points_BE = points - A[:, :1] * points[0] - A[:, -1:] * points[-1]
+    res = np.linalg.lstsq(A[:, 1:-1], points_BE, rcond=None)[0]
+    return np.r_[[points[0]], res, [points[-1]]]
+
+
+def main():
+    args = parse_args()
+    rng = np.random.default_rng(0)
+    scenes = [[
+        np.cumsum(rng.normal(size=(n, 2)), axis=0)
+        for n in rng.integers(args.min_points, args.max_points + 1, args.edges)
+    ] for _ in range(args.scenes)]
+    n_control = args.n_control
+
+    modes = dict(
+        loop=lambda scene: [loop_bezier_coeff(p, n_control) for p in scene],
+        cached=lambda scene: [get_bezier_coeff(p, n_control) for p in scene],
+        batched=lambda scene: get_bezier_coeffs(scene, n_control),
+        resampled=lambda scene: get_bezier_coeffs(
+            scene, n_control, num_points=args.num_points),
+    )
+    reference = [modes['loop'](scene) for scene in scenes]
+
+    print(f'{"mode":<12}{"ms/scene":>10}{"max error":>12}')
+    for name, fit in modes.items():
+        fit(scenes[0])  # warm up the caches
+        start = time.perf_counter()
+        results = [fit(scene) for scene in scenes]
+        elapsed = (time.perf_counter() - start) / len(scenes) * 1000
+        error = max(
+            np.abs(a - b).max()
+            for ref, res in zip(reference, results) for a, b in zip(ref, res))
+        print(f'{name:<12}{elapsed:>10.3f}{error:>12.2e}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Per-token latency of the static-shape decode engine, eager vs compiled.
+
+Decodes random BEV features with the `pts_bbox_head` of a config for a
+fixed number of steps (the end token is only checked after the last one)
+and reports the mean latency per decoding step on CPU.
+
+Example:
+    python projects/SeqGrowGraph/tools/benchmark_decode_engine.py \
+        projects/SeqGrowGraph/configs/seq_grow_graph/seq_grow_graph_default.py \
+        --checkpoint work_dirs/seq_grow_graph/epoch_150.pth --num-steps 128
+"""
+import argparse
+import time
+
+import torch
+from mmengine.config import Config
+from mmengine.registry import init_default_scope
+from mmengine.runner import load_checkpoint
+from mmdet3d.registry import MODELS
+
+from projects.SeqGrowGraph.seq_grow_graph.decode_engine import \
+    StaticDecodeEngine
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the static-shape decode engine')
+    parser.add_argument('config', help='config file path')
+    parser.add_argument('--checkpoint', default=None, help='checkpoint file')
+    parser.add_argument(
+        '--batch-size', type=int, default=1, help='decoded frames at once')
+    parser.add_argument(
+        '--num-steps', type=int, default=128, help='decoding steps per run')
+    parser.add_argument(
+        '--repeat', type=int, default=3, help='timed runs per mode')
+    parser.add_argument(
+        '--threads', type=int, default=None, help='torch CPU threads')
+    return parser.parse_args()
+
+
+def bev_shape(cfg):
+    grid_conf = cfg.model.grid_conf
+    return tuple(
+        int(round((bound[1] - bound[0]) / bound[2]))
+        for bound in (grid_conf['ybound'], grid_conf['xbound']))
+
+
+def time_engine(engine, bev_feats, input_seqs, repeat):
+    engine.generate(bev_feats, input_seqs)  # warm up / compile
+    start = time.perf_counter()
+    for _ in range(repeat):
+        engine.generate(bev_feats, input_seqs)
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    args = parse_args()
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+    cfg = Config.fromfile(args.config)
+    init_default_scope(cfg.get('default_scope', 'mmdet3d'))
+    head_cfg = cfg.model.pts_bbox_head
+    head_cfg.grammar_cfg = None
+    head_cfg.max_center_len = args.num_steps + 1
+    head = MODELS.build(head_cfg)
+    if args.checkpoint is not None:
+        load_checkpoint(head, args.checkpoint, map_location='cpu',
+                        revise_keys=[(r'^pts_bbox_head\.', '')])
+    head.eval()
+
+    bev_feats = torch.randn(args.batch_size, head.in_channels, *bev_shape(cfg))
+    input_seqs = torch.full((args.batch_size, 1), 574, dtype=torch.long)
+    # never stop early, every run decodes `num_steps` tokens
+    check_every = args.num_steps + 1
+
+    results = []
+    for name, compile in (('eager', False), ('compiled', True)):
+        engine = StaticDecodeEngine(head, check_every, compile=compile)
+        elapsed = time_engine(engine, bev_feats, input_seqs, args.repeat)
+        results.append((name, elapsed / args.num_steps * 1000))
+
+    print(f'{"mode":<12}{"ms/token":>10}')
+    for name, latency in results:
+        print(f'{name:<12}{latency:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""Load generator for the continuous-batching graph generation server.
+
+Frames of the test set arrive with Poisson inter-arrival times and are either
+served by `GraphGenerationServer` or by the synchronous `simple_test` path,
+which waits for a whole batch to finish decoding before taking new frames.
+Reports p50/p99 latency and frames per second on CPU.
+
+Example:
+    python projects/SeqGrowGraph/tools/benchmark_graph_server.py \
+        projects/SeqGrowGraph/configs/seq_grow_graph/seq_grow_graph_default.py \
+        --checkpoint work_dirs/seq_grow_graph/epoch_150.pth --rate 0.5
+"""
+import argparse
+import queue
+import threading
+from concurrent.futures import Future
+
+import torch
+from mmengine.config import Config
+from mmengine.dataset import pseudo_collate
+from mmengine.registry import init_default_scope
+from mmengine.runner import load_checkpoint
+from mmdet3d.registry import DATASETS, MODELS
+
+from projects.SeqGrowGraph.seq_grow_graph.graph_server import (
+    GraphGenerationServer, run_load)
+
+
+class SequentialRunner:
+    """Baseline: batches whatever has arrived (up to `batch_size`) and runs
+    `simple_test` on it synchronously."""
+
+    def __init__(self, model, batch_size=8):
+        self.model = model.eval()
+        self.batch_size = batch_size
+        self.requests = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def submit(self, img, img_meta):
+        future = Future()
+        self.requests.put((img, img_meta, future))
+        return future
+
+    @torch.no_grad()
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                reqs = [self.requests.get(timeout=0.05)]
+            except queue.Empty:
+                continue
+            while len(reqs) < self.batch_size:
+                try:
+                    reqs.append(self.requests.get_nowait())
+                except queue.Empty:
+                    break
+            img = torch.stack([r[0] for r in reqs])
+            results = self.model.simple_test([r[1] for r in reqs], img)
+            for r, result in zip(reqs, results):
+                r[2].set_result(result)
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def load_frames(cfg, model, num_frames):
+    dataset = DATASETS.build(cfg.test_dataloader.dataset)
+    frames = []
+    for i in range(num_frames):
+        data = model.data_preprocessor(pseudo_collate([dataset[i]]), False)
+        frames.append((data['inputs']['img'][0],
+                       data['data_samples'][0].metainfo))
+    return frames
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Benchmark continuous batching of SeqGrowGraph')
+    parser.add_argument('config', help='test config file path')
+    parser.add_argument('--checkpoint', default=None, help='checkpoint file')
+    parser.add_argument(
+        '--num-frames', type=int, default=32, help='number of requests')
+    parser.add_argument(
+        '--rate', type=float, default=0.5,
+        help='mean arrival rate in frames per second')
+    parser.add_argument(
+        '--max-batch-size', type=int, default=8,
+        help='slots of the rolling decode batch / baseline batch size')
+    parser.add_argument(
+        '--encode-batch-size', type=int, default=4,
+        help='max frames encoded at once by the server')
+    parser.add_argument(
+        '--threads', type=int, default=None, help='torch CPU threads')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+    cfg = Config.fromfile(args.config)
+    init_default_scope(cfg.get('default_scope', 'mmdet3d'))
+    cfg.model.pts_bbox_head.use_cache = True
+    model = MODELS.build(cfg.model)
+    if args.checkpoint is not None:
+        load_checkpoint(model, args.checkpoint, map_location='cpu')
+    model.eval()
+    frames = load_frames(cfg, model, args.num_frames)
+
+    runner = SequentialRunner(model, args.max_batch_size)
+    sequential = run_load(runner.submit, frames, args.rate)
+    runner.stop()
+
+    server = GraphGenerationServer(
+        model, args.max_batch_size, args.encode_batch_size).start()
+    continuous = run_load(server.submit, frames, args.rate)
+    server.stop()
+
+    print(f'{"mode":<12}{"p50 (s)":>10}{"p99 (s)":>10}{"frames/s":>10}')
+    for name, res in (('sequential', sequential),
+                      ('continuous', continuous)):
+        print(f'{name:<12}{res["latency_p50"]:>10.2f}'
+              f'{res["latency_p99"]:>10.2f}{res["fps"]:>10.3f}')
+
+
+if __name__ == '__main__':
+    main()
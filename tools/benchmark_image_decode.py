@@ -0,0 +1,103 @@
+"""Per-sample time and memory of loading the six camera images, full
+resolution decoding vs `ReducedLoadMultiViewImageFromFiles`.
+
+`full` is `OrgLoadMultiViewImageFromFiles(to_float32=True)` of the default
+pipelines, `reduced` decodes at the libjpeg scale picked from
+`data_aug_conf`. Both are followed by the test time `ResizeCropFlipImage`,
+the PSNR of the reduced path to the full one is measured on its output.
+Without image files, six random 1600x900 JPEGs are written to a temporary
+directory.
+
+Example:
+    python projects/SeqGrowGraph/tools/benchmark_image_decode.py \
+        projects/SeqGrowGraph/configs/seq_grow_graph/seq_grow_graph_default.py \
+        --images data/nuscenes/samples/CAM_*/n008-2018-08-01-15-16-36-0400__CAM_*__1533151603*.jpg
+"""
+import argparse
+import os.path as osp
+import tempfile
+import time
+
+import cv2
+import numpy as np
+from mmengine.config import Config
+
+from projects.SeqGrowGraph.seq_grow_graph.transforms.loading import (
+    OrgLoadMultiViewImageFromFiles, ReducedLoadMultiViewImageFromFiles)
+from projects.SeqGrowGraph.seq_grow_graph.transforms.transform_3d import \
+    ResizeCropFlipImage
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Benchmark reduced resolution image decoding')
+    parser.add_argument('config', help='config file path')
+    parser.add_argument('--images', nargs='*', default=[],
+                        help='images of one sample')
+    parser.add_argument('--iters', type=int, default=20)
+    return parser.parse_args()
+
+
+def random_images(out_dir, data_aug_conf, num_cams=6):
+    """Smooth random images with sharp edges, as JPEGs of quality 90."""
+    rng = np.random.default_rng(0)
+    H, W = data_aug_conf['H'], data_aug_conf['W']
+    files = []
+    for i in range(num_cams):
+        img = cv2.resize(rng.uniform(0, 255, (H // 16, W // 16, 3)), (W, H),
+                         interpolation=cv2.INTER_CUBIC)
+        for _ in range(20):
+            x, y = rng.integers(0, W), rng.integers(0, H)
+            cv2.rectangle(img, (int(x), int(y)), (int(x) + 80, int(y) + 40),
+                          rng.uniform(0, 255, 3).tolist(), 2)
+        files.append(osp.join(out_dir, f'cam_{i}.jpg'))
+        cv2.imwrite(files[-1], np.clip(img, 0, 255).astype(np.uint8),
+                    [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return files
+
+
+def load(loader, resize, files):
+    """Loader output and the resized images of one sample."""
+    results = loader(dict(img_filename=files))
+    loaded = sum(img.nbytes for img in results['img'])
+    results.update(intrinsics=[np.eye(4) for _ in files],
+                   extrinsics=[np.eye(4) for _ in files])
+    return loaded, resize(results)['img']
+
+
+def main():
+    args = parse_args()
+    cfg = Config.fromfile(args.config)
+    data_aug_conf = cfg.ida_aug_conf
+    resize = ResizeCropFlipImage(data_aug_conf=data_aug_conf, training=False)
+    loaders = dict(
+        full=OrgLoadMultiViewImageFromFiles(to_float32=True),
+        reduced=ReducedLoadMultiViewImageFromFiles(
+            data_aug_conf, training=False))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        files = args.images or random_images(tmp_dir, data_aug_conf)
+        print(f'{len(files)} images, {loaders["reduced"]}')
+        print(f'{"loader":<10}{"load ms":>10}{"+resize ms":>12}'
+              f'{"loaded MB":>11}{"PSNR":>8}')
+        reference = None
+        for name, loader in loaders.items():
+            start = time.perf_counter()
+            for _ in range(args.iters):
+                loader(dict(img_filename=files))
+            load_ms = (time.perf_counter() - start) / args.iters * 1000
+            start = time.perf_counter()
+            for _ in range(args.iters):
+                loaded, imgs = load(loader, resize, files)
+            total_ms = (time.perf_counter() - start) / args.iters * 1000
+            imgs = np.stack(imgs)
+            if reference is None:
+                reference = imgs
+            mse = np.mean((imgs - reference) ** 2)
+            psnr = 10 * np.log10(255 ** 2 / mse) if mse else float('inf')
+            print(f'{name:<10}{load_ms:>10.1f}{total_ms:>12.1f}'
+                  f'{loaded / 2**20:>11.1f}{psnr:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
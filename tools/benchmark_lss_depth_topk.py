@@ -0,0 +1,89 @@
+"""Speed and BEV fidelity of the sparse depth inference modes of
+`LiftSplatShootEgo` against splatting every depth bin.
+
+The view transformer of a config runs in eval mode on random image features
+of a nuScenes-like rig, with the weights of `--checkpoint` if given. The
+depth distributions of random features are not those of real images, the
+numbers are a measure of speed and of the cost of dropping depth bins, not
+of the effect on the predicted graphs. Every `--topk` and `--thresholds`
+setting reports the time of a lift-splat, the fraction of frustum points
+still splatted and the relative L2 error of the BEV features to the dense
+ones.
+
+The effect on the reach metrics is measured on the test set by
+`tools/sweep_depth_topk.py`.
+
+Example:
+    python projects/SeqGrowGraph/tools/benchmark_lss_depth_topk.py \
+        projects/SeqGrowGraph/configs/seq_grow_graph/seq_grow_graph_default.py \
+        --checkpoint $CKPT --topk 1 2 4 8 16
+"""
+import argparse
+
+import torch
+from benchmark_lss_geometry import rig_metas, timeit
+from mmengine.config import Config
+from mmengine.runner import load_checkpoint
+
+from projects.SeqGrowGraph.seq_grow_graph.LiftSplatShoot import (
+    LiftSplatShootEgo, sparse_depth_plan)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Benchmark sparse depth lift-splat')
+    parser.add_argument('config', help='config file path')
+    parser.add_argument('--checkpoint', help='model checkpoint')
+    parser.add_argument('--topk', type=int, nargs='*', default=[1, 2, 4, 8, 16])
+    parser.add_argument(
+        '--thresholds', type=float, nargs='*', default=[0.01, 0.05])
+    parser.add_argument(
+        '--pooling', choices=['interval', 'fused'], default='interval')
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--num-cams', type=int, default=6)
+    parser.add_argument('--iters', type=int, default=10)
+    parser.add_argument(
+        '--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    cfg = Config.fromfile(args.config)
+    device = torch.device(args.device)
+    lss_cfg = dict(cfg.model.lss_cfg, pooling=args.pooling,
+                   depth_topk=None, depth_threshold=None)
+    model = LiftSplatShootEgo(
+        cfg.model.grid_conf, cfg.model.data_aug_conf, return_bev=True,
+        **lss_cfg)
+    if args.checkpoint:
+        load_checkpoint(model, args.checkpoint, map_location='cpu',
+                        revise_keys=[(r'^view_transformers\.', '')])
+    model.to(device).eval()
+    metas = rig_metas(args.batch_size, args.num_cams, cfg.model.data_aug_conf)
+    fH, fW = model.frustum.shape[1:3]
+    torch.manual_seed(0)
+    x = torch.randn(args.batch_size, args.num_cams, model.d_in, fH, fW,
+                    device=device)
+
+    settings = [('dense', None, None)]
+    settings += [(f'top-{k}', k, None) for k in args.topk]
+    settings += [(f'p >= {t:g}', None, t) for t in args.thresholds]
+    print(f'{"depth bins":<12}{"ms":>10}{"points":>10}{"bev error":>12}')
+    with torch.no_grad():
+        plan = model.get_voxel_plan(metas)
+        depth, _ = model.camencode.get_depth_context(x.flatten(0, 1))
+        dense = model.get_voxels(x, metas)
+        for name, topk, threshold in settings:
+            model.depth_topk, model.depth_threshold = topk, threshold
+            elapsed = timeit(lambda: model.get_voxels(x, metas), args.iters,
+                             device)
+            bev = model.get_voxels(x, metas)
+            points = len(sparse_depth_plan(
+                depth, plan, topk, threshold)['indices']) / len(plan['indices'])
+            error = ((bev - dense).norm() / dense.norm()).item()
+            print(f'{name:<12}{elapsed:>10.2f}{points:>10.1%}{error:>12.2e}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Per-batch time of the LSS frustum geometry and voxel pooling, with and
+without the calibration-keyed geometry cache of `LiftSplatShootEgo`.
+
+The view transformer is built from the `grid_conf`, `data_aug_conf` and
+`lss_cfg` of a config (48 x 32 m at 0.5 m for the default one) and run in
+eval mode on random image features of a nuScenes-like rig of six cameras.
+`geometry` times the image to ego matrices, frustum projection, voxel
+ranks and sort of a batch, `lift-splat` additionally the depth net and
+the pooling. `uncached` recomputes the geometry every batch as in training,
+`cached` looks it up by calibration after the first batch.
+
+Example:
+    python projects/SeqGrowGraph/tools/benchmark_lss_geometry.py \
+        projects/SeqGrowGraph/configs/seq_grow_graph/seq_grow_graph_default.py
+"""
+import argparse
+import time
+
+import numpy as np
+import torch
+from mmengine.config import Config
+
+from projects.SeqGrowGraph.seq_grow_graph.LiftSplatShoot import \
+    LiftSplatShootEgo
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the LSS geometry cache')
+    parser.add_argument('config', help='config file path')
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--num-cams', type=int, default=6)
+    parser.add_argument('--iters', type=int, default=20)
+    parser.add_argument(
+        '--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+    return parser.parse_args()
+
+
+def rig_metas(batch_size, num_cams, data_aug_conf):
+    """Img metas of cameras evenly spaced in yaw, 1.6 m above the ego
+    origin, resized and cropped to `final_dim`."""
+    fH, fW = data_aug_conf['final_dim']
+    resize = fW / data_aug_conf['W']
+    ida = np.eye(4)
+    ida[:2, :2] *= resize
+    ida[1, 3] = -(data_aug_conf['H'] * resize - fH)
+    intrinsic = np.eye(4)
+    intrinsic[:3, :3] = [[1266., 0., 800.], [0., 1266., 450.], [0., 0., 1.]]
+    # camera axes (right, down, forward) in the ego frame facing along x
+    cam2ego_rot = np.array([[0., 0., 1.], [-1., 0., 0.], [0., -1., 0.]])
+    lidar2img = []
+    for yaw in np.linspace(0, 2 * np.pi, num_cams, endpoint=False):
+        c, s = np.cos(yaw), np.sin(yaw)
+        cam2ego = np.eye(4)
+        cam2ego[:3, :3] = np.array([[c, -s, 0.], [s, c, 0.], [0., 0., 1.]]) @ cam2ego_rot
+        cam2ego[:3, 3] = [c, s, 1.6]
+        lidar2img.append(ida @ intrinsic @ np.linalg.inv(cam2ego))
+    return [dict(lidar2img=lidar2img, lidar2ego=np.eye(4))
+            for _ in range(batch_size)]
+
+
+def timeit(fn, iters, device):
+    fn()  # warm up, fills the cache
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(iters):
+        fn()
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / iters * 1000
+
+
+def main():
+    args = parse_args()
+    cfg = Config.fromfile(args.config)
+    device = torch.device(args.device)
+    model = LiftSplatShootEgo(
+        cfg.model.grid_conf, cfg.model.data_aug_conf, return_bev=True,
+        **cfg.model.lss_cfg).to(device).eval()
+    metas = rig_metas(args.batch_size, args.num_cams, cfg.model.data_aug_conf)
+    fH, fW = model.frustum.shape[1:3]
+    x = torch.randn(args.batch_size, args.num_cams, model.d_in, fH, fW,
+                    device=device)
+    plan = model.get_voxel_plan(metas)
+    print(f'grid {[int(n) for n in model.nx]}, frustum '
+          f'{list(model.frustum.shape[:3])}, '
+          f'{len(plan["indices"])} points in the grid')
+
+    print(f'{"mode":<12}{"geometry ms":>14}{"lift-splat ms":>16}')
+    reference = None
+    with torch.no_grad():
+        for name, cache_size in (('uncached', 0), ('cached', 8)):
+            model.geometry_cache_size = cache_size
+            model.geometry_cache.clear()
+            geometry = timeit(
+                lambda: model.get_voxel_plan(metas), args.iters, device)
+            lift_splat = timeit(
+                lambda: model.get_voxels(x, metas), args.iters, device)
+            bev = model.get_voxels(x, metas)
+            if reference is None:
+                reference = bev
+            assert torch.equal(bev, reference)
+            print(f'{name:<12}{geometry:>14.3f}{lift_splat:>16.3f}')
+
+
+if __name__ == '__main__':
+    main()
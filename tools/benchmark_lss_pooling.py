@@ -0,0 +1,144 @@
+"""Accuracy, time and peak memory of the voxel pooling engines of
+`LiftSplatShootEgo`.
+
+`cumsum` is the QuickCumsum pooling of the lifted depth x context volume,
+`interval` the segmented reduction over the (start, length) intervals of
+every occupied voxel with lazily gathered features and `fused` the same
+reduction in chunks of points, recomputing the lifted features in
+backward instead of keeping them. Every engine runs
+forward and backward in training mode on random image features of a
+nuScenes-like rig built from the `grid_conf`, `data_aug_conf` and
+`lss_cfg` of a config. BEV features and input gradients are compared with
+a float64 reference. On GPU the peak is read from the CUDA allocator, on
+CPU every engine runs in a fresh process and the peak resident set size
+is reported.
+
+Example:
+    python projects/SeqGrowGraph/tools/benchmark_lss_pooling.py \
+        projects/SeqGrowGraph/configs/seq_grow_graph/seq_grow_graph_default.py
+"""
+import argparse
+import multiprocessing as mp
+import resource
+import time
+
+import torch
+from benchmark_lss_geometry import rig_metas
+from mmengine.config import Config
+
+from projects.SeqGrowGraph.seq_grow_graph.LiftSplatShoot import \
+    LiftSplatShootEgo
+
+POOLINGS = ('cumsum', 'interval', 'fused')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the LSS voxel pooling engines')
+    parser.add_argument('config', help='config file path')
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--num-cams', type=int, default=6)
+    parser.add_argument(
+        '--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+    return parser.parse_args()
+
+
+def build(args, pooling, dtype=torch.float32):
+    """Model, image features and img metas, the same for every engine."""
+    cfg = Config.fromfile(args.config)
+    device = torch.device(args.device)
+    torch.manual_seed(0)
+    lss_cfg = dict(cfg.model.lss_cfg, pooling=pooling)
+    model = LiftSplatShootEgo(
+        cfg.model.grid_conf, cfg.model.data_aug_conf, return_bev=True,
+        **lss_cfg).to(device=device, dtype=dtype).train()
+    metas = rig_metas(args.batch_size, args.num_cams, cfg.model.data_aug_conf)
+    fH, fW = model.frustum.shape[1:3]
+    x = torch.randn(args.batch_size, args.num_cams, model.d_in, fH, fW,
+                    device=device, dtype=dtype, requires_grad=True)
+    return model, x, metas
+
+
+def backward(bev, x):
+    # a fixed random projection, so every BEV cell gets its own gradient
+    weight = torch.randn(bev.shape, generator=torch.Generator().manual_seed(1))
+    (bev * weight.to(bev)).sum().backward()
+    return bev.detach(), x.grad
+
+
+def forward_backward(model, x, metas):
+    return backward(model.get_voxels(x, metas), x)
+
+
+def run(args, pooling):
+    """Forward and backward once, returns (peak memory in MB, seconds)."""
+    model, x, metas = build(args, pooling)
+    device = x.device
+    model.get_voxel_plan(metas)
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+    start = time.perf_counter()
+    forward_backward(model, x, metas)
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+        peak = torch.cuda.max_memory_allocated() / 2**20
+    else:
+        # ru_maxrss is in KB on Linux
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+    return peak, time.perf_counter() - start
+
+
+def _worker(args, pooling, results):
+    results.put(run(args, pooling))
+
+
+def reference(args):
+    """BEV features and input gradients of the cumsum pooling in float64,
+    on the voxels of the float32 geometry."""
+    model, x, metas = build(args, 'cumsum')
+    plan = model.get_voxel_plan(metas)
+    model.double()
+    x = x.detach().double().requires_grad_()
+    return backward(
+        model.voxel_pooling(None, model.get_cam_feats(x), metas, plan=plan), x)
+
+
+def errors(args):
+    """Max absolute error of the BEV features and input gradients of every
+    engine to the float64 reference."""
+    ref_bev, ref_grad = reference(args)
+    return {
+        pooling: tuple(
+            (res.double() - ref).abs().max().item()
+            for res, ref in zip(forward_backward(*build(args, pooling)),
+                                (ref_bev, ref_grad)))
+        for pooling in POOLINGS}
+
+
+def main():
+    args = parse_args()
+    errs = errors(args)
+    results = []
+    for pooling in POOLINGS:
+        if args.device == 'cpu':
+            # fresh process per engine, ru_maxrss never goes down
+            ctx = mp.get_context('spawn')
+            queue = ctx.Queue()
+            proc = ctx.Process(target=_worker, args=(args, pooling, queue))
+            proc.start()
+            result = queue.get()
+            proc.join()
+        else:
+            result = run(args, pooling)
+        results.append((pooling, *result, *errs[pooling]))
+
+    print(f'{"pooling":<12}{"peak (MB)":>12}{"time (s)":>10}'
+          f'{"bev error":>12}{"grad error":>12}')
+    for name, peak, elapsed, bev_err, grad_err in results:
+        print(f'{name:<12}{peak:>12.0f}{elapsed:>10.2f}'
+              f'{bev_err:>12.2e}{grad_err:>12.2e}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Target sequence length of every training sample, for the length bucketed
+batch sampler.
+
+Runs only the centerline loading and `TransformGraph2Seq` steps of the train
+pipeline of a config, without images and augmentation, and stores
+`len(centerline_sequence) + 2` (with the start and end tokens) by sample
+token.
+
+Example:
+    python projects/SeqGrowGraph/tools/compute_seq_lengths.py \
+        projects/SeqGrowGraph/configs/seq_grow_graph/seq_grow_graph_default.py \
+        data/nuscenes/nuscenes_centerline_seq_lengths_train.pkl
+
+and in the config:
+    train_dataloader = dict(
+        batch_sampler=dict(
+            type='LengthBucketBatchSampler',
+            length_file='data/nuscenes/nuscenes_centerline_seq_lengths_train.pkl'))
+"""
+import argparse
+
+import numpy as np
+from mmengine.config import Config
+from mmengine.fileio import dump
+from mmengine.registry import init_default_scope
+from mmengine.utils import track_iter_progress
+from mmdet3d.registry import DATASETS
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Compute the target sequence length of every sample')
+    parser.add_argument('config', help='config file path')
+    parser.add_argument('out', help='output file, .pkl or .json')
+    return parser.parse_args()
+
+
+def sequence_pipeline(pipeline):
+    """The steps of `pipeline` building `centerline_sequence`."""
+    return [
+        step for step in pipeline
+        if (step['type'].startswith('Load') and 'Centerline' in step['type'])
+        or step['type'].startswith('TransformGraph2Seq')]
+
+
+def main():
+    args = parse_args()
+    cfg = Config.fromfile(args.config)
+    init_default_scope(cfg.get('default_scope', 'mmdet3d'))
+    dataset_cfg = cfg.train_dataloader.dataset
+    dataset_cfg.pipeline = sequence_pipeline(dataset_cfg.pipeline)
+    dataset = DATASETS.build(dataset_cfg)
+
+    lengths = {}
+    for i in track_iter_progress(range(len(dataset))):
+        results = dataset[i]
+        lengths[results['token']] = len(results['centerline_sequence']) + 2
+    dump(lengths, args.out)
+
+    values = np.array(list(lengths.values()))
+    print(f'{len(values)} samples, length min {values.min()}, '
+          f'median {int(np.median(values))}, max {values.max()}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Precompute the unaugmented `centerline_sequence` of every sample for
+`TransformGraph2Seq(cache_dir=...)`.
+
+The centerline loading and `TransformGraph2Seq` steps of the test pipeline
+of a config run for every sample of the given splits, in parallel. The
+sequences are stored by sample token in `<cache_dir>/<key>_<split>.pkl`,
+together with a fingerprint of the sample's annotation. `key` hashes the
+centerline type, grid_conf, bz_grid_conf and cam_intrinsic of the loader
+and n_control and orderedDFS of `TransformGraph2Seq`, so a cache is never
+used with another setup, and a sequence is never used for a regenerated
+annotation.
+
+Example:
+    python projects/SeqGrowGraph/tools/create_gt_seq_cache.py \
+        projects/SeqGrowGraph/configs/seq_grow_graph/seq_grow_graph_default.py \
+        data/nuscenes/gt_seq_cache --splits train val --nproc 16
+
+and in the config, for the train and test pipelines:
+    dict(type="LoadNusOrderedBzCenterline", ..., lazy=True),
+    ...
+    dict(type="TransformGraph2Seq", ..., cache_dir="data/nuscenes/gt_seq_cache",
+         cache_split="train"),  # "val" in the test pipeline
+"""
+import argparse
+import os
+
+from mmengine.config import Config
+from mmengine.dataset import Compose
+from mmengine.fileio import dump
+from mmengine.registry import init_default_scope
+from mmengine.utils import track_parallel_progress
+from mmdet3d.registry import DATASETS
+
+from projects.SeqGrowGraph.seq_grow_graph.gt_seq_cache import (
+    annotation_fingerprint, seq_cache_file)
+
+_dataset = None
+_load = None
+_transform = None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Cache the unaugmented target sequences')
+    parser.add_argument('config', help='config file path')
+    parser.add_argument('cache_dir', help='directory of the cache')
+    parser.add_argument(
+        '--splits', nargs='+', choices=['train', 'val'],
+        default=['train', 'val'])
+    parser.add_argument('--nproc', type=int, default=os.cpu_count())
+    return parser.parse_args()
+
+
+def sequence_steps(cfg):
+    """Centerline loading and `TransformGraph2Seq` of the test pipeline."""
+    load, transform = None, None
+    for step in cfg.test_dataloader.dataset.pipeline:
+        if step['type'] == 'LoadNusOrderedBzCenterline':
+            load = dict(step, lazy=True)
+        elif step['type'] == 'TransformGraph2Seq':
+            transform = dict(step, cache_dir=None)
+    assert load is not None and transform is not None, \
+        'the test pipeline has no LoadNusOrderedBzCenterline or ' \
+        'TransformGraph2Seq'
+    return load, transform
+
+
+def _init_worker(config, split):
+    global _dataset, _load, _transform
+    cfg = Config.fromfile(config)
+    init_default_scope(cfg.get('default_scope', 'mmdet3d'))
+    loader_cfg = cfg.train_dataloader if split == 'train' else cfg.test_dataloader
+    dataset_cfg = loader_cfg.dataset.copy()
+    dataset_cfg.pipeline = []
+    _dataset = DATASETS.build(dataset_cfg)
+    load, transform = sequence_steps(cfg)
+    _load, _transform = Compose([load]), Compose([transform])
+
+
+def _sequence(index):
+    results = _load(_dataset.get_data_info(index))
+    centerlines = results['center_lines']
+    key = centerlines.cache_key(_transform.transforms[0].n_control,
+                                _transform.transforms[0].order)
+    fingerprint = annotation_fingerprint(centerlines.annotation)
+    results = _transform(results)
+    return key, results['token'], (fingerprint, results['centerline_sequence'])
+
+
+def main():
+    args = parse_args()
+    os.makedirs(args.cache_dir, exist_ok=True)
+    for split in args.splits:
+        _init_worker(args.config, split)
+        num_samples = len(_dataset)
+        sequences = track_parallel_progress(
+            _sequence, list(range(num_samples)), args.nproc,
+            initializer=_init_worker, initargs=(args.config, split),
+            chunksize=64)
+        keys = {key for key, _, _ in sequences}
+        assert len(keys) == 1, f'samples of {split} have cache keys {keys}'
+        key = keys.pop()
+        cache_file = seq_cache_file(args.cache_dir, key, split)
+        dump({token: sequence for _, token, sequence in sequences}, cache_file)
+        print(f'{split}: {num_samples} sequences written to {cache_file}')
+
+
+if __name__ == '__main__':
+    main()
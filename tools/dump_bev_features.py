@@ -0,0 +1,107 @@
+"""Precompute the BEV features of a frozen image branch into a
+`BEVFeatureStore`, for decoder-only training with `LoadBEVFeatures`.
+
+Every sample is stored once without augmentation (the test pipeline) and
+`--num-seeds` times with the augmentation of the train pipeline, seeded by
+sample token and seed. The target sequence of every augmentation is stored
+with its features. Work can be split over processes with `--shard-id` and
+`--num-shards`, all writing into the same store.
+
+Example:
+    python projects/SeqGrowGraph/tools/dump_bev_features.py \
+        projects/SeqGrowGraph/configs/seq_grow_graph/seq_grow_graph_default.py \
+        work_dirs/seq_grow_graph/epoch_150.pth data/nuscenes/bev_store_train \
+        --split train --num-seeds 4
+"""
+import argparse
+import random
+import zlib
+
+import numpy as np
+import torch
+from mmengine.config import Config
+from mmengine.dataset import pseudo_collate
+from mmengine.registry import init_default_scope
+from mmengine.runner import load_checkpoint
+from mmengine.utils import track_iter_progress
+from mmdet3d.registry import DATASETS, MODELS
+
+from projects.SeqGrowGraph.seq_grow_graph.bev_feature_store import (
+    NO_AUG, BEVFeatureStoreWriter, store_key)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Dump BEV features into a feature store')
+    parser.add_argument('config', help='config file path')
+    parser.add_argument('checkpoint', help='checkpoint file')
+    parser.add_argument('out', help='directory of the store')
+    parser.add_argument('--split', choices=['train', 'val'], default='train')
+    parser.add_argument(
+        '--num-seeds', type=int, default=0,
+        help='augmented copies per sample besides the unaugmented one')
+    parser.add_argument('--shard-size', type=int, default=1024)
+    parser.add_argument('--shard-id', type=int, default=0)
+    parser.add_argument('--num-shards', type=int, default=1)
+    parser.add_argument(
+        '--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+    return parser.parse_args()
+
+
+def build_dataset(cfg, split, pipeline):
+    loader_cfg = cfg.train_dataloader if split == 'train' else cfg.test_dataloader
+    dataset_cfg = loader_cfg.dataset.copy()
+    dataset_cfg.pipeline = pipeline
+    return DATASETS.build(dataset_cfg)
+
+
+@torch.no_grad()
+def extract(model, dataset, index):
+    data = model.data_preprocessor(
+        pseudo_collate([dataset.prepare_data(index)]), False)
+    img_metas = [ds.metainfo for ds in data['data_samples']]
+    bev_feats = model.extract_feat(img=data['inputs']['img'], img_metas=img_metas)
+    meta = dict(
+        centerline_sequence=img_metas[0]['centerline_sequence'],
+        n_control=img_metas[0]['n_control'])
+    return bev_feats[0].cpu().numpy(), meta
+
+
+def main():
+    args = parse_args()
+    cfg = Config.fromfile(args.config)
+    init_default_scope(cfg.get('default_scope', 'mmdet3d'))
+    model = MODELS.build(cfg.model)
+    load_checkpoint(model, args.checkpoint, map_location='cpu')
+    model.to(args.device).eval()
+
+    variants = [(NO_AUG, build_dataset(
+        cfg, args.split, cfg.test_dataloader.dataset.pipeline))]
+    if args.num_seeds:
+        train_dataset = build_dataset(
+            cfg, args.split, cfg.train_dataloader.dataset.pipeline)
+        variants += [(seed, train_dataset) for seed in range(args.num_seeds)]
+
+    writer = None
+    num_samples = len(variants[0][1])
+    for index in track_iter_progress(
+            range(args.shard_id, num_samples, args.num_shards)):
+        token = variants[0][1].get_data_info(index)['token']
+        for variant, dataset in variants:
+            key = store_key(token, variant)
+            # the augmentation of a key is reproducible
+            seed = zlib.crc32(key.encode())
+            random.seed(seed)
+            np.random.seed(seed)
+            bev_feats, meta = extract(model, dataset, index)
+            if writer is None:
+                writer = BEVFeatureStoreWriter(
+                    args.out, bev_feats.shape, args.shard_size,
+                    prefix=str(args.shard_id))
+            writer.add(key, bev_feats, meta)
+    if writer is not None:
+        writer.close()
+
+
+if __name__ == '__main__':
+    main()
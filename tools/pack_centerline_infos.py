@@ -0,0 +1,64 @@
+"""Convert the `center_lines` of info pkls to the packed form of
+`pack_centerlines`.
+
+The points of all centerlines of a sample become one float32 array with
+offsets and the ids become byte string arrays, which shrinks the pkl and
+the memory every dataloader worker holds. Infos are written to a new file,
+`<name>_packed.pkl` next to the input by default. Infos already packed are
+left as they are, unpacked infos keep working as before.
+
+Example:
+    python projects/SeqGrowGraph/tools/pack_centerline_infos.py \
+        data/nuscenes/nuscenes_centerline_infos_train.pkl \
+        data/nuscenes/nuscenes_centerline_infos_val.pkl
+"""
+import argparse
+import os
+import os.path as osp
+
+import numpy as np
+from mmengine.fileio import dump, load
+from mmengine.utils import track_iter_progress
+
+from projects.SeqGrowGraph.seq_grow_graph.core.centerline.ragged import (
+    num_centerline_points, pack_centerlines)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Pack the centerlines of info pkls')
+    parser.add_argument('infos', nargs='+', help='info pkl files')
+    parser.add_argument(
+        '--out-dir', help='output directory, next to the input by default')
+    parser.add_argument(
+        '--suffix', default='_packed', help='suffix of the output file name')
+    parser.add_argument(
+        '--dtype', choices=['float32', 'float64'], default='float32',
+        help='dtype of the packed points')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    dtype = np.dtype(args.dtype)
+    for info_file in args.infos:
+        annotations = load(info_file)
+        num_points = 0
+        for info in track_iter_progress(annotations['infos']):
+            if 'center_lines' in info:
+                info['center_lines'] = pack_centerlines(
+                    info['center_lines'], dtype)
+                num_points += num_centerline_points(info['center_lines'])
+        name, ext = osp.splitext(osp.basename(info_file))
+        out_dir = args.out_dir or osp.dirname(info_file)
+        os.makedirs(out_dir, exist_ok=True)
+        out_file = osp.join(out_dir, name + args.suffix + ext)
+        dump(annotations, out_file)
+        print(f'{info_file}: {len(annotations["infos"])} samples, '
+              f'{num_points} points, '
+              f'{osp.getsize(info_file) / 2**20:.1f} MB -> '
+              f'{osp.getsize(out_file) / 2**20:.1f} MB, written to {out_file}')
+
+
+if __name__ == '__main__':
+    main()
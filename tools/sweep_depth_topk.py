@@ -0,0 +1,76 @@
+"""Reach metrics of a trained model for every sparse depth setting of
+`LiftSplatShootEgo`.
+
+The test set of a config is run once per `--topk` value with
+`model.lss_cfg.depth_topk` set to it (0 splats every depth bin), with the
+weights of `checkpoint`, and the landmark / reach precision, recall and
+F-score and the test time of every run are tabulated. The results of each
+run go to `<work-dir>/topk_<k>`.
+
+Example:
+    python projects/SeqGrowGraph/tools/sweep_depth_topk.py \
+        projects/SeqGrowGraph/configs/seq_grow_graph/seq_grow_graph_depth_topk.py \
+        $CKPT --topk 0 1 2 4 8 16
+"""
+import argparse
+import os.path as osp
+import time
+
+from mmengine.config import Config, DictAction
+from mmengine.runner import Runner
+
+METRICS = ('mLP', 'mLR', 'mLF', 'mRP', 'mRR', 'mRF')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Reach metrics of sparse depth lift-splat')
+    parser.add_argument('config', help='config file path')
+    parser.add_argument('checkpoint', help='model checkpoint')
+    parser.add_argument('--topk', type=int, nargs='+', default=[0, 1, 2, 4, 8, 16],
+                        help='depth bins per pixel, 0 for all of them')
+    parser.add_argument('--work-dir', help='directory of the test results')
+    parser.add_argument(
+        '--cfg-options', nargs='+', action=DictAction,
+        help='override some settings in the used config')
+    return parser.parse_args()
+
+
+def test(args, topk):
+    """Test metrics and seconds of one run with `depth_topk=topk`."""
+    cfg = Config.fromfile(args.config)
+    if args.cfg_options is not None:
+        cfg.merge_from_dict(args.cfg_options)
+    cfg.merge_from_dict({'model.lss_cfg.depth_topk': topk or None})
+    work_dir = args.work_dir or osp.join(
+        './work_dirs', osp.splitext(osp.basename(args.config))[0])
+    cfg.work_dir = osp.join(work_dir, f'topk_{topk}')
+    cfg.test_evaluator.jsonfile_prefix = cfg.work_dir
+    cfg.load_from = args.checkpoint
+    # runners of the same process need distinct names
+    cfg.experiment_name = f'sweep_depth_topk_{topk}'
+    runner = Runner.from_cfg(cfg)
+    start = time.perf_counter()
+    metrics = runner.test()
+    return metrics, time.perf_counter() - start
+
+
+def main():
+    args = parse_args()
+    rows = []
+    for topk in args.topk:
+        metrics, elapsed = test(args, topk)
+        rows.append((topk, metrics, elapsed))
+
+    print(f'{"depth bins":<12}' + ''.join(f'{m:>8}' for m in METRICS)
+          + f'{"test s":>10}')
+    for topk, metrics, elapsed in rows:
+        values = [next((v for k, v in metrics.items()
+                        if k.endswith(f'/{m}')), float('nan'))
+                  for m in METRICS]
+        print(f'{topk or "all":<12}' + ''.join(f'{v:>8.4f}' for v in values)
+              + f'{elapsed:>10.0f}')
+
+
+if __name__ == '__main__':
+    main()